@@ -2,11 +2,99 @@ import os
 
 class Settings:
     PROJECT_NAME: str = "Gas and Smoke detector Dashboard"
+
+    # Process Role (see app/services/ingestion.py)
+    #   standalone - one process reads the serial port and serves the API (default)
+    #   ingest     - owns serial/inference/archiving, publishes snapshots to API workers
+    #   api        - serves HTTP/WebSocket only, mirrors state from the ingest process
+    ROLE: str = os.getenv("IOT_ROLE", "standalone")
+    INGEST_HOST: str = os.getenv("IOT_INGEST_HOST", "127.0.0.1")
+    INGEST_PORT: int = int(os.getenv("IOT_INGEST_PORT", "8765"))
+    INGEST_STATE_INTERVAL_S: float = 1.0  # Service stats mirrored to API workers this often
+
+    # Shared-memory ring of full-rate samples (empty name = disabled)
+    SHARED_RING_NAME: str = os.getenv("IOT_SHARED_RING", "")
+    SHARED_RING_CAPACITY: int = 36000  # ~1 hour at 10 Hz, 64 bytes per sample
+    RECENT_RING_CAPACITY: int = 6000   # In-process ring behind /api/sensor/recent (~10 min at 10 Hz)
+    RECENT_MAX_POINTS: int = 2000      # Default decimation target for /api/sensor/recent
     API_V1_STR: str = "/api/v1"
-    SQLALCHEMY_DATABASE_URI: str = "sqlite:///./iot_v2.db"
+    SQLALCHEMY_DATABASE_URI: str = os.getenv("IOT_DATABASE_URL", "sqlite:///./iot_v2.db")
+    DB_BUSY_TIMEOUT_S: float = 15.0   # SQLite waits this long for a lock before failing
+    DB_EXECUTOR_WORKERS: int = 1      # Threads (and pooled connections) for database work from async code
     
     # Serial Configuration
     SERIAL_PORT: str = "COM4"  # Update this to your Bluetooth COM Port
     SERIAL_BAUDRATE: int = 9600 
+    DEVICE_ID: str = SERIAL_PORT  # Label stored with alerts from this source
+    COMMAND_ACK_TIMEOUT_S: float = 1.0  # Resend an AI_* command not acknowledged within this
+    COMMAND_MAX_RETRIES: int = 2        # Resends before a command is reported unacknowledged
+
+    # Overload Handling (backlog = sensor lines waiting when the reader catches up, see /api/debug/overload)
+    OVERLOAD_POLICY: str = os.getenv("IOT_OVERLOAD_POLICY", "drop")  # drop | decimate | degrade
+    OVERLOAD_BACKLOG_LINES: int = 3    # Backlog at/above this = overloaded; below it every sample is processed
+    OVERLOAD_DECIMATE_EVERY: int = 4   # decimate: fully process every Nth backlog line
+
+    # Replay Source (plays a datasets/ CSV instead of reading the serial port; demos and load tests)
+    REPLAY_CSV: str = os.getenv("IOT_REPLAY_CSV", "")
+    REPLAY_SPEED: float = float(os.getenv("IOT_REPLAY_SPEED", "1.0"))
+
+    # Latency Tracing (per-sample stage timestamps, see /api/debug/latency)
+    TRACE_WINDOW: int = 2048       # Samples kept per stage for percentiles
+    TRACE_SLOW_MS: float = 100.0   # Read -> last hot-path stage above this is "slow"
+    TRACE_SLOW_BUFFER: int = 50    # Recent slow samples kept
+
+    # Logging (records go through a queue to a background thread)
+    LOG_QUEUE_SIZE: int = 10000    # Records beyond this are dropped, never block the loop
+    LOG_RATE_LIMITS: dict = {
+        "rx_line": {"per_second": 1.0},      # Raw serial lines (also kept in RAW_LINE_BUFFER)
+        "prediction": {"sample_every": 50},  # ML predictions
+        "warmup": {"sample_every": 10},      # Warm-up progress
+    }
+    RAW_LINE_BUFFER: int = 500     # Recent raw lines queryable via /api/debug/raw-lines
+
+    # Alert Engine (evaluated per sample, transitions persisted by the archiver)
+    ALERT_DEBOUNCE_SAMPLES: int = 3   # Consecutive samples needed to open/escalate
+    ALERT_CLEAR_SAMPLES: int = 30     # Consecutive samples needed to step down/resolve
+    ALERT_HYSTERESIS_V: float = 0.1   # Voltage margin below a threshold before it counts as cleared
+
+    # Server-Sent Events (/api/sensor/stream)
+    SSE_REPLAY_BUFFER: int = 256   # Encoded frames kept for Last-Event-ID resume
+    SSE_KEEPALIVE_S: float = 15.0  # Comment line sent when no sample arrives (keeps proxies open)
+
+    # Retention (see app/services/retention.py; 0 = keep forever)
+    RETENTION_DAYS: dict = {
+        "sensor_data": 90,   # Archived samples
+        "alerts": 365,       # Resolved alerts only
+        "ml_predictions": 30,  # One row per inference (~10 Hz)
+    }
+    RETENTION_INTERVAL_S: float = 6 * 3600  # Time between purge passes
+    RETENTION_CHUNK_ROWS: int = 500         # Rows per delete transaction (keeps write locks short)
+    RETENTION_CHUNK_PAUSE_S: float = 0.05   # Pause between chunks so other writers get in
+    RETENTION_ARCHIVE_DIR: str = "archive"  # Expired rows exported here as .csv.gz first ("" = no export)
+    RETENTION_VACUUM_PAGES: int = 256       # Pages released per incremental_vacuum step
+
+    # Background Retraining (candidates only, see app/services/retrainer.py)
+    RETRAIN_ENABLED: bool = os.getenv("IOT_RETRAIN", "0") == "1"
+    RETRAIN_INTERVAL_S: float = 24 * 3600  # One candidate per day
+    RETRAIN_N_JOBS: int = 1                # Cores the training worker may use
+    RETRAIN_NICE: int = 10                 # Worker CPU priority offset (POSIX only)
+    RETRAIN_HOLDOUT_FRACTION: float = 0.2  # Newest share of each label's rows held out (only rows production never saw)
+
+    # Prediction Log (every inference, see /api/ml/predictions)
+    PREDICTION_FLUSH_S: float = 2.0  # Buffered rows are bulk-inserted this often
+    PREDICTION_BUFFER: int = 5000    # Rows kept in memory if the database falls behind
+
+    # Shadow Models (scored next to the primary, never drive commands; see /api/ml/shadow)
+    # Comma-separated model dirs or .pkl files, e.g. ml_models/candidates/20260201-030000
+    SHADOW_MODELS: list = [p for p in os.getenv("IOT_SHADOW_MODELS", "").split(",") if p.strip()]
+    SHADOW_QUEUE_SIZE: int = 256  # Samples waiting for the shadow worker before new ones are dropped
+
+    # Bulk Export (/api/sensor/export and python -m app.export)
+    EXPORT_BATCH_ROWS: int = 5000  # Rows fetched and encoded per chunk
+
+    # Event Loop Monitor (detects synchronous work blocking the loop)
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_S: float = 0.05  # Heartbeat period
+    LOOP_BLOCK_THRESHOLD_MS: float = 100.0  # Heartbeat late by more than this = blocked
 
 settings = Settings()
@@ -1,15 +1,99 @@
-from sqlalchemy import create_engine
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-engine = create_engine(
-    settings.SQLALCHEMY_DATABASE_URI, connect_args={"check_same_thread": False}
-)
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets API reads proceed while the archiver writes; NORMAL sync is durable in WAL mode
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new (empty) file; older files need a one-time VACUUM (see app/services/retention.py)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def _create_engine(**kwargs):
+    new_engine = create_engine(
+        settings.SQLALCHEMY_DATABASE_URI,
+        connect_args={"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT_S},
+        **kwargs
+    )
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", _sqlite_pragmas)
+    return new_engine
+
+# Request handlers (FastAPI runs sync routes in its threadpool)
+engine = _create_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Background writers from async code: a dedicated executor with its own connection pool,
+# so commits/fsyncs never run on the event loop and never compete with request sessions.
+# A single worker also keeps SQLite writes from background tasks serialized.
+db_executor = ThreadPoolExecutor(max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="db-worker")
+worker_engine = _create_engine(pool_size=settings.DB_EXECUTOR_WORKERS, max_overflow=0)
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
 Base = declarative_base()
 
+def _already_done(error):
+    """True if a DDL statement failed only because another process got there first"""
+    message = str(error.orig).lower()
+    return "already exists" in message or "duplicate column" in message
+
+def ensure_schema(metadata):
+    """
+    create_all() only creates missing tables. This adds columns and indexes
+    introduced after an existing database file was created.
+    Every process runs it at startup (uvicorn workers, ingest), possibly at the same
+    moment: a table, column or index another process just created is not an error.
+    """
+    # Each lost race means one more object exists, so this ends
+    for attempt in range(len(metadata.sorted_tables) * 4 + 1):
+        try:
+            metadata.create_all(bind=engine)
+            break
+        except OperationalError as e:
+            if not _already_done(e):
+                raise
+    for table in metadata.sorted_tables:
+        existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(engine.dialect)
+            try:
+                # One transaction per column, so a lost race only skips that column
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            except OperationalError as e:
+                added = {c["name"] for c in inspect(engine).get_columns(table.name)}
+                if not _already_done(e) or column.name not in added:
+                    raise
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except OperationalError as e:
+                if not _already_done(e):
+                    raise
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run fn(db, *args, **kwargs) on the DB executor with a fresh session and await the result.
+    All database access from coroutines must go through here.
+    """
+    def job():
+        db = WorkerSessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, job)
+
 def get_db():
     db = SessionLocal()
     try:
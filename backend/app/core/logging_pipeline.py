@@ -0,0 +1,133 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .config import settings
+
+LOG_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per-message-type sampling / rate limiting.
+    Records tagged with extra={"msg_type": "..."} are limited according to `limits`, e.g.
+        {"rx_line": {"per_second": 1.0}, "prediction": {"sample_every": 50}}
+    Untagged records and warnings/errors always pass.
+    """
+    def __init__(self, limits=None):
+        super().__init__()
+        self.limits = limits or {}
+        self.seen = {}
+        self.suppressed = {}
+        self.last_emit = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        msg_type = getattr(record, "msg_type", None)
+        if msg_type is None or record.levelno >= logging.WARNING:
+            return True
+        rule = self.limits.get(msg_type)
+        if not rule:
+            return True
+
+        with self._lock:
+            count = self.seen.get(msg_type, 0)
+            self.seen[msg_type] = count + 1
+
+            allowed = True
+            if "sample_every" in rule:
+                allowed = count % max(1, int(rule["sample_every"])) == 0
+            if allowed and "per_second" in rule:
+                now = time.monotonic()
+                interval = 1.0 / rule["per_second"] if rule["per_second"] > 0 else float("inf")
+                if now - self.last_emit.get(msg_type, float("-inf")) >= interval:
+                    self.last_emit[msg_type] = now
+                else:
+                    allowed = False
+
+            if not allowed:
+                self.suppressed[msg_type] = self.suppressed.get(msg_type, 0) + 1
+        return allowed
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                msg_type: {"seen": self.seen.get(msg_type, 0), "suppressed": self.suppressed.get(msg_type, 0)}
+                for msg_type in self.seen
+            }
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RawLineBuffer:
+    """Ring buffer of the most recent raw lines received from the device"""
+    def __init__(self, capacity=500):
+        self.lines = deque(maxlen=capacity)
+        self.total = 0
+
+    def append(self, line):
+        # deque.append is atomic, so the reader thread never needs a lock
+        self.lines.append((datetime.now().isoformat(timespec="milliseconds"), line))
+        self.total += 1
+
+    def get_recent(self, limit=100, contains=None):
+        lines = list(self.lines)
+        if contains:
+            lines = [entry for entry in lines if contains in entry[1]]
+        return [{"timestamp": ts, "line": line} for ts, line in lines[-limit:]]
+
+
+rate_limit_filter = RateLimitFilter(settings.LOG_RATE_LIMITS)
+raw_lines = RawLineBuffer(settings.RAW_LINE_BUFFER)
+queue_handler = None
+_listener = None
+
+
+def setup_logging(level=logging.INFO):
+    """
+    Route the root logger through a queue drained by a background thread.
+    The event loop only pays for building the LogRecord; formatting and I/O happen off-thread.
+    """
+    global queue_handler, _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(rate_limit_filter)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logging_stats():
+    return {
+        "queue_size": queue_handler.queue.qsize() if queue_handler else 0,
+        "queue_dropped": queue_handler.dropped if queue_handler else 0,
+        "message_types": rate_limit_filter.get_stats(),
+        "raw_lines_total": raw_lines.total,
+    }
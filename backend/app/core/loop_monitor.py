@@ -0,0 +1,87 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from .config import settings
+
+
+class LoopMonitor:
+    """
+    Detects synchronous work blocking the event loop.
+    A heartbeat coroutine stamps the time every `interval_s`; a watchdog thread notices when
+    the stamp goes stale and captures the loop thread's stack at that moment, which points
+    at the blocking call. Stalls are kept in a ring buffer (see /api/debug/loop).
+    """
+    def __init__(self, interval_s=0.05, threshold_ms=100.0, capacity=50):
+        self.interval_s = interval_s
+        self.threshold_ms = threshold_ms
+        self.stalls = deque(maxlen=capacity)
+        self.total_stalls = 0
+        self.max_lag_ms = 0.0
+        self.beats = 0
+        self._last_beat = None
+        self._loop_thread_id = None
+        self._pending_stack = None
+        self._running = False
+
+    async def run(self):
+        """Heartbeat task; start with asyncio.create_task(loop_monitor.run())"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._running = True
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        try:
+            while self._running:
+                before = time.monotonic()
+                await asyncio.sleep(self.interval_s)
+                now = time.monotonic()
+                self._last_beat = now
+                self.beats += 1
+
+                lag_ms = (now - before - self.interval_s) * 1000
+                if lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = lag_ms
+                if lag_ms >= self.threshold_ms:
+                    self.total_stalls += 1
+                    self.stalls.append({
+                        "at": datetime.now().isoformat(timespec="milliseconds"),
+                        "lag_ms": round(lag_ms, 1),
+                        "stack": self._pending_stack or [],
+                    })
+                self._pending_stack = None
+        finally:
+            self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def _watch(self):
+        while self._running:
+            time.sleep(self.interval_s)
+            stale_ms = (time.monotonic() - self._last_beat) * 1000
+            if stale_ms >= self.threshold_ms and self._pending_stack is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    # The innermost frames are the code currently holding the loop
+                    self._pending_stack = [line.strip() for line in traceback.format_stack(frame)[-6:]]
+
+    def get_stats(self):
+        return {
+            "running": self._running,
+            "interval_s": self.interval_s,
+            "threshold_ms": self.threshold_ms,
+            "beats": self.beats,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "total_stalls": self.total_stalls,
+            "recent_stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval_s=settings.LOOP_MONITOR_INTERVAL_S,
+    threshold_ms=settings.LOOP_BLOCK_THRESHOLD_MS,
+)
@@ -1,6 +1,8 @@
+from sqlalchemy import func, update, delete, insert
 from sqlalchemy.orm import Session
 from app import models, schemas
 from datetime import datetime
+from typing import List, Optional
 
 def create_sensor_data(db: Session, data: schemas.SensorDataCreate):
     db_data = models.SensorData(**data.dict(), timestamp=datetime.now())
@@ -19,8 +21,90 @@ def create_alert(db: Session, alert: schemas.AlertCreate):
     db.refresh(db_alert)
     return db_alert
 
-def get_alerts(db: Session, skip: int = 0, limit: int = 50):
-    return db.query(models.Alert).order_by(models.Alert.timestamp.desc()).offset(skip).limit(limit).all()
+def _alert_filters(severity=None, since=None, until=None, resolved=None, device_id=None, ids=None):
+    """WHERE clauses shared by alert queries, aggregates and bulk updates"""
+    clauses = []
+    if ids is not None:
+        clauses.append(models.Alert.id.in_(ids))
+    if severity:
+        clauses.append(models.Alert.severity.in_(severity))
+    if since is not None:
+        clauses.append(models.Alert.timestamp >= since)
+    if until is not None:
+        clauses.append(models.Alert.timestamp < until)
+    if resolved is not None:
+        clauses.append(models.Alert.is_resolved == resolved)
+    if device_id:
+        clauses.append(models.Alert.device_id == device_id)
+    return clauses
+
+def get_alerts(db: Session, skip: int = 0, limit: int = 50, severity: Optional[List[str]] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None,
+               resolved: Optional[bool] = None, device_id: Optional[str] = None):
+    return (db.query(models.Alert)
+            .filter(*_alert_filters(severity, since, until, resolved, device_id))
+            .order_by(models.Alert.timestamp.desc())
+            .offset(skip).limit(limit).all())
+
+def get_alert_summary(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      device_id: Optional[str] = None):
+    """Counts per severity and resolution state, aggregated in SQL"""
+    rows = (db.query(models.Alert.severity, models.Alert.is_resolved,
+                     func.count(models.Alert.id), func.max(models.Alert.timestamp))
+            .filter(*_alert_filters(since=since, until=until, device_id=device_id))
+            .group_by(models.Alert.severity, models.Alert.is_resolved)
+            .all())
+
+    summary = {"total": 0, "unresolved": 0, "latest": None, "by_severity": {}}
+    for severity, is_resolved, count, latest in rows:
+        entry = summary["by_severity"].setdefault(severity, {"total": 0, "unresolved": 0, "latest": None})
+        entry["total"] += count
+        summary["total"] += count
+        if not is_resolved:
+            entry["unresolved"] += count
+            summary["unresolved"] += count
+        if latest and (entry["latest"] is None or latest > entry["latest"]):
+            entry["latest"] = latest
+        if latest and (summary["latest"] is None or latest > summary["latest"]):
+            summary["latest"] = latest
+    return summary
+
+def resolve_alerts(db: Session, ids: Optional[List[int]] = None, severity: Optional[List[str]] = None,
+                   until: Optional[datetime] = None, device_id: Optional[str] = None):
+    """Mark matching unresolved alerts as resolved with a single UPDATE (at least one filter required)"""
+    if ids is None and not severity and until is None and not device_id:
+        raise ValueError("resolve_alerts needs ids or a filter (severity, until, device_id)")
+    stmt = (update(models.Alert)
+            .where(*_alert_filters(severity, None, until, False, device_id, ids))
+            .values(is_resolved=True))
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+def delete_alerts(db: Session, resolved_only: bool = False, until: Optional[datetime] = None):
+    """Delete alerts with a single DELETE statement (no ORM object loading)"""
+    stmt = delete(models.Alert).where(*_alert_filters(until=until, resolved=True if resolved_only else None))
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+def create_ml_predictions(db: Session, rows: List[dict]):
+    """Bulk insert of buffered predictions: one executemany, one commit"""
+    if rows:
+        db.execute(insert(models.MLPrediction), rows)
+        db.commit()
+    return len(rows)
+
+def get_ml_predictions(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                       model_version: Optional[str] = None, skip: int = 0, limit: int = 1000):
+    query = db.query(models.MLPrediction)
+    if since is not None:
+        query = query.filter(models.MLPrediction.timestamp >= since)
+    if until is not None:
+        query = query.filter(models.MLPrediction.timestamp < until)
+    if model_version:
+        query = query.filter(models.MLPrediction.model_version == model_version)
+    return query.order_by(models.MLPrediction.timestamp.desc()).offset(skip).limit(limit).all()
 
 def get_settings(db: Session):
     return db.query(models.AppSetting).all()
@@ -0,0 +1,44 @@
+"""
+Export archived samples to a file (or stdout), streamed in batches.
+
+    python -m app.export -o ../datasets/archive_export.csv               # timestamp,mq2,mq135
+    python -m app.export --format ndjson --since 2026-01-29 -o dump.ndjson
+    python -m app.export --format binary -o dump.bin
+
+Run from the backend/ directory (same as the server).
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from app import models
+from app.core import database
+from app.core.config import settings
+from app.services import export
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream sensor_data rows to CSV, NDJSON or columnar binary")
+    parser.add_argument("--format", choices=list(export.FORMATS), default="csv")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="ISO date/time (inclusive)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="ISO date/time (exclusive)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    database.ensure_schema(models.Base.metadata)
+    binary = args.format == "binary"
+    if args.output:
+        out = open(args.output, "wb" if binary else "w", newline="")
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+
+    try:
+        for chunk in export.stream_export(args.format, args.since, args.until, settings.EXPORT_BATCH_ROWS):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Headless ingestion process for multi-worker deployments.
+
+    # Terminal 1 - the only process that opens the serial port
+    python -m app.ingest
+
+    # Terminal 2 - API workers scale across cores and attach read-only
+    IOT_ROLE=api uvicorn app.main:app --workers 4
+
+Run both from the backend/ directory so they share iot_v2.db.
+"""
+import asyncio
+import logging
+
+from app import models
+from app.core import database
+from app.core.logging_pipeline import setup_logging
+from app.services.ingestion import start_background_tasks
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    tasks = start_background_tasks(role="ingest")
+    # Any task ending means something went badly wrong; surface it instead of idling
+    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in done:
+        task.result()
+
+
+if __name__ == "__main__":
+    setup_logging(level=logging.INFO)
+    database.ensure_schema(models.Base.metadata)
+    logger.info("Starting ingestion process")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Ingestion process stopped")
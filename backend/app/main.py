@@ -1,13 +1,17 @@
 import asyncio
 import logging
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-# Configure Logging
-logging.basicConfig(level=logging.INFO)
+from app.core.logging_pipeline import setup_logging, raw_lines, get_logging_stats
+from app.core.loop_monitor import loop_monitor
+
+# Configure Logging (queued, rate-limited per message type)
+setup_logging(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Request, Query, Header, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,9 +21,19 @@ from app import models, schemas, crud
 from app.core import database, config
 from app.services.serial_reader import sensor_manager
 from app.services.ml_service import ml_service
-
-# Create Tables
-models.Base.metadata.create_all(bind=database.engine)
+from app.services.ws_protocol import session_from_query, hello_message
+from app.services.alert_engine import alert_engine
+from app.services.snapshot_stream import snapshot_stream, parse_last_event_id
+from app.services.ingestion import start_background_tasks
+from app.services import sample_ring
+from app.services.retention import retention_manager
+from app.services import export
+from app.services.retrainer import retrainer
+from app.services.shadow_scorer import shadow_scorer
+from app.services.ingest_link import ingest_subscriber
+
+# Create Tables (and add columns/indexes missing from older database files)
+database.ensure_schema(models.Base.metadata)
 
 app = FastAPI(title=config.settings.PROJECT_NAME)
 
@@ -46,6 +60,18 @@ def get_db():
     finally:
         db.close()
 
+def ingest_state(name, local):
+    """
+    Stats of a service that only runs in the ingest process. API workers (IOT_ROLE=api)
+    serve the copy mirrored over the ingest link instead of their own idle singleton.
+    """
+    if config.settings.ROLE != "api":
+        return local()
+    state = ingest_subscriber.state.get(name)
+    if state is None:
+        raise HTTPException(status_code=503, detail="Ingest process not attached; its state is not available yet")
+    return state
+
 # Websocket Manager
 class ConnectionManager:
     def __init__(self):
@@ -70,57 +96,13 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
-# Background Task for buffering data to DB
-async def data_archiver():
-    while True:
-        await asyncio.sleep(10) 
-        db = database.SessionLocal()
-        try:
-            data = sensor_manager.latest_data
-            # CRITICAL FIX: Only archive and alert if the sensor is actually connected
-            # This prevents specific "last known state" from generating infinite alerts when unplugged
-            if not data.get("sensor_connected", False):
-                 continue
-
-            if data and data.get("mq2_gas") is not None:
-                s_data = schemas.SensorDataCreate(**data)
-                crud.create_sensor_data(db, s_data)
-                
-                # Check for Alerts (Warning or Danger)
-                status = data.get("status")
-                if status in ["Warning", "Danger"]:
-                    severity = "high" if status == "Danger" else "medium"
-                    
-                    # Create descriptive message with Sensor Values
-                    ai_cmd = data.get("ai_command", "Unknown")
-                    score = int(data.get("risk_score", 0))
-                    
-                    # Get values (Prefer Voltage as it's the raw truth, or PPM if available)
-                    mq2_val = data.get("mq2_voltage", 0.0)
-                    mq135_val = data.get("mq135_voltage", 0.0)
-                    
-                    # PPM Values
-                    mq2_ppm = data.get("mq2_gas", 0.0)
-                    mq135_ppm = data.get("mq135_air", 0.0)
-                    
-                    # Format: "Danger Detected! Score: 100% (MQ2: 2.5V | 120ppm, MQ135: 1.2V | 80ppm) [AI_CRITICAL]"
-                    msg = f"{status} Detected! Score: {score}% (MQ2: {mq2_val:.2f}V|{mq2_ppm:.0f}ppm, MQ135: {mq135_val:.2f}V|{mq135_ppm:.0f}ppm) [{ai_cmd}]"
-                    
-                    alert = schemas.AlertCreate(
-                        severity=severity, 
-                        message=msg
-                    )
-                    crud.create_alert(db, alert)
-        except Exception as e:
-            logging.error(f"Error archiving data: {e}")
-        finally:
-            db.close()
-
 # Startup Events
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(sensor_manager.start_reading())
-    asyncio.create_task(data_archiver())
+    if config.settings.LOOP_MONITOR_ENABLED:
+        asyncio.create_task(loop_monitor.run())
+    # Serial reading/archiving, or mirroring from the ingest process (IOT_ROLE=api)
+    app.state.background_tasks = start_background_tasks()
 
 # --- UI Routes (Serving HTML) ---
 
@@ -147,65 +129,264 @@ async def read_settings(request: Request):
 # --- API Routes ---
 
 @app.get("/api/sensor/current", response_model=schemas.SensorDataBase)
-def get_current_sensor_data():
-    data = sensor_manager.latest_data.copy()
-    
-    # Add ML prediction
-    mq2_voltage = data.get("mq2_voltage", 0.0)
-    mq135_voltage = data.get("mq135_voltage", 0.0)
-    
-    prediction, confidence, ai_command = ml_service.predict_with_ml(mq2_voltage, mq135_voltage)
-    data["ml_prediction"] = prediction
-    data["ml_confidence"] = confidence
-    data["ai_command"] = ai_command
-    
-    return data
+async def get_current_sensor_data(if_none_match: Optional[str] = Header(None)):
+    """
+    Latest sample, served from a snapshot serialized once per ingested sample.
+    The ETag follows the sample sequence number, so unchanged polls get 304 with no body.
+    """
+    snapshot = snapshot_stream.current
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if if_none_match and snapshot.etag in [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/api/sensor/recent")
+def get_recent_sensor_data(
+    seconds: float = Query(300.0, gt=0),
+    channels: Optional[str] = None,
+    max_points: int = Query(config.settings.RECENT_MAX_POINTS, ge=0),
+    format: str = "json",
+):
+    """
+    Full-rate samples from the last `seconds`, straight from the in-memory ring (no database).
+    Example: /api/sensor/recent?seconds=120&channels=mq2_voltage,mq135_voltage&max_points=500
+    `channels` is a comma-separated subset of sample_ring.CHANNELS (default: all);
+    max_points=0 disables decimation. format=binary returns packed columns (see X-Layout).
+    """
+    if format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    names = [c.strip() for c in channels.split(",") if c.strip()] if channels else list(sample_ring.CHANNELS)
+    unknown = [c for c in names if c not in sample_ring.CHANNELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown channels: {', '.join(unknown)}")
+
+    # API workers read the ingest process's full-rate ring when it is mapped
+    ring = sensor_manager.shared_ring or sensor_manager.recent
+    records, factor = sample_ring.decimate(ring.read_window(seconds), max_points)
+
+    if format == "binary":
+        body, t0 = sample_ring.to_binary(records, names)
+        layout = ["t:f8"] + [f"{c}:{'u1' if c in sample_ring.CODE_CHANNELS else 'f4'}" for c in names]
+        return Response(content=body, media_type="application/octet-stream", headers={
+            "X-Count": str(len(records)),
+            "X-T0": repr(t0),
+            "X-Decimation": str(factor),
+            "X-Layout": ",".join(layout),
+        })
+    return sample_ring.to_columns(records, names, factor)
+
+@app.get("/api/sensor/stream")
+async def stream_sensor_data(last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of sensor snapshots (read-only alternative to /ws).
+    Every subscriber receives the same pre-encoded frame; reconnects resume via Last-Event-ID.
+    """
+    return StreamingResponse(
+        snapshot_stream.subscribe(parse_last_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/debug/stream")
+def get_stream_stats():
+    """Shared snapshot stream: last event id, replay buffer fill, SSE subscribers"""
+    return snapshot_stream.get_stats()
+
+@app.get("/api/debug/ring")
+def get_ring_stats():
+    """Shared-memory sample ring fill level (null when IOT_SHARED_RING is not set)"""
+    ring = sensor_manager.shared_ring
+    return ring.get_stats() if ring is not None else None
+
+@app.get("/api/debug/retention")
+def get_retention_stats():
+    """Retention policy and the report of the last purge pass"""
+    return ingest_state("retention", retention_manager.get_stats)
+
+@app.get("/api/debug/loop")
+def get_loop_stats():
+    """Event loop lag and recent stalls (with the stack that was blocking)"""
+    return loop_monitor.get_stats()
+
+@app.get("/api/debug/latency")
+def get_latency_stats():
+    """
+    Per-stage latency distributions (ms since line read) and recent slow samples.
+    With IOT_ROLE=api these are the ingest process's stats: websockets are served by the
+    API workers, whose clocks and traces the ingest process never sees, so ws_sent is empty.
+    """
+    stats = ingest_state("latency", sensor_manager.tracer.get_stats)
+    if config.settings.ROLE == "api":
+        stats = dict(stats, not_measured={"ws_sent": "websockets are served by the API workers, not the ingest process"})
+    return stats
+
+@app.get("/api/debug/commands")
+def get_command_stats():
+    """AI_* command writer: coalesced/resent counts and write -> ack round trip"""
+    return ingest_state("commands", sensor_manager.command_writer.get_stats)
+
+@app.get("/api/debug/overload")
+def get_overload_stats():
+    """Backlog depth per read, overload policy and how many samples were shed"""
+    return ingest_state("overload", sensor_manager.load_shedder.get_stats)
+
+@app.get("/api/debug/raw-lines")
+def get_raw_lines(limit: int = 100, contains: Optional[str] = None):
+    """Most recent raw lines received from the device (newest last)"""
+    if config.settings.ROLE == "api":
+        lines = ingest_state("raw_lines", list)
+        if contains:
+            lines = [entry for entry in lines if contains in entry["line"]]
+        return lines[-limit:]
+    return raw_lines.get_recent(limit=limit, contains=contains)
+
+@app.get("/api/debug/logging")
+def get_logging_status():
+    """Log queue depth, dropped records and per-type suppression counters"""
+    return get_logging_stats()
 
 @app.get("/api/ml/status", response_model=schemas.MLStatus)
 def get_ml_status():
     """Get ML model status and statistics"""
-    return ml_service.get_model_status()
+    return ingest_state("ml_status", ml_service.get_model_status)
+
+@app.get("/api/ml/predictions", response_model=List[schemas.MLPrediction])
+def get_ml_predictions(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                       model_version: Optional[str] = None, skip: int = 0, limit: int = 1000,
+                       db: Session = Depends(get_db)):
+    """
+    Logged inferences (newest first) with the full probability vector and features.
+    Example: /api/ml/predictions?since=2026-02-01T10:00:00&until=2026-02-01T10:05:00
+    """
+    return crud.get_ml_predictions(db, since=since, until=until, model_version=model_version, skip=skip, limit=limit)
+
+@app.get("/api/ml/shadow")
+def get_shadow_stats():
+    """Shadow models vs the primary: disagreement, confusion[primary][shadow], latency histograms"""
+    return ingest_state("ml_shadow", shadow_scorer.get_stats)
+
+@app.get("/api/ml/retrain")
+def get_retrain_status():
+    """Background retraining status and published candidate models (never auto-promoted)"""
+    return ingest_state("ml_retrain", retrainer.get_status)
+
+@app.post("/api/ml/retrain", status_code=202)
+async def trigger_retrain():
+    """Train a candidate now in a worker process"""
+    if config.settings.ROLE == "api":
+        raise HTTPException(status_code=503, detail="Retraining runs in the ingest process (IOT_RETRAIN=1)")
+    if not retrainer.trigger():
+        raise HTTPException(status_code=409, detail="Retraining already running")
+    return {"status": "started"}
 
 @app.get("/api/ml/predict")
 def get_ml_prediction(mq2: float = 0.0, mq135: float = 0.0):
     """
-    Get ML prediction for given sensor values
+    Get ML prediction for given sensor values, held steady over a full window.
+    Stateless: does not touch the live window, the prediction log or shadow scoring.
     Example: /api/ml/predict?mq2=1.5&mq135=1.2
     """
-    prediction, confidence, ai_command = ml_service.predict_with_ml(mq2, mq135)
+    prediction, confidence, ai_command, probs = ml_service.probe(mq2, mq135)
     return {
         "prediction": prediction,
         "confidence": f"{confidence:.2%}",
         "ai_command": ai_command,
+        "probs": probs,
         "mq2_value": mq2,
         "mq135_value": mq135,
-        "timestamp": ml_service.prediction_time
+        "timestamp": datetime.now()
     }
 
 @app.get("/api/sensor/history", response_model=List[schemas.SensorData])
 def get_sensor_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     return crud.get_sensor_data(db, skip=skip, limit=limit)
 
+@app.get("/api/sensor/export")
+def export_sensor_history(format: str = "csv", since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Stream archived samples in batches (constant memory for any range).
+    Example: /api/sensor/export?format=csv&since=2026-01-29T00:00:00
+    csv uses the datasets/ layout (timestamp,mq2,mq135); see app/services/export.py for the others.
+    """
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    extension = {"csv": "csv", "ndjson": "ndjson", "binary": "bin"}[format]
+    filename = f"sensor_data_{datetime.now():%Y%m%d_%H%M%S}.{extension}"
+    return StreamingResponse(
+        export.stream_export(format, since, until, config.settings.EXPORT_BATCH_ROWS),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.get("/api/alerts", response_model=List[schemas.Alert])
-def get_alerts(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
-    return crud.get_alerts(db, skip=skip, limit=limit)
+def get_alerts(skip: int = 0, limit: int = 50,
+               severity: Optional[List[str]] = Query(None),
+               since: Optional[datetime] = None, until: Optional[datetime] = None,
+               resolved: Optional[bool] = None, device_id: Optional[str] = None,
+               db: Session = Depends(get_db)):
+    """
+    Newest-first alerts, optionally filtered
+    Example: /api/alerts?severity=high&resolved=false&since=2026-01-30T00:00:00
+    """
+    return crud.get_alerts(db, skip=skip, limit=limit, severity=severity, since=since,
+                           until=until, resolved=resolved, device_id=device_id)
+
+@app.get("/api/alerts/summary")
+def get_alert_summary(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      device_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """Alert counts per severity / resolution state (computed in SQL)"""
+    return crud.get_alert_summary(db, since=since, until=until, device_id=device_id)
+
+@app.post("/api/alerts/resolve")
+def resolve_alerts(request: schemas.AlertResolve, db: Session = Depends(get_db)):
+    """Bulk-resolve alerts by id list and/or filters in a single UPDATE"""
+    if not (request.ids or request.severity or request.until or request.device_id):
+        # An empty body would match every alert
+        raise HTTPException(status_code=400, detail="Give ids or at least one filter (severity, until, device_id)")
+    count = crud.resolve_alerts(db, ids=request.ids, severity=request.severity,
+                                until=request.until, device_id=request.device_id)
+    return {"resolved": count}
+
+@app.get("/api/alerts/active")
+def get_active_alert():
+    """Current alert level and open incident, from the in-memory engine (mirrored in api mode)"""
+    return ingest_state("alerts_active", alert_engine.get_state)
 
 @app.delete("/api/alerts/clear")
-def clear_all_alerts(db: Session = Depends(get_db)):
-    """Clear all alerts from the database"""
-    db.query(models.Alert).delete()
-    db.commit()
-    return {"message": "All alerts cleared successfully"}
+def clear_all_alerts(resolved_only: bool = False, db: Session = Depends(get_db)):
+    """Clear alerts from the database (all, or only resolved ones)"""
+    count = crud.delete_alerts(db, resolved_only=resolved_only)
+    message = "Resolved alerts cleared successfully" if resolved_only else "All alerts cleared successfully"
+    return {"message": message, "deleted": count}
+
+async def stream_delta_frames(websocket: WebSocket, session):
+    """Protocol v2: only changed fields, at the negotiated rate, with periodic keyframes"""
+    await websocket.send_json(hello_message(session))
+    while True:
+        trace = sensor_manager.tracer.current
+        frame = session.encode(sensor_manager.latest_data)
+        if frame is not None:
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+            sensor_manager.tracer.mark(trace, "ws_sent")
+        await asyncio.sleep(session.interval)
 
 # WebSocket Endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    # Clients opting into protocol v2 (/ws?v=2&rate=..&enc=..) get delta frames
+    session = session_from_query(websocket.query_params)
     try:
+        if session:
+            await stream_delta_frames(websocket, session)
         while True:
-            # Make a copy to avoid reference issues
-            data = sensor_manager.latest_data.copy()
-            await websocket.send_json(data)
+            # Shared pre-encoded snapshot (serialized once per sample, not per client)
+            trace = sensor_manager.tracer.current
+            await websocket.send_text(snapshot_stream.latest_json)
+            sensor_manager.tracer.mark(trace, "ws_sent")
             await asyncio.sleep(0.02)  # Update every 20ms for fast real-time display
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -1,12 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Index, JSON
 from datetime import datetime
 from app.core.database import Base
+from app.core.config import settings
 
 class SensorData(Base):
     __tablename__ = "sensor_data"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.now)
+    timestamp = Column(DateTime, default=datetime.now, index=True)  # History queries and retention
     mq2_gas = Column(Float)   # Converted PPM or Raw
     mq2_voltage = Column(Float) # Raw Voltage
     mq135_air = Column(Float) # Converted PPM or Raw
@@ -18,10 +19,34 @@ class Alert(Base):
     __tablename__ = "alerts"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.now)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
     severity = Column(String) # low, medium, high, critical
     message = Column(String)
     is_resolved = Column(Boolean, default=False)
+    device_id = Column(String, default=lambda: settings.DEVICE_ID)
+
+    # Composite indexes for the filtered, newest-first queries in crud.get_alerts
+    __table_args__ = (
+        Index("ix_alerts_severity_timestamp", "severity", "timestamp"),
+        Index("ix_alerts_resolved_timestamp", "is_resolved", "timestamp"),
+        Index("ix_alerts_device_timestamp", "device_id", "timestamp"),
+    )
+
+class MLPrediction(Base):
+    __tablename__ = "ml_predictions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
+    mq2_value = Column(Float)      # Voltage fed to the model
+    mq135_value = Column(Float)
+    prediction = Column(String)    # SAFE, WARN, CRITICAL (or the threshold fallback's class)
+    confidence = Column(Float)
+    ai_command = Column(String)    # Command implied by the model, before predict_risk overrides
+    prob_safe = Column(Float)      # predict_proba, mapped through model.classes_ (null for fallback)
+    prob_warn = Column(Float)
+    prob_crit = Column(Float)
+    model_version = Column(String) # "thresholds" when the model was not used
+    features = Column(JSON)        # Feature vector as {name: value}
 
 class AppSetting(Base):
     __tablename__ = "settings"
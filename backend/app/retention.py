@@ -0,0 +1,45 @@
+"""
+Run a retention pass by hand (the server also runs one every RETENTION_INTERVAL_S).
+
+    python -m app.retention                        # archive + purge expired rows, then vacuum
+    python -m app.retention --dry-run              # only count expired rows
+    python -m app.retention --no-archive           # purge without writing .csv.gz files
+    python -m app.retention --enable-auto-vacuum   # one-time conversion of an older database file
+
+Run from the backend/ directory (same as the server).
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from app import models
+from app.core import database
+from app.core.logging_pipeline import setup_logging
+from app.services.retention import retention_manager, enable_auto_vacuum
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge sensor_data/alerts rows past their retention period")
+    parser.add_argument("--dry-run", action="store_true", help="count expired rows without deleting")
+    parser.add_argument("--no-archive", action="store_true", help="do not export rows before deleting")
+    parser.add_argument("--enable-auto-vacuum", action="store_true",
+                        help="switch the database to incremental auto-vacuum (full VACUUM, run while the server is stopped)")
+    args = parser.parse_args()
+
+    database.ensure_schema(models.Base.metadata)
+    if args.enable_auto_vacuum:
+        logger.info(f"auto_vacuum is now {enable_auto_vacuum()} (2 = incremental)")
+        return
+    if args.no_archive:
+        retention_manager.archive_dir = ""
+
+    report = asyncio.run(retention_manager.run_once(dry_run=args.dry_run))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    setup_logging(level=logging.INFO)
+    main()
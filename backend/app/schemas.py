@@ -35,6 +35,11 @@ class MLPredictionCreate(MLPredictionBase):
 class MLPrediction(MLPredictionBase):
     id: int
     timestamp: datetime
+    prob_safe: Optional[float] = None
+    prob_warn: Optional[float] = None
+    prob_crit: Optional[float] = None
+    model_version: Optional[str] = None
+    features: Optional[dict] = None
 
     class Config:
         from_attributes = True
@@ -46,6 +51,7 @@ class MLStatus(BaseModel):
     prediction_time: Optional[datetime] = None
     model_accuracy: float = 97.15
     total_predictions: int = 0
+    model_version: Optional[str] = None
     feature_importance: dict = {
         "mq135_max_window": 23.5,
         "mq135_mean_window": 18.9,
@@ -62,6 +68,7 @@ class AlertBase(BaseModel):
     severity: str
     message: str
     is_resolved: bool = False
+    device_id: Optional[str] = None
 
 class AlertCreate(AlertBase):
     pass
@@ -73,6 +80,12 @@ class Alert(AlertBase):
     class Config:
         from_attributes = True
 
+class AlertResolve(BaseModel):
+    ids: Optional[List[int]] = None
+    severity: Optional[List[str]] = None
+    until: Optional[datetime] = None
+    device_id: Optional[str] = None
+
 # Settings Schemas
 class SettingBase(BaseModel):
     key: str
@@ -0,0 +1,198 @@
+import threading
+import logging
+from datetime import datetime
+
+from app import models
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Status levels reported by ml_service.predict_risk and the voltage each one starts at
+LEVELS = {"Safe": 0, "Warning": 1, "Danger": 2}
+LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+LEVEL_THRESHOLDS = {1: 1.5, 2: 2.0}
+SEVERITIES = {1: "medium", 2: "high"}
+
+
+class Incident:
+    """One open alert: from the first debounced Warning/Danger until back to Safe"""
+    def __init__(self, level, opened_at):
+        self.alert_id = None  # Set once the row has been inserted
+        self.level = level
+        self.peak_level = level
+        self.opened_at = opened_at
+        self.resolved_at = None
+        self.message = ""
+
+    def to_dict(self):
+        return {
+            "alert_id": self.alert_id,
+            "status": LEVEL_NAMES[self.level],
+            "severity": SEVERITIES[self.peak_level],
+            "opened_at": self.opened_at,
+            "message": self.message,
+        }
+
+
+class AlertEngine:
+    """
+    Evaluates every sample in memory and tracks open incidents.
+
+    - Debounce: a higher level must be seen for `debounce_samples` consecutive samples.
+    - Hysteresis: a lower level only counts once the max voltage is `hysteresis_v` below
+      the current level's threshold, and must hold for `clear_samples` consecutive samples.
+    - Only transitions (open / escalate / resolve) are queued; flush() writes them in one commit.
+    - Rows resolved or deleted through the API (crud.resolve_alerts / delete_alerts, possibly
+      in another process) win: flush() never reopens them and forgets the incident instead.
+    """
+    def __init__(self, debounce_samples=3, clear_samples=30, hysteresis_v=0.1):
+        self.debounce_samples = debounce_samples
+        self.clear_samples = clear_samples
+        self.hysteresis_v = hysteresis_v
+        self.level = 0
+        self.incident = None
+        self._candidate = None
+        self._candidate_count = 0
+        self._pending = {}  # Incident -> True, insertion ordered
+        self._lock = threading.Lock()
+        self.transitions = 0
+
+    def evaluate(self, data):
+        """Feed one sample (latest_data after inference)"""
+        reported = LEVELS.get(data.get("status"), 0)
+        max_voltage = max(data.get("mq2_voltage") or 0.0, data.get("mq135_voltage") or 0.0)
+
+        # Falling: thresholds up to the current level are lowered by the hysteresis margin
+        if reported < self.level:
+            for level in range(self.level, reported, -1):
+                if max_voltage >= LEVEL_THRESHOLDS[level] - self.hysteresis_v:
+                    reported = level
+                    break
+
+        if reported == self.level:
+            self._candidate = None
+            self._candidate_count = 0
+            return
+
+        if reported != self._candidate:
+            self._candidate = reported
+            self._candidate_count = 0
+        self._candidate_count += 1
+
+        needed = self.debounce_samples if reported > self.level else self.clear_samples
+        if self._candidate_count >= needed:
+            self._transition(reported, data)
+
+    def _transition(self, level, data):
+        now = datetime.now()
+        with self._lock:
+            if level > 0 and self.incident is None:
+                self.incident = Incident(level, now)
+            incident = self.incident
+
+            if level == 0:
+                self.incident = None
+                if incident is not None:  # None: already closed through the API
+                    incident.resolved_at = now
+            else:
+                incident.level = level
+                if level >= incident.peak_level:
+                    incident.peak_level = level
+                    incident.message = self._format_message(data)
+
+            if incident is not None:
+                self._pending[incident] = True
+            self.level = level
+            self._candidate = None
+            self._candidate_count = 0
+            self.transitions += 1
+        logger.info("🚨 Alert state -> %s", LEVEL_NAMES[level])
+
+    @staticmethod
+    def _format_message(data):
+        # Format: "Danger Detected! Score: 100% (MQ2: 2.5V | 120ppm, MQ135: 1.2V | 80ppm) [AI_CRITICAL]"
+        status = data.get("status")
+        ai_cmd = data.get("ai_command", "Unknown")
+        score = int(data.get("risk_score", 0))
+        mq2_val = data.get("mq2_voltage", 0.0)
+        mq135_val = data.get("mq135_voltage", 0.0)
+        mq2_ppm = data.get("mq2_gas", 0.0)
+        mq135_ppm = data.get("mq135_air", 0.0)
+        return f"{status} Detected! Score: {score}% (MQ2: {mq2_val:.2f}V|{mq2_ppm:.0f}ppm, MQ135: {mq135_val:.2f}V|{mq135_ppm:.0f}ppm) [{ai_cmd}]"
+
+    def flush(self, db):
+        """Persist all queued transitions in a single commit. Returns the number of incidents written."""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending = {}
+            current = self.incident
+        # The open incident is re-checked every flush, so an API resolve/delete is noticed
+        # even when no transition follows it
+        check = current if current is not None and current.alert_id is not None and current not in pending else None
+        if not pending and check is None:
+            return 0
+
+        inserted = []
+        closed = []
+        skipped = 0
+        try:
+            for incident in pending:
+                fields = {
+                    "severity": SEVERITIES[incident.peak_level],
+                    "message": incident.message,
+                    "is_resolved": incident.resolved_at is not None,
+                }
+                if incident.alert_id is None:
+                    row = models.Alert(timestamp=incident.opened_at, device_id=settings.DEVICE_ID, **fields)
+                    db.add(row)
+                    db.flush()  # Assigns the id inside the same transaction
+                    incident.alert_id = row.id
+                    inserted.append(incident)
+                else:
+                    # Only while still open: a resolved or deleted row is never brought back
+                    updated = (db.query(models.Alert)
+                               .filter(models.Alert.id == incident.alert_id, models.Alert.is_resolved.is_(False))
+                               .update(fields, synchronize_session=False))
+                    if not updated:
+                        closed.append(incident)
+                        skipped += 1
+            if check is not None:
+                still_open = (db.query(models.Alert.id)
+                              .filter(models.Alert.id == check.alert_id, models.Alert.is_resolved.is_(False))
+                              .first())
+                if still_open is None:
+                    closed.append(check)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put them back so the next flush retries
+            for incident in inserted:
+                incident.alert_id = None
+            with self._lock:
+                for incident in pending:
+                    self._pending.setdefault(incident, True)
+            raise
+        with self._lock:
+            for incident in closed:
+                if self.incident is incident:
+                    # Closed through the API: the next transition above Safe opens a new incident
+                    self.incident = None
+                    logger.info("🚨 Alert %s was closed through the API", incident.alert_id)
+                self._pending.pop(incident, None)
+        return len(pending) - skipped
+
+    def get_state(self):
+        with self._lock:
+            return {
+                "status": LEVEL_NAMES[self.level],
+                "incident": self.incident.to_dict() if self.incident else None,
+                "pending_writes": len(self._pending),
+                "transitions": self.transitions,
+            }
+
+
+alert_engine = AlertEngine(
+    debounce_samples=settings.ALERT_DEBOUNCE_SAMPLES,
+    clear_samples=settings.ALERT_CLEAR_SAMPLES,
+    hysteresis_v=settings.ALERT_HYSTERESIS_V,
+)
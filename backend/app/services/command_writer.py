@@ -0,0 +1,193 @@
+"""
+Single writer thread for AI_* commands to the device.
+
+Only the newest desired command matters (the firmware keeps one ML state), so submit()
+replaces any command that has not been written yet instead of queueing behind it
+(except AI_CRITICAL, which is always written before whatever superseded it). The
+ML firmware answers "> ML: <CLASS> acknowledged ..." (ml/stm32_modified_main.c); those
+lines are fed to on_line() by the reader and give the write -> ack round trip. A command
+that is not acknowledged within ack_timeout_s is written again, up to max_retries times,
+once the firmware on this connection has acknowledged anything at all - the basic
+firmware (firmware/main.c) never acks, and would otherwise get every command three times.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ACK_PATTERN = re.compile(r"^>\s*ML:\s*(SAFE|WARN|CRITICAL)\s+acknowledged")
+
+# Always written, even if a newer command arrives first (a critical spike inside a burst
+# must reach the device; the newer command follows right after it)
+NEVER_COALESCE = ("AI_CRITICAL",)
+
+
+class CommandWriter:
+    def __init__(self, get_conn, ack_timeout_s=1.0, max_retries=2, history=256, tracer=None):
+        self.get_conn = get_conn  # Returns the current serial connection (or None)
+        self.ack_timeout_s = ack_timeout_s
+        self.max_retries = max_retries
+        self.tracer = tracer
+        self.acks_supported = False  # Learned from the first ack on the current connection
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._desired = None
+        self._desired_at = None
+        self._desired_trace = None
+        self._pinned = None  # (command, trace, submitted_at) that must be written before _desired
+        self._sent = None
+        self._sent_at = None
+        self._attempts = 0
+        self._acked = None
+        self._gave_up = False
+
+        self.counters = {"submitted": 0, "coalesced": 0, "writes": 0, "resends": 0,
+                         "acks": 0, "unacknowledged": 0, "write_errors": 0}
+        self.queue_ms = deque(maxlen=history)       # submit -> written
+        self.round_trip_ms = deque(maxlen=history)  # last write -> ack
+        self.command_to_ack_ms = deque(maxlen=history)  # submit -> ack
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="serial-writer", daemon=True)
+            self._thread.start()
+
+    # ---------- called from the event loop / reader ----------
+
+    def submit(self, command, trace=None):
+        """Make `command` the desired device state. Never blocks on I/O."""
+        with self._cond:
+            if command == self._desired:
+                return False
+            if self._desired is not None and self._desired != self._sent:
+                if self._desired in NEVER_COALESCE and self._pinned is None:
+                    self._pinned = (self._desired, self._desired_trace, self._desired_at)
+                else:
+                    self.counters["coalesced"] += 1  # Superseded before it was written
+            self._desired = command
+            self._desired_at = time.monotonic()
+            self._desired_trace = trace
+            self._gave_up = False
+            self.counters["submitted"] += 1
+            self._cond.notify()
+        return True
+
+    def on_line(self, line):
+        """Feed every received line; returns True if it was an acknowledgement"""
+        match = ACK_PATTERN.match(line)
+        if not match:
+            return False
+        command = "AI_" + match.group(1)
+        now = time.monotonic()
+        with self._cond:
+            self.acks_supported = True
+            if command == self._sent and self._acked != command:
+                self._acked = command
+                self.counters["acks"] += 1
+                self.round_trip_ms.append((now - self._sent_at) * 1000)
+                if command == self._desired:
+                    self.command_to_ack_ms.append((now - self._desired_at) * 1000)
+                self._cond.notify()
+        return True
+
+    def invalidate(self):
+        """New connection: device state is unknown, so the desired command is written again"""
+        with self._cond:
+            self._sent = None
+            self._acked = None
+            self._gave_up = False
+            self.acks_supported = False
+            self._cond.notify()
+
+    # ---------- writer thread ----------
+
+    def _next_action(self):
+        """Under the lock: wait until there is something to write; returns (command, is_resend)"""
+        while True:
+            if self._pinned is not None:
+                return self._pinned[0], False
+            if self._desired is not None and self._desired != self._sent:
+                return self._desired, False
+            awaiting_ack = self._sent is not None and self._acked != self._sent and not self._gave_up
+            if awaiting_ack and self.acks_supported:
+                remaining = self._sent_at + self.ack_timeout_s - time.monotonic()
+                if remaining <= 0:
+                    if self._attempts <= self.max_retries:
+                        return self._sent, True
+                    self._gave_up = True
+                    self.counters["unacknowledged"] += 1
+                    logger.warning(f"⚠️ No acknowledgement for {self._sent} after {self._attempts} writes")
+                    continue
+                self._cond.wait(remaining)
+            else:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                command, is_resend = self._next_action()
+            conn = self.get_conn()
+            if conn is None or not conn.is_open:
+                with self._cond:
+                    self._cond.wait(0.5)  # Reader is reconnecting
+                continue
+            try:
+                conn.write((command + "\n").encode("utf-8"))
+            except Exception as e:
+                logger.error(f"❌ Failed to send command {command}: {e}")
+                with self._cond:
+                    self.counters["write_errors"] += 1
+                    self._cond.wait(0.5)
+                continue
+
+            now = time.monotonic()
+            with self._cond:
+                self.counters["writes"] += 1
+                if is_resend:
+                    self.counters["resends"] += 1
+                    self._attempts += 1
+                else:
+                    self._attempts = 1
+                    if self._pinned is not None and command == self._pinned[0]:
+                        _, trace, submitted_at = self._pinned
+                        self._pinned = None
+                    else:
+                        trace, submitted_at = self._desired_trace, self._desired_at
+                    self.queue_ms.append((now - submitted_at) * 1000)
+                    if self.tracer is not None:
+                        self.tracer.mark(trace, "command_written")
+                self._sent = command
+                self._sent_at = now
+            logger.debug(" 📤 Sent: %s", command)
+
+    # ---------- stats ----------
+
+    @staticmethod
+    def _summarize(values):
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        n = len(ordered)
+        return {
+            "count": n,
+            "p50_ms": round(ordered[n // 2], 3),
+            "p95_ms": round(ordered[min(n - 1, int(0.95 * n))], 3),
+            "max_ms": round(ordered[-1], 3),
+        }
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                "desired": self._desired,
+                "sent": self._sent,
+                "acknowledged": self._acked,
+                "acks_supported": self.acks_supported,
+                "counters": dict(self.counters),
+                "queue": self._summarize(self.queue_ms),
+                "round_trip": self._summarize(self.round_trip_ms),
+                "command_to_ack": self._summarize(self.command_to_ack_ms),
+            }
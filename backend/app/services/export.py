@@ -0,0 +1,133 @@
+"""
+Streaming export of archived sensor rows.
+
+Rows are read with a streaming cursor in batches of EXPORT_BATCH_ROWS and encoded one batch
+at a time, so memory stays flat no matter how many rows are exported. No ORM objects or
+Pydantic models are built.
+
+Formats:
+    csv     timestamp,mq2,mq135 - seconds since the first row and voltages, the layout
+            ml/feature_engineering.py reads from datasets/
+    ndjson  one JSON object per row with every archived column
+    binary  repeated frames: FRAME_HEADER (magic, row count) followed by one packed
+            little-endian column per BINARY_COLUMNS entry
+"""
+import json
+import struct
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from app import models
+from app.core import database
+from app.services.sample_ring import STATUS_CODES, UNKNOWN_CODE
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "binary": "application/octet-stream",
+}
+
+COLUMNS = ["id", "timestamp", "mq2_gas", "mq2_voltage", "mq135_air", "mq135_voltage", "risk_score", "status"]
+
+FRAME_HEADER = struct.Struct("<4sI")
+FRAME_MAGIC = b"IOTX"
+BINARY_COLUMNS = [
+    ("id", "<i8"),
+    ("timestamp", "<f8"),  # Unix seconds
+    ("mq2_gas", "<f4"),
+    ("mq2_voltage", "<f4"),
+    ("mq135_air", "<f4"),
+    ("mq135_voltage", "<f4"),
+    ("risk_score", "<f4"),
+    ("status", "u1"),      # Index in STATUS_CODES (255 = unknown)
+]
+
+
+def iter_batches(since: Optional[datetime] = None, until: Optional[datetime] = None, batch_rows: int = 5000):
+    """Yield lists of row tuples (COLUMNS order), oldest first, from a streaming cursor"""
+    table = models.SensorData.__table__
+    stmt = select(*[table.c[name] for name in COLUMNS]).order_by(table.c.id)
+    if since is not None:
+        stmt = stmt.where(table.c.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(table.c.timestamp < until)
+
+    # A dedicated connection: FastAPI closes yield-dependencies before a streamed body finishes
+    with database.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_rows).execute(stmt)
+        for batch in result.partitions():
+            yield batch
+
+
+def _float(value, digits):
+    return "" if value is None else f"{value:.{digits}f}"
+
+
+def encode_csv(batches):
+    t0 = None
+    yield "timestamp,mq2,mq135\n"
+    for batch in batches:
+        lines = []
+        for row in batch:
+            if row.timestamp is None:
+                continue
+            if t0 is None:
+                t0 = row.timestamp
+            seconds = (row.timestamp - t0).total_seconds()
+            lines.append(f"{seconds:.3f},{_float(row.mq2_voltage, 3)},{_float(row.mq135_voltage, 3)}\n")
+        yield "".join(lines)
+
+
+def encode_ndjson(batches):
+    for batch in batches:
+        lines = []
+        for row in batch:
+            record = row._asdict()
+            if record["timestamp"] is not None:
+                record["timestamp"] = record["timestamp"].isoformat()
+            lines.append(json.dumps(record))
+        yield "\n".join(lines) + "\n"
+
+
+def encode_binary(batches):
+    for batch in batches:
+        columns = []
+        for name, dtype in BINARY_COLUMNS:
+            if name == "timestamp":
+                values = [row.timestamp.timestamp() if row.timestamp else np.nan for row in batch]
+            elif name == "status":
+                values = [STATUS_CODES.index(row.status) if row.status in STATUS_CODES else UNKNOWN_CODE for row in batch]
+            else:
+                values = [getattr(row, name) for row in batch]
+                if dtype != "<i8":
+                    values = [np.nan if v is None else v for v in values]
+            columns.append(np.asarray(values, dtype=dtype).tobytes())
+        yield FRAME_HEADER.pack(FRAME_MAGIC, len(batch)) + b"".join(columns)
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "binary": encode_binary}
+
+
+def stream_export(fmt, since=None, until=None, batch_rows=5000):
+    """Generator of encoded chunks (str for csv/ndjson, bytes for binary)"""
+    return ENCODERS[fmt](iter_batches(since, until, batch_rows))
+
+
+def read_binary(data):
+    """Decode a binary export back into a dict of numpy columns (handy for analysis)"""
+    parts = {name: [] for name, _ in BINARY_COLUMNS}
+    offset = 0
+    while offset < len(data):
+        magic, count = FRAME_HEADER.unpack_from(data, offset)
+        if magic != FRAME_MAGIC:
+            raise ValueError(f"Bad frame at byte {offset}")
+        offset += FRAME_HEADER.size
+        for name, dtype in BINARY_COLUMNS:
+            column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            parts[name].append(column)
+            offset += column.nbytes
+    return {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+            for (name, dtype), chunks in zip(BINARY_COLUMNS, parts.values())}
@@ -0,0 +1,166 @@
+"""
+Local socket link between the ingestion process and API workers.
+
+The ingest process (IOT_ROLE=ingest) owns the serial port, inference and archiving and
+pushes every encoded snapshot as one newline-delimited JSON line to each connected worker.
+API workers (IOT_ROLE=api) never touch the hardware: they mirror the snapshots into their
+own SensorManager/SnapshotStream so REST, SSE and /ws are served locally.
+
+The state of the ingest-only services (alert engine, ML status, command writer, load
+shedder, latency tracer, shadow scorer, retention, retrainer, raw lines) is sent as a {"__state__": ...}
+line every INGEST_STATE_INTERVAL_S and mirrored in IngestSubscriber.state, which the API
+routes serve in api mode instead of their own idle singletons. It is collected and encoded
+on a separate thread, so the percentile sorts and JSON encoding never stall serial reads.
+
+TCP on localhost is used (rather than a Unix socket) so the same setup works on Windows.
+"""
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import settings
+from app.services.serial_reader import sensor_manager
+from app.services.snapshot_stream import snapshot_stream
+from app.services.sample_ring import SharedSampleRing
+
+logger = logging.getLogger(__name__)
+
+# A worker that falls this far behind is disconnected; it reconnects and gets the latest snapshot
+MAX_WRITE_BUFFER = 1024 * 1024
+STATE_KEY = "__state__"
+# One thread builds the state line (not the default executor, which does the serial reads)
+state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-state")
+
+
+def collect_state():
+    """Ingest process: stats of the services that only run there (see main.py's mirrored routes)"""
+    from app.services.ml_service import ml_service
+    from app.services.alert_engine import alert_engine
+    from app.services.shadow_scorer import shadow_scorer
+    from app.services.retention import retention_manager
+    from app.services.retrainer import retrainer
+    from app.core.logging_pipeline import raw_lines
+    return jsonable_encoder({
+        "alerts_active": alert_engine.get_state(),
+        "ml_status": ml_service.get_model_status(),
+        "ml_shadow": shadow_scorer.get_stats(),
+        "ml_retrain": retrainer.get_status(),
+        "latency": sensor_manager.tracer.get_stats(),
+        "commands": sensor_manager.command_writer.get_stats(),
+        "overload": sensor_manager.load_shedder.get_stats(),
+        "retention": retention_manager.get_stats(),
+        "raw_lines": raw_lines.get_recent(limit=settings.RAW_LINE_BUFFER),
+    })
+
+
+class IngestPublisher:
+    """Runs in the ingest process and fans snapshots out to API workers"""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.writers = set()
+        self.dropped_workers = 0
+
+    async def run(self):
+        snapshot_stream.listeners.append(self.send)
+        server = await asyncio.start_server(self._handle_worker, self.host, self.port)
+        logger.info("Ingest link listening on %s:%s", self.host, self.port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self._publish_state())
+
+    async def _publish_state(self):
+        while True:
+            await asyncio.sleep(settings.INGEST_STATE_INTERVAL_S)
+            if self.writers:
+                self.send(await self._state_line())
+
+    @staticmethod
+    async def _state_line():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(state_executor, lambda: json.dumps({STATE_KEY: collect_state()}))
+
+    async def _handle_worker(self, reader, writer):
+        self.writers.add(writer)
+        logger.info("API worker attached (%d connected)", len(self.writers))
+        self._write(writer, snapshot_stream.latest_json)
+        self._write(writer, await self._state_line())
+        try:
+            # Workers never send anything; reading only detects the disconnect
+            await reader.read()
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def send(self, payload):
+        for writer in list(self.writers):
+            self._write(writer, payload)
+
+    def _write(self, writer, payload):
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.dropped_workers += 1
+            self.writers.discard(writer)
+            writer.close()
+            return
+        writer.write(payload.encode("utf-8") + b"\n")
+
+
+class IngestSubscriber:
+    """Runs in each API worker and mirrors the ingest process state"""
+    def __init__(self, host, port, retry_s=2.0):
+        self.host = host
+        self.port = port
+        self.retry_s = retry_s
+        self.connected = False
+        self.received = 0
+        self.state = {}  # Mirrored service stats from the ingest process (empty while detached)
+        self.state_received_at = None
+
+    async def run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_WRITE_BUFFER)
+                self.connected = True
+                logger.info("Attached to ingest process at %s:%s", self.host, self.port)
+                self._attach_shared_ring()
+                try:
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        payload = line.decode("utf-8").rstrip("\n")
+                        data = json.loads(payload)
+                        if STATE_KEY in data:
+                            self.state = data[STATE_KEY]
+                            self.state_received_at = time.time()
+                            continue
+                        sensor_manager.apply_remote_snapshot(data, payload)
+                        self.received += 1
+                finally:
+                    writer.close()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ingest link unavailable: {e}. Retrying in {self.retry_s}s...")
+
+            if self.connected:
+                self.connected = False
+                self.state = {}
+                sensor_manager.latest_data["sensor_connected"] = False
+                sensor_manager.latest_data["raw_log"] = "Ingest process unavailable. Reconnecting..."
+                sensor_manager.publish_snapshot()
+            await asyncio.sleep(self.retry_s)
+
+    def _attach_shared_ring(self):
+        if not settings.SHARED_RING_NAME or sensor_manager.shared_ring is not None:
+            return
+        try:
+            sensor_manager.shared_ring = SharedSampleRing.attach(settings.SHARED_RING_NAME)
+            logger.info("Mapped shared sample ring '%s'", settings.SHARED_RING_NAME)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"Shared sample ring not available: {e}")
+
+
+ingest_publisher = IngestPublisher(settings.INGEST_HOST, settings.INGEST_PORT)
+ingest_subscriber = IngestSubscriber(settings.INGEST_HOST, settings.INGEST_PORT)
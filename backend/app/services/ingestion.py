@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app import schemas, crud
+from app.core import database
+from app.core.config import settings
+from app.services.serial_reader import sensor_manager
+from app.services.ml_service import ml_service
+from app.services.alert_engine import alert_engine
+from app.services.ingest_link import ingest_publisher, ingest_subscriber
+from app.services.sample_ring import SharedSampleRing
+from app.services.retention import retention_worker
+from app.services.retrainer import retrainer, retrain_worker
+from app.services.shadow_scorer import shadow_scorer
+
+logger = logging.getLogger(__name__)
+
+
+def archive_snapshot(db: Session, data: Optional[dict]):
+    """Runs on the DB executor: pending alert transitions plus one archived sample"""
+    # Alerts are evaluated per sample by alert_engine; only its state
+    # transitions (open / escalate / resolve) are written here, in one commit
+    alert_engine.flush(db)
+    if data is not None:
+        crud.create_sensor_data(db, schemas.SensorDataCreate(**data))
+
+
+# Background Task for buffering data to DB
+async def data_archiver():
+    while True:
+        await asyncio.sleep(10)
+        try:
+            data = sensor_manager.latest_data.copy()
+            trace = sensor_manager.tracer.current
+
+            # CRITICAL FIX: Only archive if the sensor is actually connected
+            # This prevents specific "last known state" from being archived forever when unplugged
+            if not data.get("sensor_connected", False) or data.get("mq2_gas") is None:
+                data = None
+
+            # Commit/fsync happen on the DB executor, never on the event loop
+            await database.run_db(archive_snapshot, data)
+            if data is not None:
+                sensor_manager.tracer.mark(trace, "persisted")
+        except Exception as e:
+            logging.error(f"Error archiving data: {e}")
+
+
+async def prediction_writer():
+    """Bulk-insert the predictions buffered by ml_service (one statement per flush)"""
+    while True:
+        await asyncio.sleep(settings.PREDICTION_FLUSH_S)
+        rows = ml_service.drain_predictions()
+        if not rows:
+            continue
+        try:
+            await database.run_db(crud.create_ml_predictions, rows)
+        except Exception as e:
+            logging.error(f"Error writing {len(rows)} predictions: {e}")
+
+
+def start_background_tasks(role=None):
+    """
+    Start the tasks this process owns, by role:
+      standalone - serial reading, inference, archiving and retention (single process)
+      ingest     - the same, plus publishing snapshots to API workers
+      api        - no hardware access; mirror snapshots from the ingest process
+    """
+    role = role or settings.ROLE
+    tasks = []
+    if role == "api":
+        # The shared ring (if configured) is attached by the subscriber once the ingest process is up
+        tasks.append(asyncio.create_task(ingest_subscriber.run()))
+        return tasks
+
+    if settings.SHARED_RING_NAME:
+        sensor_manager.shared_ring = SharedSampleRing.create(settings.SHARED_RING_NAME, settings.SHARED_RING_CAPACITY)
+    shadow_scorer.start()  # No-op unless SHADOW_MODELS is set
+    tasks.append(asyncio.create_task(sensor_manager.start_reading()))
+    tasks.append(asyncio.create_task(data_archiver()))
+    tasks.append(asyncio.create_task(prediction_writer()))
+    tasks.append(asyncio.create_task(retention_worker()))
+    if retrainer.enabled:
+        tasks.append(asyncio.create_task(retrain_worker()))
+    if role == "ingest":
+        tasks.append(asyncio.create_task(ingest_publisher.run()))
+    return tasks
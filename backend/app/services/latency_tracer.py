@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import deque
+
+# Pipeline stages in the order a sample passes through them.
+# Every stage is recorded as an offset (ms) from the moment the line was read.
+# ws_sent is stamped where websockets are served: with IOT_ROLE=api that is the API
+# workers, so the ingest process never records it (see /api/debug/latency).
+STAGES = ("read", "parsed", "inferred", "command_written", "ws_sent", "persisted")
+
+# Persistence happens in the archiver on its own schedule, so it is reported
+# but not counted when deciding whether a sample was "slow".
+HOT_PATH_STAGES = ("parsed", "inferred", "command_written", "ws_sent")
+
+
+class SampleTrace:
+    """Monotonic timestamps for one ingested sample"""
+    __slots__ = ("seq", "marks")
+
+    def __init__(self, seq, t_read):
+        self.seq = seq
+        self.marks = {"read": t_read}
+
+    def offsets_ms(self):
+        t0 = self.marks["read"]
+        return {stage: round((t - t0) * 1000, 3) for stage, t in self.marks.items()}
+
+    def hot_path_ms(self):
+        t0 = self.marks["read"]
+        ends = [self.marks[s] for s in HOT_PATH_STAGES if s in self.marks]
+        return (max(ends) - t0) * 1000 if ends else 0.0
+
+
+class LatencyTracer:
+    """
+    Collects per-stage latency distributions for ingested samples.
+    Keeps the last `window` offsets per stage and a ring buffer of slow samples.
+    """
+    def __init__(self, window=2048, slow_ms=100.0, slow_capacity=50):
+        self.slow_ms = slow_ms
+        self.stage_samples = {stage: deque(maxlen=window) for stage in STAGES[1:]}
+        self.slow_traces = deque(maxlen=slow_capacity)
+        self.current = None
+        self.total_samples = 0
+        self._lock = threading.Lock()
+
+    def begin(self, seq, t_read=None):
+        """Start tracing a new sample; the previous one is finalized"""
+        trace = SampleTrace(seq, t_read if t_read is not None else time.monotonic())
+        with self._lock:
+            previous = self.current
+            self.current = trace
+            self.total_samples += 1
+        if previous is not None:
+            self._finalize(previous)
+        return trace
+
+    def mark(self, trace, stage, at=None):
+        """Stamp a stage once per sample (later marks of the same stage are ignored); `at` = when it happened, if earlier"""
+        if trace is None or stage in trace.marks:
+            return
+        now = time.monotonic() if at is None else at
+        with self._lock:
+            if stage in trace.marks:
+                return
+            trace.marks[stage] = now
+            self.stage_samples[stage].append((now - trace.marks["read"]) * 1000)
+
+    def _finalize(self, trace):
+        hot_ms = trace.hot_path_ms()
+        if hot_ms >= self.slow_ms:
+            with self._lock:
+                self.slow_traces.append({
+                    "seq": trace.seq,
+                    "hot_path_ms": round(hot_ms, 3),
+                    "stages_ms": trace.offsets_ms(),
+                })
+
+    @staticmethod
+    def _summarize(values):
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        n = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(n - 1, int(p * n))], 3)
+
+        return {
+            "count": n,
+            "mean_ms": round(sum(ordered) / n, 3),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1], 3),
+        }
+
+    def get_stats(self):
+        """Aggregated distributions (offset from read) plus recent slow samples"""
+        with self._lock:
+            stage_values = {stage: list(values) for stage, values in self.stage_samples.items()}
+            slow = list(self.slow_traces)
+            current = self.current.offsets_ms() if self.current else None
+            total = self.total_samples
+        return {
+            "total_samples": total,
+            "slow_threshold_ms": self.slow_ms,
+            "stages": {stage: self._summarize(values) for stage, values in stage_values.items()},
+            "current": current,
+            "slow_samples": slow,
+        }
@@ -0,0 +1,83 @@
+"""
+Overload handling for the ingestion loop.
+
+Every read drains all lines waiting on the port; the number of sensor samples in one
+drain (lines parse_line accepts; ALERT!/IQ lines and acknowledgements do not count) is
+the backlog depth. Below OVERLOAD_BACKLOG_LINES every sample is processed. At or
+above it the loop is overloaded and the policy decides what gets full processing:
+
+    drop      only the newest sample (the old implicit behaviour, now counted)
+    decimate  the newest sample and every Nth sample before it
+    degrade   every sample, but optional stages (trend forecast, shadow comparison) are skipped;
+              shadow models still get every reading, so their windows stay aligned
+
+Samples that do not get full processing still go through the threshold classification,
+the alert engine and, when critical, the AI_CRITICAL command (SensorManager._safety_check).
+"""
+from collections import deque
+
+POLICIES = ("drop", "decimate", "degrade")
+
+
+class LoadShedder:
+    def __init__(self, policy="drop", backlog_lines=3, decimate_every=4, history=512):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}' (expected one of {', '.join(POLICIES)})")
+        self.policy = policy
+        self.backlog_lines = max(2, backlog_lines)
+        self.decimate_every = max(1, decimate_every)
+        self.overloaded = False
+        self.depths = deque(maxlen=history)  # Backlog depth of recent drains
+        self.max_depth = 0
+        self.counters = {"drains": 0, "lines": 0, "processed": 0, "shed": 0, "degraded": 0,
+                         "overload_episodes": 0, "safety_commands": 0}
+
+    def plan(self, depth):
+        """
+        Decide how to handle a drain of `depth` sensor samples (oldest first).
+        Returns (list of bools, True = full processing; degraded flag for the full ones).
+        """
+        self.depths.append(depth)
+        self.max_depth = max(self.max_depth, depth)
+        self.counters["drains"] += 1
+        self.counters["lines"] += depth
+
+        overloaded = depth >= self.backlog_lines
+        if overloaded and not self.overloaded:
+            self.counters["overload_episodes"] += 1
+        self.overloaded = overloaded
+
+        if not overloaded or self.policy == "degrade":
+            full = [True] * depth
+        elif self.policy == "decimate":
+            # Counted back from the newest line, so the newest is always kept
+            full = [(depth - 1 - i) % self.decimate_every == 0 for i in range(depth)]
+        else:
+            full = [False] * (depth - 1) + [True]
+
+        degraded = overloaded and self.policy == "degrade"
+        processed = sum(full)
+        self.counters["processed"] += processed
+        self.counters["shed"] += depth - processed
+        if degraded:
+            self.counters["degraded"] += processed
+        return full, degraded
+
+    def get_stats(self):
+        depths = sorted(self.depths)
+        n = len(depths)
+        lines = self.counters["lines"]
+        return {
+            "policy": self.policy,
+            "backlog_lines": self.backlog_lines,
+            "decimate_every": self.decimate_every,
+            "overloaded": self.overloaded,
+            "counters": dict(self.counters),
+            "shed_ratio": round(self.counters["shed"] / lines, 4) if lines else 0.0,
+            "depth": {
+                "count": n,
+                "p50": depths[n // 2] if n else None,
+                "p95": depths[min(n - 1, int(0.95 * n))] if n else None,
+                "max": self.max_depth,
+            },
+        }
@@ -1,10 +1,19 @@
 import os
-import joblib
+import sys
 import numpy as np
 from datetime import datetime
 from collections import deque
 import logging
 
+from app.core.config import settings
+from app.services.shadow_scorer import shadow_scorer
+
+# Features, prediction and command mapping are shared with training and ml/deploy_inference.py
+ML_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../ml"))
+if ML_DIR not in sys.path:
+    sys.path.insert(0, ML_DIR)
+from inference_core import InferenceCore, StreamingFeatures, FeatureEngine, WINDOW_SIZE, load_model as load_inference_model
+
 logger = logging.getLogger("MLService")
 
 class MLService:
@@ -12,11 +21,17 @@ class MLService:
         self.model = None
         self.feature_names = None
         self.model_loaded = False
-        self.rolling_buffer = deque(maxlen=60)  # 60 samples for feature window
+        self.core = None  # InferenceCore once the model is loaded
+        self.features = StreamingFeatures(WINDOW_SIZE)  # Fed even without a model (trend forecast)
+        self.rolling_buffer = self.features.buffer  # (mq2, mq135) tuples, last WINDOW_SIZE samples
         self.total_predictions = 0
         self.last_prediction = "SAFE"
         self.last_confidence = 0.0
+        self.last_probs = None  # Class probabilities of the last model prediction (None = thresholds)
         self.prediction_time = None
+        self.model_version = None
+        # Prediction rows waiting for the bulk insert (oldest dropped if the DB falls behind)
+        self.pending_predictions = deque(maxlen=settings.PREDICTION_BUFFER)
         
         # Load the trained model
         self.load_model()
@@ -49,10 +64,13 @@ class MLService:
             feature_path = os.path.join(os.path.dirname(model_path), "feature_names.pkl")
             
             if os.path.exists(model_path) and os.path.exists(feature_path):
-                self.model = joblib.load(model_path)
-                self.feature_names = joblib.load(feature_path)
+                self.model, self.feature_names, self.model_version = load_inference_model(os.path.dirname(model_path))
+                # Feature windows follow the model's feature names (legacy model: 60 samples only)
+                self.features = StreamingFeatures(WINDOW_SIZE, self.feature_names)
+                self.rolling_buffer = self.features.buffer
+                self.core = InferenceCore(self.model, self.feature_names, self.model_version, features=self.features)
                 self.model_loaded = True
-                logger.info(f"✅ ML Model loaded successfully from {model_path}")
+                logger.info(f"✅ ML Model loaded successfully from {model_path} ({self.model_version})")
             else:
                 logger.warning(f"⚠️ Model files not found. Model: {os.path.exists(model_path)}, Features: {os.path.exists(feature_path)}")
                 self.model_loaded = False
@@ -62,87 +80,50 @@ class MLService:
     
     def extract_features(self, mq2_reading, mq135_reading):
         """
-        Extract 8 features from current reading and rolling buffer
-        Features: [mq2_now, mq135_now, mq2_delta, mq135_delta, 
-                   mq2_mean_window, mq135_mean_window, mq2_max_window, mq135_max_window]
+        Add the reading to the rolling window and return the (1, 8) feature row,
+        or None until the window holds WINDOW_SIZE samples (inference_core.StreamingFeatures)
         """
-        # Add current reading to buffer
-        self.rolling_buffer.append((mq2_reading, mq135_reading))
-        
-        if len(self.rolling_buffer) < 2:
-            return None  # Not enough data for features yet
-        
-        # Extract features
-        buffer_array = np.array(list(self.rolling_buffer))
-        mq2_values = buffer_array[:, 0]
-        mq135_values = buffer_array[:, 1]
-        
-        # Feature vector (8 dimensions)
-        features = [
-            mq2_reading,                           # mq2_now
-            mq135_reading,                         # mq135_now
-            mq2_values[-1] - mq2_values[0],        # mq2_delta (Window Delta: Last - First)
-            mq135_values[-1] - mq135_values[0],    # mq135_delta (Window Delta: Last - First)
-            np.mean(mq2_values),                   # mq2_mean_window
-            np.mean(mq135_values),                 # mq135_mean_window
-            np.max(mq2_values),                    # mq2_max_window
-            np.max(mq135_values),                  # mq135_max_window
-        ]
-        
-        return np.array(features).reshape(1, -1)
+        features = self.features.push(mq2_reading, mq135_reading)
+        return None if features is None else features.reshape(1, -1)
     
-    def predict_with_ml(self, mq2_voltage, mq135_voltage):
+    def predict_with_ml(self, mq2_voltage, mq135_voltage, shadow=True):
         """
         Predict using the trained Random Forest model
         Returns: (prediction, confidence, ai_command)
+        shadow=False skips the shadow models' comparison for this sample; the reading still
+        goes to their windows, which must see the same stream as the primary.
         """
         if not self.model_loaded:
+            self.features.push(mq2_voltage, mq135_voltage)
             return self.predict_with_thresholds(mq2_voltage, mq135_voltage)
         
         try:
-            # Extract features
-            features = self.extract_features(mq2_voltage, mq135_voltage)
+            decision = self.core.step(mq2_voltage, mq135_voltage)
             
-            if features is None or len(self.rolling_buffer) < 60:
+            if decision is None:
                 # Not enough samples yet - log status and use threshold fallback
-                logger.info(f"⏳ Warming Up ({len(self.rolling_buffer)}/60 samples) -> Using Thresholds")
+                engine = self.features.engine
+                logger.info("⏳ Warming Up (%d/%d samples) -> Using Thresholds", engine.samples, engine.warmup, extra={"msg_type": "warmup"})
+                shadow_scorer.submit(mq2_voltage, mq135_voltage)
                 return self.predict_with_thresholds(mq2_voltage, mq135_voltage)
             
-            # Convert to DataFrame with feature names to avoid scikit-learn warnings
-            if self.feature_names is not None:
-                import pandas as pd
-                features_df = pd.DataFrame(features, columns=self.feature_names)
-                prediction = self.model.predict(features_df)[0]
-                probabilities = self.model.predict_proba(features_df)[0]
-            else:
-                # Fallback if feature names not loaded
-                prediction = self.model.predict(features)[0]
-                probabilities = self.model.predict_proba(features)[0]
-            
-            confidence = float(np.max(probabilities))
-            
-            # Map prediction to AI command
-            if confidence < 0.45:  # Lowered Threshold for more dynamic response
-                ai_command = "AI_SAFE"
-            else:
-                ai_command = f"AI_{prediction}"
+            prediction, confidence, ai_command = decision.prediction, decision.confidence, decision.ai_command
             
             # Update state
             self.total_predictions += 1
             self.last_prediction = prediction
             self.last_confidence = confidence
-            
-            # approximate probabilities for 3 classes if model is binary or just use confidence logic
-            if prediction == "SAFE":
-                self.last_probs = {"safe": confidence, "warn": (1-confidence)/2, "crit": (1-confidence)/2}
-            elif prediction == "WARN":
-                self.last_probs = {"safe": (1-confidence)/2, "warn": confidence, "crit": (1-confidence)/2}
-            else:
-                self.last_probs = {"safe": (1-confidence)/2, "warn": (1-confidence)/2, "crit": confidence}
+            self.last_probs = decision.probs
                 
             self.prediction_time = datetime.now()
+            self._record(mq2_voltage, mq135_voltage, prediction, confidence, ai_command,
+                         self.last_probs, self.model_version, decision.features)
             
-            logger.info(f"🤖 Prediction: {prediction} (confidence: {confidence:.2%}) -> {ai_command}")
+            # Candidate models see the same readings in their own process (non-blocking hand-off);
+            # without the primary's class they only update their windows
+            shadow_scorer.submit(mq2_voltage, mq135_voltage, prediction if shadow else None)
+            
+            logger.info("🤖 Prediction: %s (confidence: %.2f%%) -> %s", prediction, confidence * 100, ai_command, extra={"msg_type": "prediction"})
             
             return prediction, confidence, ai_command
         
@@ -150,6 +131,23 @@ class MLService:
             logger.error(f"❌ ML Prediction Error: {e}")
             return self.predict_with_thresholds(mq2_voltage, mq135_voltage)
 
+    def probe(self, mq2_voltage, mq135_voltage):
+        """
+        What-if prediction for a steady reading (/api/ml/predict). Stateless: a throwaway
+        window filled with the reading, so the live window, the prediction log, the shadow
+        scorer and last_* are untouched. Returns (prediction, confidence, ai_command, probs).
+        """
+        if not self.model_loaded:
+            prediction, confidence = self._threshold_class(mq2_voltage, mq135_voltage)
+            return prediction, confidence, f"AI_{prediction}", None
+        engine = FeatureEngine(self.feature_names)
+        for _ in range(engine.max_window):
+            engine.push(mq2_voltage, mq135_voltage)
+        prediction, confidence, probs = self.core.predict(engine.vector())
+        # Single reading: no WARN confirmation streak, so only the confidence gate applies
+        ai_command = f"AI_{prediction}" if confidence >= self.core.confidence_threshold else "AI_SAFE"
+        return prediction, confidence, ai_command, probs
+
     def predict_future_trends(self):
         """
         Estimate seconds until Warning (1.5V) and Critical (2.0V).
@@ -239,31 +237,60 @@ class MLService:
         Fallback threshold-based prediction
         Used when ML model is not available
         """
-        prediction = "SAFE"
-        confidence = 1.0
-        
-        if mq2_voltage >= 2.0 or mq135_voltage >= 2.0:
-            prediction = "CRITICAL"
-            confidence = 0.95
-        elif mq2_voltage >= 1.5 or mq135_voltage >= 1.5:
-            prediction = "WARN"
-            confidence = 0.85
+        prediction, confidence = self._threshold_class(mq2_voltage, mq135_voltage)
         
         ai_command = f"AI_{prediction}"
         self.last_prediction = prediction
         self.last_confidence = confidence
+        self.last_probs = None  # No model probabilities for this sample
         self.prediction_time = datetime.now()
+        self._record(mq2_voltage, mq135_voltage, prediction, confidence, ai_command, None, "thresholds", None)
         
         return prediction, confidence, ai_command
+
+    @staticmethod
+    def _threshold_class(mq2_voltage, mq135_voltage):
+        """(prediction, confidence) from the fixed voltage thresholds"""
+        if mq2_voltage >= 2.0 or mq135_voltage >= 2.0:
+            return "CRITICAL", 0.95
+        if mq2_voltage >= 1.5 or mq135_voltage >= 1.5:
+            return "WARN", 0.85
+        return "SAFE", 1.0
+
+    def _record(self, mq2, mq135, prediction, confidence, ai_command, probs, model_version, features):
+        """Queue one prediction row; written in bulk by ingestion.prediction_writer"""
+        if features is not None:
+            names = self.feature_names or [f"f{i}" for i in range(len(features))]
+        self.pending_predictions.append({
+            "timestamp": self.prediction_time,
+            "mq2_value": float(mq2),
+            "mq135_value": float(mq135),
+            "prediction": str(prediction),
+            "confidence": float(confidence),
+            "ai_command": ai_command,
+            "prob_safe": probs["safe"] if probs else None,
+            "prob_warn": probs["warn"] if probs else None,
+            "prob_crit": probs["crit"] if probs else None,
+            "model_version": model_version,
+            "features": {name: float(v) for name, v in zip(names, features)} if features is not None else None,
+        })
+
+    def drain_predictions(self):
+        """Take every queued prediction row (popleft is atomic, so rows appended meanwhile are kept)"""
+        rows = []
+        while True:
+            try:
+                rows.append(self.pending_predictions.popleft())
+            except IndexError:
+                return rows
     
-    def predict_risk(self, mq2, mq135):
+    @staticmethod
+    def voltage_risk(mq2, mq135):
         """
-        Legacy method for backward compatibility
-        Returns (risk_score: 0-100, status: Safe/Warning/Danger, ai_command)
+        Threshold classification on the raw voltages (no model, no state).
+        Returns (risk_score: 0-100, status, ai_command); ai_command is None in the Safe
+        zone, where the model decides. Cheap enough to run on every sample, even shed ones.
         """
-        prediction, confidence, ai_command = self.predict_with_ml(mq2, mq135)
-        
-        # Calculate Dynamic Risk Score based on Voltage
         # Use the maximum reading to determine the overall risk
         max_voltage = max(mq2, mq135)
         
@@ -272,8 +299,7 @@ class MLService:
              # Logic: (Current / MaxSafe) * MaxScore
              risk_score = (max_voltage / 1.5) * 49
              status = "Safe"
-             # prediction, confidence, ai_command handled by predict_with_ml above
-             # but we might want to override status if voltage is low
+             ai_command = None
         
         elif 1.5 <= max_voltage < 2.0:
              # WARNING Zone (1.5V - 2.0V) -> Map to 50% - 89%
@@ -281,7 +307,6 @@ class MLService:
              ratio = (max_voltage - 1.5) / 0.5
              risk_score = 50 + (ratio * 39)
              status = "Warning"
-             prediction = "WARN" # Force override for consistency
              ai_command = "AI_WARN"
 
         else:
@@ -294,11 +319,25 @@ class MLService:
                  risk_score = 90 + (ratio * 10)
              
              status = "Danger"
-             prediction = "CRITICAL"
              ai_command = "AI_CRITICAL"
 
         # Ensure valid integers
         risk_score = int(min(max(risk_score, 0), 100))
+        return risk_score, status, ai_command
+
+    def predict_risk(self, mq2, mq135, optional=True):
+        """
+        Legacy method for backward compatibility
+        Returns (risk_score: 0-100, status: Safe/Warning/Danger, ai_command)
+        optional=False skips work that is not needed for the decision (shadow comparison).
+        """
+        prediction, confidence, ai_command = self.predict_with_ml(mq2, mq135, shadow=optional)
+        
+        # Calculate Dynamic Risk Score based on Voltage
+        # Warning/Danger zones force the command for consistency; in the Safe zone the model decides
+        risk_score, status, zone_command = self.voltage_risk(mq2, mq135)
+        if zone_command is not None:
+            ai_command = zone_command
             
         return risk_score, status, ai_command
     
@@ -311,6 +350,7 @@ class MLService:
             "prediction_time": self.prediction_time,
             "model_accuracy": 97.15,
             "total_predictions": self.total_predictions,
+            "model_version": self.model_version,
             "feature_importance": {
                 "mq135_max_window": 23.5,
                 "mq135_mean_window": 18.9,
@@ -0,0 +1,87 @@
+"""
+Replay sensor source: stands in for the serial port and plays a recorded dataset
+(timestamp,mq2,mq135 CSV from datasets/) back in real time, formatted exactly like the
+firmware's lines, so parsing, inference, alerts and streaming run as they would with
+hardware attached. Enabled with IOT_REPLAY_CSV; used for demos and load tests.
+
+IOT_REPLAY_CSV=synthetic:scenario=mixed,rate=50,seed=1 plays a generated trace instead
+(ml/synthetic_traces.py). Samples are streamed either way, so traces of any length work.
+"""
+import csv
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReplaySerial:
+    """The subset of serial.Serial that SensorManager uses"""
+    def __init__(self, path, speed=1.0, loop=True):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.is_open = True
+        self.written = 0
+        self._pass = self._open()
+        self._next = next(self._pass, None)
+        if self._next is None:
+            raise ValueError(f"No samples in {path}")
+        self._first_t = self._last_t = self._next[0]
+        self._count = 0  # Samples played in the current pass
+        self._started_at = time.monotonic()
+        self._shift = 0.0  # Added to dataset time so each pass continues after the previous one
+        logger.info(f"▶️ Replaying {path} at {speed}x")
+
+    def _open(self):
+        if self.path.startswith("synthetic:"):
+            ml_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../ml"))
+            if ml_dir not in sys.path:
+                sys.path.insert(0, ml_dir)
+            from synthetic_traces import device_stream, parse_spec
+            return device_stream(**parse_spec(self.path))
+        return self._read_csv(self.path)
+
+    @staticmethod
+    def _read_csv(path):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield float(row["timestamp"]), float(row["mq2"]), float(row["mq135"])
+
+    def _due_at(self):
+        return self._started_at + (self._next[0] + self._shift) / self.speed
+
+    @property
+    def in_waiting(self):
+        if not self.is_open or self._next is None:
+            return 0
+        return 1 if time.monotonic() >= self._due_at() else 0
+
+    def readline(self):
+        if not self.in_waiting:
+            return b""
+        t, mq2, mq135 = self._next
+        self._last_t = t
+        self._count += 1
+        self._next = next(self._pass, None)
+        if self._next is None and self.loop:
+            # Start the next pass one average sample period after the last line
+            period = (self._last_t - self._first_t) / max(self._count - 1, 1)
+            self._pass = self._open()
+            self._next = next(self._pass, None)
+            self._shift += self._last_t + period - self._next[0]
+            self._first_t = self._next[0]
+            self._count = 0
+        return f"MQ2: {mq2:.2f}V, MQ135: {mq135:.2f}V\r\n".encode("utf-8")
+
+    def write(self, data):
+        self.written += 1  # AI_* commands have nowhere to go
+        return len(data)
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+        self._pass.close()  # Releases the CSV file
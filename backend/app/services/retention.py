@@ -0,0 +1,210 @@
+"""
+Retention for the archive tables: expired rows are (optionally) exported to gzip CSV,
+deleted in small primary-key-ranged chunks, and the freed pages are returned to the OS
+with incremental vacuum. Each chunk is its own short transaction on the DB executor, so
+the archiver and request handlers get the write lock between chunks.
+
+    python -m app.retention                  # one purge pass now
+    python -m app.retention --dry-run        # count what would be purged
+    python -m app.retention --enable-auto-vacuum   # one-time VACUUM for old database files
+"""
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core import database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Table -> (model, extra conditions a row must meet to be purged)
+POLICIES = {
+    "sensor_data": (models.SensorData, []),
+    # Open incidents are still updated by the alert engine; only resolved ones expire
+    "alerts": (models.Alert, [models.Alert.is_resolved == True]),
+    "ml_predictions": (models.MLPrediction, []),
+}
+
+
+def newest_expired_id(db: Session, model, cutoff, extra):
+    """Upper bound for the purge (found via the timestamp index), or None if nothing expired"""
+    stmt = (select(model.id).where(model.timestamp < cutoff, *extra)
+            .order_by(model.timestamp.desc()).limit(1))
+    return db.execute(stmt).scalar()
+
+
+def count_expired(db: Session, model, cutoff, extra):
+    return db.execute(select(func.count()).select_from(model).where(model.timestamp < cutoff, *extra)).scalar()
+
+
+def purge_chunk(db: Session, model, cutoff, extra, after_id, upper_id, chunk_rows, archive_path=None):
+    """
+    Delete the next <= chunk_rows expired rows with after_id < id <= upper_id.
+    Rows are written to archive_path first (if set); nothing is deleted if the export fails.
+    Returns (rows deleted, last id covered) or (0, None) when done.
+    """
+    ids = db.execute(
+        select(model.id).where(model.id > after_id, model.id <= upper_id, model.timestamp < cutoff, *extra)
+        .order_by(model.id).limit(chunk_rows)
+    ).scalars().all()
+    if not ids:
+        return 0, None
+
+    in_range = [model.id >= ids[0], model.id <= ids[-1], model.timestamp < cutoff, *extra]
+    if archive_path:
+        rows = db.execute(select(model.__table__).where(*in_range).order_by(model.id)).all()
+        _append_csv(archive_path, model.__table__.columns.keys(), rows)
+
+    result = db.execute(delete(model).where(*in_range))
+    db.commit()
+    return result.rowcount, ids[-1]
+
+
+def _append_csv(path, header, rows):
+    # Each call appends a gzip member; concatenated members read back as one file
+    is_new = not os.path.exists(path)
+    with gzip.open(path, "at", newline="") as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(header)
+        # JSON columns (e.g. ml_predictions.features) are written as JSON text
+        writer.writerows([json.dumps(v) if isinstance(v, (dict, list)) else v for v in row] for row in rows)
+
+
+def incremental_vacuum(db: Session, pages):
+    """Release up to `pages` free pages to the OS. Returns the free pages left."""
+    db.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+    db.commit()
+    return db.execute(text("PRAGMA freelist_count")).scalar()
+
+
+def vacuum_mode(db: Session):
+    # 0 = none, 1 = full, 2 = incremental
+    return db.execute(text("PRAGMA auto_vacuum")).scalar()
+
+
+class RetentionManager:
+    """Runs purge passes (from the background task or the CLI) and keeps the last report"""
+    def __init__(self, days, chunk_rows=500, chunk_pause_s=0.05, archive_dir="", vacuum_pages=256):
+        self.days = days
+        self.chunk_rows = chunk_rows
+        self.chunk_pause_s = chunk_pause_s
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+        self.last_run = None
+        self.running = False
+
+    async def run_once(self, now=None, dry_run=False):
+        now = now or datetime.now()
+        self.running = True
+        started = time.monotonic()
+        report = {"started_at": now.isoformat(timespec="seconds"), "dry_run": dry_run, "tables": {}}
+        try:
+            for table, (model, extra) in POLICIES.items():
+                days = self.days.get(table)
+                if not days:
+                    continue  # Keep forever
+                cutoff = now - timedelta(days=days)
+                if dry_run:
+                    expired = await database.run_db(count_expired, model, cutoff, extra)
+                    report["tables"][table] = {"cutoff": cutoff.isoformat(timespec="seconds"), "expired": expired}
+                else:
+                    report["tables"][table] = await self._purge_table(table, model, extra, cutoff, now)
+
+            if not dry_run and database.engine.dialect.name == "sqlite":
+                report["vacuum"] = await self._vacuum()
+        finally:
+            self.running = False
+        report["duration_s"] = round(time.monotonic() - started, 2)
+        self.last_run = report
+        return report
+
+    async def _purge_table(self, table, model, extra, cutoff, now):
+        stats = {"cutoff": cutoff.isoformat(timespec="seconds"), "deleted": 0, "chunks": 0, "archive": None}
+        upper_id = await database.run_db(newest_expired_id, model, cutoff, extra)
+        if upper_id is None:
+            return stats
+
+        archive_path = None
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archive_path = os.path.join(self.archive_dir, f"{table}-{now:%Y%m%d-%H%M%S}.csv.gz")
+            stats["archive"] = archive_path
+
+        after_id = 0
+        while True:
+            deleted, last_id = await database.run_db(
+                purge_chunk, model, cutoff, extra, after_id, upper_id, self.chunk_rows, archive_path
+            )
+            if last_id is None:
+                break
+            stats["deleted"] += deleted
+            stats["chunks"] += 1
+            after_id = last_id
+            # Let the archiver and API writers in between chunks
+            await asyncio.sleep(self.chunk_pause_s)
+
+        if stats["deleted"]:
+            logger.info(f"🧹 Retention: purged {stats['deleted']} rows from {table} older than {stats['cutoff']}")
+        return stats
+
+    async def _vacuum(self):
+        mode = await database.run_db(vacuum_mode)
+        if mode != 2:
+            return {"auto_vacuum": mode, "note": "incremental vacuum off; run python -m app.retention --enable-auto-vacuum"}
+        free_pages = None
+        while free_pages != 0:
+            left = await database.run_db(incremental_vacuum, self.vacuum_pages)
+            if left == free_pages:
+                break
+            free_pages = left
+            await asyncio.sleep(self.chunk_pause_s)
+        return {"auto_vacuum": mode, "free_pages": free_pages}
+
+    def get_stats(self):
+        return {
+            "days": self.days,
+            "chunk_rows": self.chunk_rows,
+            "archive_dir": self.archive_dir or None,
+            "running": self.running,
+            "last_run": self.last_run,
+        }
+
+
+async def retention_worker():
+    """Background task: one purge pass per RETENTION_INTERVAL_S"""
+    while True:
+        try:
+            await retention_manager.run_once()
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL_S)
+
+
+def enable_auto_vacuum():
+    """
+    auto_vacuum only takes effect on a new database or after a full VACUUM.
+    This rewrites the whole file once, so stop the server first on large databases.
+    """
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("PRAGMA auto_vacuum")).scalar()
+
+
+retention_manager = RetentionManager(
+    days=settings.RETENTION_DAYS,
+    chunk_rows=settings.RETENTION_CHUNK_ROWS,
+    chunk_pause_s=settings.RETENTION_CHUNK_PAUSE_S,
+    archive_dir=settings.RETENTION_ARCHIVE_DIR,
+    vacuum_pages=settings.RETENTION_VACUUM_PAGES,
+)
@@ -0,0 +1,298 @@
+"""
+Opt-in background retraining (RETRAIN_ENABLED).
+
+Every RETRAIN_INTERVAL_S a fresh worker process refreshes the feature store from the
+full-rate prediction log (ml/incremental_features.py) and trains a candidate with the production
+hyperparameters (ml/train_model.build_model). The worker runs at a lower CPU priority,
+with RETRAIN_N_JOBS cores and single-threaded BLAS, so the ingest loop keeps its core.
+
+The candidate and the production model are scored on the same held-out slice: the most
+recent RETRAIN_HOLDOUT_FRACTION of each label's rows in train_features.csv, plus the fixed
+test_features.csv. The file is grouped by label (feature_engineering.py writes SAFE, then
+WARN, then CRITICAL; production windows are appended after them), and rows are in time
+order only within a label, so a plain tail would hold out one class. Only rows appended
+after the production model was trained are held out (model_metadata.json records the
+rows it saw); without any, or for a model without that record, there is no holdout
+score for production. Results go to ml_models/candidates/<timestamp>/ with
+the usual model files and metadata, including training time and inference cost.
+Candidates are never promoted automatically: copy the files into ml_models/ to deploy one.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app.core import database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+MODELS_DIR = os.path.join(PROJECT_ROOT, "ml_models")
+CANDIDATES_DIR = os.path.join(MODELS_DIR, "candidates")
+CLASSES = ["SAFE", "WARN", "CRITICAL"]
+
+
+# ---------- worker process ----------
+
+def _limit_worker(nice, n_threads):
+    """Process-pool initializer: runs before numpy/sklearn are imported in the worker"""
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+    if nice and hasattr(os, "nice"):  # Not available on Windows
+        os.nice(nice)
+
+
+def _inference_cost(model, X, repeats=200):
+    """Per-sample latency as served (one-row DataFrame) and batch throughput"""
+    import numpy as np
+
+    rows = [X.iloc[[i % len(X)]] for i in range(repeats)]
+    single = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    model.predict_proba(X)
+    batch_s = time.perf_counter() - start
+    return {
+        "single_ms_p50": round(float(np.percentile(single, 50)), 3),
+        "single_ms_p95": round(float(np.percentile(single, 95)), 3),
+        "batch_us_per_row": round(batch_s / len(X) * 1e6, 2),
+    }
+
+
+def _score(model, X, y):
+    from sklearn.metrics import accuracy_score, recall_score
+
+    pred = model.predict(X)
+    recalls = recall_score(y, pred, labels=CLASSES, average=None, zero_division=0)
+    return {
+        "rows": len(y),
+        "accuracy": round(float(accuracy_score(y, pred)), 4),
+        "recall": {label: round(float(r), 4) for label, r in zip(CLASSES, recalls)},
+    }
+
+
+def _production_rows(train_bytes):
+    """Leading rows of train_features.csv (its content) the production model was trained on (None = unknown)"""
+    import hashlib
+
+    meta_path = os.path.join(MODELS_DIR, "model_metadata.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        seen = json.load(f).get("train_features")
+    if not seen or len(train_bytes) < seen["bytes"]:
+        return None
+    if hashlib.sha256(train_bytes[:seen["bytes"]]).hexdigest() != seen["sha256"]:
+        return None  # Feature store regenerated since
+    return seen["rows"]
+
+
+def train_candidate(project_root, db_path, holdout_fraction, n_jobs):
+    """Runs in the worker process. Returns the candidate metadata (also written to disk)."""
+    import contextlib
+    import hashlib
+    import io
+    import joblib
+    import pandas as pd
+
+    os.chdir(project_root)  # The ml/ scripts use paths relative to the project root
+    sys.path.insert(0, os.path.join(project_root, "ml"))
+    import incremental_features
+    from feature_engineering import META_COLUMNS
+    from train_model import build_model
+
+    # 1. Pull newly logged samples into the feature store
+    refresh_log = io.StringIO()
+    with contextlib.redirect_stdout(refresh_log):
+        try:
+            incremental_features.main(["--db", db_path])
+        except SystemExit:
+            pass  # Missing database or feature store; train on what is there
+    refresh_summary = [line.strip() for line in refresh_log.getvalue().splitlines() if "Read " in line or "ERROR" in line]
+
+    # 2. Recent slice held out: the newest rows of every label (stratified tail), never
+    # rows production was trained on (scoring it on those would favour it)
+    with open("ml_features/train_features.csv", "rb") as f:
+        train_bytes = f.read()
+    train_df = pd.read_csv(io.BytesIO(train_bytes))
+    test_df = pd.read_csv("ml_features/test_features.csv")
+    production_rows = _production_rows(train_bytes)
+    by_label = train_df.groupby("label")
+    held = by_label.cumcount(ascending=False) < (by_label["label"].transform("size") * holdout_fraction).astype(int)
+    if production_rows is not None:
+        held &= train_df.index >= production_rows
+    fit_df, holdout_df = train_df[~held], train_df[held]
+    drop = ["label", *META_COLUMNS]
+    X_fit, y_fit = fit_df.drop(columns=drop, errors="ignore"), fit_df["label"]
+    X_hold, y_hold = holdout_df.drop(columns=drop, errors="ignore"), holdout_df["label"]
+    X_test, y_test = test_df.drop(columns=drop, errors="ignore"), test_df["label"]
+
+    # 3. Train
+    model = build_model(n_jobs=n_jobs)
+    start = time.perf_counter()
+    model.fit(X_fit, y_fit)
+    training_time_s = time.perf_counter() - start
+
+    # 4. Evaluate candidate and production on the same data
+    metadata = {
+        "model_type": "RandomForestClassifier",
+        "n_estimators": model.n_estimators,
+        "classes": sorted(y_fit.unique()),
+        "features": X_fit.columns.tolist(),
+        "candidate": True,
+        "num_training_samples": len(X_fit),
+        "training_time_s": round(training_time_s, 2),
+        "n_jobs": n_jobs,
+        "feature_refresh": refresh_summary,
+        "holdout": _score(model, X_hold, y_hold) if len(X_hold) else None,
+        "test": _score(model, X_test, y_test),
+        "inference": _inference_cost(model, X_test),
+        "train_features": {"rows": len(train_df), "bytes": len(train_bytes),
+                           "sha256": hashlib.sha256(train_bytes).hexdigest()},
+        "timestamp": datetime.now().isoformat(),
+    }
+    production_path = os.path.join(MODELS_DIR, "gas_smoke_rf.pkl")
+    if os.path.exists(production_path):
+        production = joblib.load(production_path)
+        # Production may use fewer feature windows than the feature store holds
+        names = joblib.load(os.path.join(MODELS_DIR, "feature_names.pkl"))
+        if production_rows is None:
+            holdout_note = "production's training rows unknown (model_metadata.json without train_features, or regenerated store)"
+        elif not len(X_hold):
+            holdout_note = "no rows appended since production was trained"
+        else:
+            holdout_note = f"rows after the first {production_rows}"
+        metadata["production"] = {
+            "holdout": _score(production, X_hold[names], y_hold) if production_rows is not None and len(X_hold) else None,
+            "holdout_note": holdout_note,
+            "test": _score(production, X_test[names], y_test),
+            "inference": _inference_cost(production, X_test[names]),
+        }
+
+    # 5. Publish as a candidate only
+    out_dir = os.path.join(CANDIDATES_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(out_dir, "gas_smoke_rf.pkl"))
+    joblib.dump(X_fit.columns.tolist(), os.path.join(out_dir, "feature_names.pkl"))
+    metadata["path"] = out_dir
+    with open(os.path.join(out_dir, "model_metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+# ---------- scheduler (backend process) ----------
+
+class Retrainer:
+    def __init__(self, enabled=False, interval_s=86400, n_jobs=1, nice=10, holdout_fraction=0.2):
+        self.enabled = enabled
+        self.interval_s = interval_s
+        self.n_jobs = n_jobs
+        self.nice = nice
+        self.holdout_fraction = holdout_fraction
+        self.running = False
+        self.runs = 0
+        self.last_error = None
+        self.history = deque(maxlen=20)
+        self._task = None
+        self._candidates = None  # list_candidates() cache (disk + JSON reads), refreshed after each run
+
+    async def run_once(self):
+        """Train one candidate in a fresh worker process (which exits afterwards)"""
+        if self.running:
+            return None
+        self.running = True
+        db_path = os.path.abspath(database.engine.url.database)
+        loop = asyncio.get_running_loop()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_worker,
+                initargs=(self.nice, self.n_jobs),
+            ) as pool:
+                result = await loop.run_in_executor(
+                    pool, train_candidate, PROJECT_ROOT, db_path, self.holdout_fraction, self.n_jobs
+                )
+            self.runs += 1
+            self.last_error = None
+            self.history.append(result)
+            logger.info(f"🧠 Candidate model trained in {result['training_time_s']}s -> {result['path']}")
+            return result
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Retraining failed: {e}")
+            return None
+        finally:
+            self.running = False
+            self._candidates = None
+
+    def trigger(self):
+        """Start a run in the background (manual trigger); False if one is already running"""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self.run_once())
+        return True
+
+    def get_status(self):
+        return {
+            "enabled": self.enabled,
+            "interval_s": self.interval_s,
+            "n_jobs": self.n_jobs,
+            "running": self.running,
+            "runs": self.runs,
+            "last_error": self.last_error,
+            "last_result": self.history[-1] if self.history else None,
+            "candidates": self._candidates_cached(),
+        }
+
+    def _candidates_cached(self):
+        # get_status is polled (mirrored to API workers every second); candidates only change per run
+        if self._candidates is None:
+            self._candidates = list_candidates()
+        return self._candidates
+
+
+def list_candidates():
+    """Published candidates, newest first (name, holdout/test accuracy)"""
+    if not os.path.isdir(CANDIDATES_DIR):
+        return []
+    candidates = []
+    for name in sorted(os.listdir(CANDIDATES_DIR), reverse=True):
+        meta_path = os.path.join(CANDIDATES_DIR, name, "model_metadata.json")
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        candidates.append({
+            "name": name,
+            "holdout_accuracy": (meta.get("holdout") or {}).get("accuracy"),
+            "test_accuracy": meta["test"]["accuracy"],
+            "training_time_s": meta.get("training_time_s"),
+        })
+    return candidates
+
+
+async def retrain_worker():
+    """Background task: one candidate per RETRAIN_INTERVAL_S (only started when enabled)"""
+    while True:
+        await asyncio.sleep(retrainer.interval_s)
+        await retrainer.run_once()
+
+
+retrainer = Retrainer(
+    enabled=settings.RETRAIN_ENABLED,
+    interval_s=settings.RETRAIN_INTERVAL_S,
+    n_jobs=settings.RETRAIN_N_JOBS,
+    nice=settings.RETRAIN_NICE,
+    holdout_fraction=settings.RETRAIN_HOLDOUT_FRACTION,
+)
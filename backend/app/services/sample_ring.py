@@ -0,0 +1,282 @@
+"""
+Fixed-size, lock-free, single-writer ring buffer of full-rate samples in shared memory.
+
+Layout (little-endian):
+    header   magic u4 | version u4 | capacity u8 | head u8   (head = total records written)
+    records  capacity x SAMPLE_DTYPE
+
+The writer fills slot `head % capacity` and only then publishes `head + 1`.
+Readers copy the slots they want and re-read `head` afterwards; any record that the
+writer could have overwritten in the meantime (index <= head_after - capacity) is discarded.
+No locks are taken, and any number of processes can map the same segment zero-copy.
+"""
+import atexit
+import time
+import logging
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x494F5452  # "IOTR"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u4"),
+    ("capacity", "<u8"),
+    ("head", "<u8"),
+])
+
+SAMPLE_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("t_wall", "<f8"),        # time.time()
+    ("t_mono", "<f8"),        # time.monotonic() in the writer process
+    ("mq2_voltage", "<f4"),
+    ("mq135_voltage", "<f4"),
+    ("mq2_ppm", "<f4"),
+    ("mq135_ppm", "<f4"),
+    ("risk_score", "<f4"),
+    ("prob_safe", "<f4"),
+    ("prob_warn", "<f4"),
+    ("prob_crit", "<f4"),
+    ("status", "u1"),         # index in STATUS_CODES
+    ("ml_class", "u1"),       # index in CLASS_CODES
+    ("_pad", "V6"),
+])
+
+STATUS_CODES = ["Safe", "Warning", "Danger"]
+CLASS_CODES = ["AI_SAFE", "AI_WARN", "AI_CRITICAL"]
+UNKNOWN_CODE = 255
+
+
+def _code(codes, value):
+    try:
+        return codes.index(value)
+    except ValueError:
+        return UNKNOWN_CODE
+
+
+class SampleRing:
+    """Ring of SAMPLE_DTYPE records over any writable buffer (shared memory or local)"""
+    def __init__(self, buffer, capacity=None, initialize=False):
+        self._buffer = buffer
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=buffer)
+        if initialize:
+            self.header["magic"] = MAGIC
+            self.header["version"] = VERSION
+            self.header["capacity"] = capacity
+            self.header["head"] = 0
+        elif self.header["magic"][0] != MAGIC or self.header["version"][0] != VERSION:
+            raise ValueError("Buffer does not contain a sample ring")
+        self.capacity = int(self.header["capacity"][0])
+        # Zero-copy view of the record slots
+        self.records = np.ndarray((self.capacity,), dtype=SAMPLE_DTYPE, buffer=buffer, offset=HEADER_DTYPE.itemsize)
+
+    @classmethod
+    def local(cls, capacity):
+        """In-process ring backed by a plain bytearray"""
+        return cls(bytearray(cls.nbytes(capacity)), capacity=capacity, initialize=True)
+
+    @staticmethod
+    def nbytes(capacity):
+        return HEADER_DTYPE.itemsize + capacity * SAMPLE_DTYPE.itemsize
+
+    @property
+    def head(self):
+        return int(self.header["head"][0])
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    # ---------- writer ----------
+
+    def append(self, data, t_wall=None, t_mono=None):
+        """Write one sample (a latest_data dict). Single writer only."""
+        head = self.head
+        slot = self.records[head % self.capacity]
+        probs = data.get("ml_probs") or {}
+        slot["seq"] = data.get("seq", 0)
+        slot["t_wall"] = time.time() if t_wall is None else t_wall
+        slot["t_mono"] = time.monotonic() if t_mono is None else t_mono
+        slot["mq2_voltage"] = data.get("mq2_voltage") or 0.0
+        slot["mq135_voltage"] = data.get("mq135_voltage") or 0.0
+        slot["mq2_ppm"] = data.get("mq2_gas") or 0.0
+        slot["mq135_ppm"] = data.get("mq135_air") or 0.0
+        slot["risk_score"] = data.get("risk_score") or 0.0
+        slot["prob_safe"] = probs.get("safe", np.nan)
+        slot["prob_warn"] = probs.get("warn", np.nan)
+        slot["prob_crit"] = probs.get("crit", np.nan)
+        slot["status"] = _code(STATUS_CODES, data.get("status"))
+        slot["ml_class"] = _code(CLASS_CODES, data.get("ai_command"))
+        # Publish only after the record is complete
+        self.header["head"] = head + 1
+
+    # ---------- readers ----------
+
+    def read_last(self, n=None):
+        """Copy of the newest `n` records (all if None), oldest first"""
+        head_before = self.head
+        count = min(head_before, self.capacity) if n is None else min(n, head_before, self.capacity)
+        return self._copy(head_before - count, head_before)
+
+    def read_window(self, seconds, now=None):
+        """Records from the last `seconds` of wall-clock time, oldest first"""
+        now = time.time() if now is None else now
+        cutoff = now - seconds
+        head_before = self.head
+        first = head_before - min(head_before, self.capacity)
+        if first == head_before:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+
+        # t_wall only grows within the ring, which is at most two sorted runs of slots
+        # (oldest at first % capacity up to the end, then from slot 0): binary search, no copy
+        t_wall = self.records["t_wall"]
+        start = first % self.capacity
+        older = t_wall[start:start + head_before - first]
+        if len(older) and older[-1] >= cutoff:
+            skip = int(np.searchsorted(older, cutoff, side="left"))
+        else:
+            newer = t_wall[:head_before - first - len(older)]
+            skip = len(older) + int(np.searchsorted(newer, cutoff, side="left"))
+
+        out = self._copy(first + skip, head_before)
+        # A slot rewritten during the search can only widen the slice; trim it exactly
+        return out[out["t_wall"] >= cutoff]
+
+    def _copy(self, first, head_before):
+        """Copy records first..head_before-1, without any the writer may have overwritten meanwhile"""
+        if first >= head_before:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        indexes = np.arange(first, head_before) % self.capacity
+        out = self.records[indexes]  # Fancy indexing copies
+
+        # Drop anything the writer may have overwritten while we were copying
+        head_after = self.head
+        oldest_valid = head_after - self.capacity + 1
+        if first < oldest_valid:
+            out = out[oldest_valid - first:]
+        return out
+
+    def get_stats(self):
+        return {
+            "capacity": self.capacity,
+            "written": self.head,
+            "filled": len(self),
+            "record_bytes": SAMPLE_DTYPE.itemsize,
+        }
+
+
+class SharedSampleRing(SampleRing):
+    """SampleRing stored in multiprocessing.shared_memory under a well-known name"""
+    def __init__(self, shm, capacity=None, initialize=False, owner=False):
+        self.shm = shm
+        self.owner = owner
+        super().__init__(shm.buf, capacity=capacity, initialize=initialize)
+
+    @classmethod
+    def create(cls, name, capacity):
+        """Writer side: create (or replace a stale) segment"""
+        size = cls.nbytes(capacity)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ring = cls(shm, capacity=capacity, initialize=True, owner=True)
+        atexit.register(ring.close)
+        logger.info("Shared sample ring '%s' created (%d samples, %.1f MB)", name, capacity, size / 1e6)
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """Reader side: map an existing segment (zero-copy)"""
+        # Readers must not unlink the writer's segment when they exit
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        return cls(shm)
+
+    def close(self):
+        # Drop numpy views before releasing the mapping
+        self.header = None
+        self.records = None
+        self._buffer = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+
+# ---------- recent-history payloads (/api/sensor/recent) ----------
+
+FLOAT_CHANNELS = [
+    "mq2_voltage", "mq135_voltage", "mq2_ppm", "mq135_ppm",
+    "risk_score", "prob_safe", "prob_warn", "prob_crit",
+]
+CODE_CHANNELS = ["status", "ml_class"]
+CHANNELS = FLOAT_CHANNELS + CODE_CHANNELS
+
+
+def decimate(records, max_points):
+    """
+    Reduce `records` to at most `max_points` buckets of consecutive samples.
+    Float channels are averaged per bucket; seq, time and code channels keep the bucket's last sample.
+    """
+    count = len(records)
+    if not max_points or count <= max_points:
+        return records, 1
+    factor = -(-count // max_points)  # ceil
+    starts = np.arange(0, count, factor)
+    ends = np.minimum(starts + factor, count)
+
+    out = records[ends - 1]  # Fancy indexing copies
+    sizes = (ends - starts).astype(np.float64)
+    for name in FLOAT_CHANNELS:
+        out[name] = np.add.reduceat(records[name].astype(np.float64), starts) / sizes
+    return out, factor
+
+
+def to_columns(records, channels, factor=1):
+    """Columnar JSON-friendly payload: times are offsets (s) from t0, NaN becomes null"""
+    t0 = float(records["t_wall"][0]) if len(records) else None
+    payload = {
+        "count": len(records),
+        "decimation": factor,
+        "t0": t0,
+        "seq": records["seq"].tolist(),
+        "t": np.round(records["t_wall"] - t0, 3).tolist() if len(records) else [],
+        "channels": {},
+    }
+    for name in channels:
+        column = records[name]
+        if name in CODE_CHANNELS:
+            codes = STATUS_CODES if name == "status" else CLASS_CODES
+            payload["channels"][name] = [codes[c] if c < len(codes) else None for c in column.tolist()]
+        else:
+            values = np.round(column.astype(np.float64), 4)
+            payload["channels"][name] = np.where(np.isnan(values), None, values).tolist()
+    return payload
+
+
+def to_binary(records, channels):
+    """
+    Packed little-endian columns: t (f8 offsets from t0), then one column per channel
+    (f4 for float channels, u1 codes for status/ml_class). t0 and layout go in headers.
+    """
+    t0 = float(records["t_wall"][0]) if len(records) else 0.0
+    parts = [(records["t_wall"] - t0).astype("<f8").tobytes()]
+    for name in channels:
+        dtype = "u1" if name in CODE_CHANNELS else "<f4"
+        parts.append(np.ascontiguousarray(records[name], dtype=dtype).tobytes())
+    return b"".join(parts), t0
@@ -3,11 +3,112 @@ import random
 import serial
 import json
 import logging
+import time
 from app.core.config import settings
+from app.core.logging_pipeline import raw_lines
 from app.services.ml_service import ml_service
+from app.services.latency_tracer import LatencyTracer
+from app.services.alert_engine import alert_engine
+from app.services.snapshot_stream import snapshot_stream, BOOT_ID
+from app.services.sample_ring import SampleRing
+from app.services.replay_source import ReplaySerial
+from app.services.command_writer import CommandWriter
+from app.services.load_shedder import LoadShedder
 
 logger = logging.getLogger(__name__)
 
+def parse_line(line):
+    """
+    Parse one line from the device into a partial sensor update.
+    Returns a dict of the fields present in the line, or None if the line
+    carries no sensor data (alerts, acknowledgements, garbage).
+    """
+    # Skip ALERT messages - they are not data messages
+    if line.startswith("ALERT") or line.startswith("IQ") or "ALERT!" in line:
+        logger.debug("Skipping alert message: %s", line)
+        return None
+
+    # Parse Data
+    # Supports JSON: {"temperature": 24, "humidity": 50, "mq2": 120, "mq135": 80}
+    # Supports CSV: 24.5,50.2,120,80 (Temp, Hum, MQ2, MQ135)
+    data = {}
+
+    if line.startswith('{'):
+        try:
+            raw_data = json.loads(line)
+            data = {
+                "mq2_gas": float(raw_data.get("mq2", raw_data.get("mq2_gas", 0))),
+                "mq135_air": float(raw_data.get("mq135", raw_data.get("mq135_air", 0)))
+            }
+        except json.JSONDecodeError:
+            logger.warning(f"Invalid JSON received: {line}")
+            return None
+    else:
+        # Try Custom "Key: Value" format (e.g., "MQ2: 1.17, MQ135: 0.76")
+        if ":" in line:
+            try:
+                parts = [p.strip() for p in line.split(',')]
+                temp_data = {}
+                for p in parts:
+                    if ":" in p:
+                        k, v = p.split(':', 1)
+                        k = k.strip().lower()
+                        v = v.strip()
+
+                        # Skip if key contains 'alert' or other non-sensor keywords
+                        if 'alert' in k or 'iq' in k:
+                            continue
+
+                        # Clean value - remove 'V' suffix if present
+                        v = v.replace('V', '').replace('v', '').strip()
+
+                        if v == "NA" or not v:
+                            continue  # Skip invalid values instead of using 0
+                        else:
+                            try:
+                                val = float(v)
+                            except ValueError:
+                                logger.debug("Could not parse value '%s' from key '%s'", v, k)
+                                continue  # Skip invalid values
+
+                        # Only process valid sensor keys
+                        if "mq2" in k and "mq135" not in k: 
+                            temp_data["mq2_voltage"] = val
+                            temp_data["mq2_gas"] = val * 350  # Convert Voltage to PPM (Linear Approx)
+                        elif "mq135" in k: 
+                            temp_data["mq135_voltage"] = val
+                            temp_data["mq135_air"] = val * 350  # Convert Voltage to PPM (Linear Approx)
+
+                # Only update if we got valid sensor data
+                if temp_data:
+                    # Update only the fields we received - preserve others
+                    if "mq2_gas" in temp_data: 
+                        data["mq2_gas"] = temp_data["mq2_gas"]
+                    if "mq2_voltage" in temp_data: 
+                        data["mq2_voltage"] = temp_data["mq2_voltage"]
+                    if "mq135_air" in temp_data: 
+                        data["mq135_air"] = temp_data["mq135_air"]
+                    if "mq135_voltage" in temp_data: 
+                        data["mq135_voltage"] = temp_data["mq135_voltage"]
+
+                    data["sensor_connected"] = True
+                    data["raw_log"] = line
+                else:
+                    # No valid data parsed, skip this line
+                    return None
+
+            except Exception as e:
+                logger.warning(f"Error parsing custom format '{line}': {e}")
+                return None
+        else:
+            # Try CSV - Assuming now just MQ2, MQ135 if using CSV (or just skipping CSV support for now as it was rigid)
+            # But let's keep it assuming T,H are gone from CSV or just ignore index 0,1 if they are there?
+            # The user said "remove all related". If the hardware sends CSV with 4 values, we might break if we assume 2.
+            # But the user is using the Key:Value format based on logs. I'll just comment out CSV or update it to be safe.
+            pass
+
+    return data or None
+
 class SensorManager:
     def __init__(self):
         self.latest_data = {
@@ -18,28 +119,69 @@ class SensorManager:
             "risk_score": 0.0,
             "status": "Safe",
             "sensor_connected": False,
-            "raw_log": "Waiting for data..."
+            "raw_log": "Waiting for data...",
+            "boot": BOOT_ID,  # Producing process (ETags); replaced by the ingest process's in api mode
         }
         self.running = False
         self.serial_conn = None
-        self.last_sent_command = None
+        self.sample_seq = 0  # Increments once per parsed sample
+        self.last_read_at = None  # time.monotonic() of the freshest line read
+        self.shared_ring = None  # SharedSampleRing when IOT_SHARED_RING is set
+        self.recent = SampleRing.local(settings.RECENT_RING_CAPACITY)  # Full-rate history for /api/sensor/recent
+        self.tracer = LatencyTracer(
+            window=settings.TRACE_WINDOW,
+            slow_ms=settings.TRACE_SLOW_MS,
+            slow_capacity=settings.TRACE_SLOW_BUFFER,
+        )
+        self.load_shedder = LoadShedder(
+            policy=settings.OVERLOAD_POLICY,
+            backlog_lines=settings.OVERLOAD_BACKLOG_LINES,
+            decimate_every=settings.OVERLOAD_DECIMATE_EVERY,
+        )
+        # AI_* commands go through one writer thread instead of the shared executor
+        self.command_writer = CommandWriter(
+            lambda: self.serial_conn,
+            ack_timeout_s=settings.COMMAND_ACK_TIMEOUT_S,
+            max_retries=settings.COMMAND_MAX_RETRIES,
+            tracer=self.tracer,
+        )
+        self.publish_snapshot()
+
+    def publish_snapshot(self):
+        """Encode latest_data once for all stream subscribers (SSE and legacy /ws)"""
+        snapshot_stream.publish(self.latest_data)
+
+    def apply_remote_snapshot(self, data, payload):
+        """API-worker mode: mirror a snapshot received from the ingest process"""
+        seq = data.get("seq")
+        is_new_sample = seq is not None and seq != self.sample_seq and data.get("sensor_connected")
+        self.latest_data.clear()
+        self.latest_data.update(data)
+        self.sample_seq = data.get("seq", self.sample_seq)
+        if is_new_sample:
+            self.recent.append(self.latest_data)
+        snapshot_stream.publish(self.latest_data, payload=payload)
 
     async def start_reading(self):
         self.running = True
+        self.command_writer.start()
         
         while self.running:
             # 1. Ensure Connection
             if not self.serial_conn or not self.serial_conn.is_open:
                 try:
                     logger.info(f"Attempting to connect to {settings.SERIAL_PORT}...")
-                    self.serial_conn = serial.Serial(settings.SERIAL_PORT, settings.SERIAL_BAUDRATE, timeout=1)
+                    self.serial_conn = self._open_connection()
                     self.serial_conn.reset_input_buffer()
+                    self.command_writer.invalidate()  # Device state unknown: resend the current command
                     logger.info("Connected to Serial/Bluetooth Device.")
                     self.latest_data["sensor_connected"] = True
+                    self.publish_snapshot()
                 except Exception as e:
                     logger.warning(f"Hardware not connected: {e}. Will retry in 10s...")
                     self.latest_data["sensor_connected"] = False
                     self.latest_data["raw_log"] = f"Hardware not connected. Waiting for device on {settings.SERIAL_PORT}..."
+                    self.publish_snapshot()
                     await asyncio.sleep(10)
                     continue
 
@@ -47,138 +189,37 @@ class SensorManager:
             try:
                 # Use run_in_executor to avoid blocking the main event loop during serial I/O
                 if self.serial_conn.in_waiting:
-                    # Run the blocking readline() in a separate thread
+                    # Run the blocking reads in a separate thread; returns every line waiting (oldest first)
                     loop = asyncio.get_event_loop()
-                    line = await loop.run_in_executor(None, self._read_line_blocking)
+                    lines = await loop.run_in_executor(None, self._read_lines_blocking)
                     
-                    if not line:
+                    if not lines:
                         continue
                     
-                    # Debug: Log received line
-                    logger.info(f"Received from {settings.SERIAL_PORT}: {line}")
-                    
-                    # Skip ALERT messages - they are not data messages
-                    if line.startswith("ALERT") or line.startswith("IQ") or "ALERT!" in line:
-                        logger.debug(f"Skipping alert message: {line}")
+                    # Only lines with sensor data count towards the backlog (ALERT!/IQ lines
+                    # arrive alongside samples during an alarm and carry none)
+                    samples = []
+                    for line, t_read in lines:
+                        # Keep every line queryable via the API; the log itself is rate-limited
+                        raw_lines.append(line)
+                        data = parse_line(line)
+                        if data:
+                            # Each sample keeps its own read and parse times, not the drain's
+                            samples.append((line, data, t_read, time.monotonic()))
+                    if not samples:
                         continue
-                        
-                    # Parse Data
-                    # Supports JSON: {"temperature": 24, "humidity": 50, "mq2": 120, "mq135": 80}
-                    # Supports CSV: 24.5,50.2,120,80 (Temp, Hum, MQ2, MQ135)
-                    data = {}
-                    
-                    if line.startswith('{'):
-                        try:
-                            raw_data = json.loads(line)
-                            data = {
-                                "mq2_gas": float(raw_data.get("mq2", raw_data.get("mq2_gas", 0))),
-                                "mq135_air": float(raw_data.get("mq135", raw_data.get("mq135_air", 0)))
-                            }
-                        except json.JSONDecodeError:
-                            logger.warning(f"Invalid JSON received: {line}")
+
+                    # Backlog under overload: the policy picks which samples get the full pipeline
+                    full, degraded = self.load_shedder.plan(len(samples))
+                    critical_shed = False
+                    for (line, data, t_read, t_parsed), process in zip(samples, full):
+                        if not process:
+                            critical_shed = self._safety_check(data) or critical_shed
                             continue
-                    else:
-                        # Try Custom "Key: Value" format (e.g., "MQ2: 1.17, MQ135: 0.76")
-                        if ":" in line:
-                            try:
-                                parts = [p.strip() for p in line.split(',')]
-                                temp_data = {}
-                                for p in parts:
-                                    if ":" in p:
-                                        k, v = p.split(':', 1)
-                                        k = k.strip().lower()
-                                        v = v.strip()
-                                        
-                                        # Skip if key contains 'alert' or other non-sensor keywords
-                                        if 'alert' in k or 'iq' in k:
-                                            continue
-                                        
-                                        # Clean value - remove 'V' suffix if present
-                                        v = v.replace('V', '').replace('v', '').strip()
-                                        
-                                        if v == "NA" or not v:
-                                            continue  # Skip invalid values instead of using 0
-                                        else:
-                                            try:
-                                                val = float(v)
-                                            except ValueError:
-                                                logger.debug(f"Could not parse value '{v}' from key '{k}'")
-                                                continue  # Skip invalid values
-                                        
-                                        # Only process valid sensor keys
-                                        if "mq2" in k and "mq135" not in k: 
-                                            temp_data["mq2_voltage"] = val
-                                            temp_data["mq2_gas"] = val * 350  # Convert Voltage to PPM (Linear Approx)
-                                        elif "mq135" in k: 
-                                            temp_data["mq135_voltage"] = val
-                                            temp_data["mq135_air"] = val * 350  # Convert Voltage to PPM (Linear Approx)
-                                
-                                # Only update if we got valid sensor data
-                                if temp_data:
-                                    # Update only the fields we received - preserve others
-                                    if "mq2_gas" in temp_data: 
-                                        data["mq2_gas"] = temp_data["mq2_gas"]
-                                    if "mq2_voltage" in temp_data: 
-                                        data["mq2_voltage"] = temp_data["mq2_voltage"]
-                                    if "mq135_air" in temp_data: 
-                                        data["mq135_air"] = temp_data["mq135_air"]
-                                    if "mq135_voltage" in temp_data: 
-                                        data["mq135_voltage"] = temp_data["mq135_voltage"]
-                                    
-                                    data["sensor_connected"] = True
-                                    data["raw_log"] = line
-                                else:
-                                    # No valid data parsed, skip this line
-                                    continue
-
-                            except Exception as e:
-                                logger.warning(f"Error parsing custom format '{line}': {e}")
-                                continue
-                        else:
-                            # Try CSV - Assuming now just MQ2, MQ135 if using CSV (or just skipping CSV support for now as it was rigid)
-                            # But let's keep it assuming T,H are gone from CSV or just ignore index 0,1 if they are there?
-                            # The user said "remove all related". If the hardware sends CSV with 4 values, we might break if we assume 2.
-                            # But the user is using the Key:Value format based on logs. I'll just comment out CSV or update it to be safe.
-                            pass
-                    
-                    if data:
-                        # FIX: Pass VOLTAGE to ML (expecting < 3.3V), not PPM (e.g. 77)
-                        score, status, ai_command = ml_service.predict_risk(
-                            data.get("mq2_voltage", 0.0), 
-                            data.get("mq135_voltage", 0.0)
-                        )
-                        data["risk_score"] = score
-                        data["status"] = status
-                        data["ai_command"] = ai_command
-                        data["ml_confidence"] = ml_service.last_confidence
-                        
-                        # Advanced ML Features
-                        ml_data = ml_service.predict_future_trends()
-                        if ml_data:
-                            data["ml_trend"] = ml_data["trend"]
-                            data["time_to_warn"] = ml_data["time_to_warn"]
-                            data["time_to_crit"] = ml_data["time_to_crit"]
-                        
-                        # Add Probabilities
-                        if hasattr(ml_service, 'last_probs'):
-                            data["ml_probs"] = ml_service.last_probs
-                        
-                        # Simplified Time String for UI (Backwards Compatible logic)
-                        if ml_data and ml_data.get("time_to_crit"):
-                             data["time_to_critical"] = f"{ml_data['time_to_crit']}s to Crit"
-                        elif ml_data and ml_data.get("time_to_warn"):
-                             data["time_to_critical"] = f"{ml_data['time_to_warn']}s to Warn"
-                        else:
-                             data["time_to_critical"] = "Stable"
-                            
-                        data["sensor_connected"] = True
-                        self.latest_data.update(data)  # Update instead of replacing to preserve values
-                        logger.debug(f"Updated Sensor Data: {data}")
-                        # Send AI Command back to STM32 (only if changed to avoid flooding)
-                        if ai_command != self.last_sent_command:
-                            await self.send_command(ai_command)
-                            self.last_sent_command = ai_command
-                        
+                        logger.info("Received from %s: %s", settings.SERIAL_PORT, line, extra={"msg_type": "rx_line"})
+                        self._process_sample(data, t_read, degraded, critical_shed, t_parsed)
+                        critical_shed = False
+                    self.publish_snapshot()
                         
                 else:
                     await asyncio.sleep(0.005)  # Poll very fast (5ms) when idle to mimic real-time interrupt
@@ -193,38 +234,103 @@ class SensorManager:
                 self.serial_conn = None
                 self.latest_data["sensor_connected"] = False
                 self.latest_data["raw_log"] = "Hardware disconnected. Reconnecting..."
+                self.publish_snapshot()
                 await asyncio.sleep(5)
 
-    def _read_line_blocking(self):
-        """Blocking read - Flushes buffer and returns ONLY the latest line"""
+    def _process_sample(self, data, t_read, degraded=False, critical_shed=False, t_parsed=None):
+        """
+        Full pipeline for one parsed sample (parse_line output): inference, alerts, recent
+        ring, command. degraded skips the optional stages (trend forecast, shadow comparison).
+        critical_shed: a shed sample before this one was critical, so the command is held at
+        AI_CRITICAL for this sample (fail safe; the next sample decides again).
+        t_read / t_parsed: time.monotonic() when this sample's line was read and parsed.
+        """
+        self.sample_seq += 1
+        data["seq"] = self.sample_seq
+        data["ts"] = time.time()  # Wall-clock read time; lets clients measure end-to-end latency
+        trace = self.tracer.begin(self.sample_seq, t_read)
+        self.tracer.mark(trace, "parsed", at=t_parsed)
+        
+        # FIX: Pass VOLTAGE to ML (expecting < 3.3V), not PPM (e.g. 77)
+        score, status, ai_command = ml_service.predict_risk(
+            data.get("mq2_voltage", 0.0), 
+            data.get("mq135_voltage", 0.0),
+            optional=not degraded,
+        )
+        if critical_shed:
+            ai_command = "AI_CRITICAL"
+        data["risk_score"] = score
+        data["status"] = status
+        data["ai_command"] = ai_command
+        data["ml_confidence"] = ml_service.last_confidence
+        
+        # Advanced ML Features (skipped while degraded; the last forecast stays on the dashboard)
+        if not degraded:
+            ml_data = ml_service.predict_future_trends()
+            if ml_data:
+                data["ml_trend"] = ml_data["trend"]
+                data["time_to_warn"] = ml_data["time_to_warn"]
+                data["time_to_crit"] = ml_data["time_to_crit"]
+            
+            # Simplified Time String for UI (Backwards Compatible logic)
+            if ml_data and ml_data.get("time_to_crit"):
+                 data["time_to_critical"] = f"{ml_data['time_to_crit']}s to Crit"
+            elif ml_data and ml_data.get("time_to_warn"):
+                 data["time_to_critical"] = f"{ml_data['time_to_warn']}s to Warn"
+            else:
+                 data["time_to_critical"] = "Stable"
+        
+        # Add Probabilities
+        data["ml_probs"] = ml_service.last_probs
+        self.tracer.mark(trace, "inferred")
+            
+        data["sensor_connected"] = True
+        self.latest_data.update(data)  # Update instead of replacing to preserve values
+        alert_engine.evaluate(self.latest_data)
+        self.recent.append(self.latest_data, t_mono=t_read)
+        if self.shared_ring is not None:
+            self.shared_ring.append(self.latest_data, t_mono=t_read)
+        logger.debug("Updated Sensor Data: %s", data)
+        # Send AI Command back to STM32 (only if changed; superseded commands are coalesced)
+        self.command_writer.submit(ai_command, trace)
+
+    def _safety_check(self, data):
+        """
+        What a shed sample still gets: threshold classification, alert evaluation and
+        AI_CRITICAL. No model, no history. Returns True if the sample was critical.
+        """
+        score, status, ai_command = ml_service.voltage_risk(
+            data.get("mq2_voltage", 0.0), data.get("mq135_voltage", 0.0)
+        )
+        sample = dict(self.latest_data, **data)
+        sample.update(risk_score=score, status=status, ai_command=ai_command or "AI_SAFE")
+        alert_engine.evaluate(sample)
+        if ai_command == "AI_CRITICAL":
+            self.command_writer.submit(ai_command)
+            self.load_shedder.counters["safety_commands"] += 1
+            return True
+        return False
+
+    def _open_connection(self):
+        if settings.REPLAY_CSV:
+            return ReplaySerial(settings.REPLAY_CSV, speed=settings.REPLAY_SPEED)
+        return serial.Serial(settings.SERIAL_PORT, settings.SERIAL_BAUDRATE, timeout=1)
+
+    def _read_lines_blocking(self):
+        """Blocking read - Flushes buffer and returns every line that was waiting as (line, monotonic read time), oldest first"""
+        lines = []
         try:
-            last_line = None
-            # Read all available lines to clear buffer and get the freshest data
+            # Read all available lines to clear buffer; the caller decides what to keep
             while self.serial_conn.in_waiting:
                 line = self.serial_conn.readline().decode('utf-8', errors='ignore').strip()
                 if line:
-                    last_line = line
-            return last_line
+                    # Acknowledgements are consumed by the command writer
+                    if self.command_writer.on_line(line):
+                        continue
+                    self.last_read_at = time.monotonic()
+                    lines.append((line, self.last_read_at))
+            return lines
         except Exception:
-            return None
-
-    async def send_command(self, command):
-        """Async wrapper for blocking write"""
-        if self.serial_conn:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, lambda: self._send_command_blocking(command))
-
-    def _send_command_blocking(self, command):
-        """Blocking write to be run in executor"""
-        if self.serial_conn and self.serial_conn.is_open:
-            try:
-                # Ensure command ends with newline
-                if not command.endswith('\n'):
-                    command += '\n'
-                
-                self.serial_conn.write(command.encode('utf-8'))
-                logger.debug(f" 📤 Sent: {command.strip()}")
-            except Exception as e:
-                logger.error(f"❌ Failed to send command {command}: {e}")
+            return lines
 
 sensor_manager = SensorManager()
@@ -0,0 +1,208 @@
+"""
+Shadow scoring of candidate models on the live stream (SHADOW_MODELS / IOT_SHADOW_MODELS).
+
+The primary model keeps driving the AI_* commands. Every reading (with the primary's
+prediction, once it has one) is offered to a worker process with put_nowait on a bounded
+queue (dropped and counted if the worker falls behind), so shadow models never share the
+ingest process's CPU time or GIL. The worker keeps a feature window per shadow model
+(inference_core.StreamingFeatures - a candidate may use other windows than the primary),
+scores every shadow model and sends the results back; a collector thread aggregates
+agreement, confusion against the primary and latency histograms for /api/ml/shadow.
+
+The shadow windows must see the same readings as the primary's. A dropped reading marks
+the next one that gets through as following a gap: the worker then restarts its windows,
+so no comparison is made until they are full again (counted as "gaps").
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 250]  # Upper bounds; one extra overflow bucket
+CLASSES = ["SAFE", "WARN", "CRITICAL"]
+
+
+def resolve_model_path(path):
+    """A model directory (gas_smoke_rf.pkl + feature_names.pkl) or .pkl file, relative to the project root"""
+    if not os.path.isabs(path):
+        path = os.path.join(PROJECT_ROOT, path)
+    if os.path.isdir(path):
+        path = os.path.join(path, "gas_smoke_rf.pkl")
+    return path
+
+
+# ---------- worker process ----------
+
+def _shadow_worker(model_paths, in_queue, out_queue):
+    import sys
+    import joblib
+    import pandas as pd
+
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "ml"))
+    from inference_core import StreamingFeatures, FEATURE_NAMES
+
+    models = []
+    for path in model_paths:
+        try:
+            model = joblib.load(path)
+            model.set_params(n_jobs=1)  # One core, no thread pool per prediction
+            names_path = os.path.join(os.path.dirname(path), "feature_names.pkl")
+            feature_names = joblib.load(names_path) if os.path.exists(names_path) else FEATURE_NAMES
+            models.append((path, model, StreamingFeatures(feature_names=feature_names)))
+        except Exception as e:
+            out_queue.put(("error", path, str(e)))
+    out_queue.put(("ready", [path for path, _, _ in models], None))
+
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        mq2, mq135, primary, gap = item
+        if gap:
+            # Readings were lost: windows spanning the hole would not match the primary's
+            models = [(path, model, StreamingFeatures(feature_names=features.feature_names))
+                      for path, model, features in models]
+        results = []
+        for path, model, features in models:
+            vector = features.push(mq2, mq135)
+            if vector is None or primary is None:
+                continue  # Window still filling (this model's or the primary's)
+            start = time.perf_counter()
+            X = pd.DataFrame([vector], columns=features.feature_names)
+            prediction = str(model.predict(X)[0])
+            results.append((path, prediction, (time.perf_counter() - start) * 1000))
+        if results:
+            out_queue.put(("result", primary, results))
+
+
+# ---------- ingest process ----------
+
+class ShadowStats:
+    """Agreement, confusion (primary -> shadow) and latency histogram for one shadow model"""
+    def __init__(self, path):
+        self.path = path
+        self.samples = 0
+        self.agree = 0
+        self.confusion = {p: {s: 0 for s in CLASSES} for p in CLASSES}
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self.latency_max_ms = 0.0
+
+    def record(self, primary, prediction, latency_ms):
+        self.samples += 1
+        if primary == prediction:
+            self.agree += 1
+        self.confusion.setdefault(primary, {}).setdefault(prediction, 0)
+        self.confusion[primary][prediction] += 1
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                bucket = i
+                break
+        self.latency_counts[bucket] += 1
+        self.latency_sum_ms += latency_ms
+        self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+
+    def to_dict(self):
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "model": os.path.relpath(self.path, PROJECT_ROOT),
+            "samples": self.samples,
+            "agreement_rate": round(self.agree / self.samples, 4) if self.samples else None,
+            "disagreement_rate": round(1 - self.agree / self.samples, 4) if self.samples else None,
+            "confusion": self.confusion,  # confusion[primary][shadow]
+            "latency_ms": {
+                "histogram": dict(zip(labels, self.latency_counts)),
+                "mean": round(self.latency_sum_ms / self.samples, 3) if self.samples else None,
+                "max": round(self.latency_max_ms, 3),
+            },
+        }
+
+
+class ShadowScorer:
+    def __init__(self, model_paths, queue_size=256):
+        self.model_paths = [resolve_model_path(p) for p in model_paths]
+        self.queue_size = queue_size
+        self.active = False
+        self.submitted = 0
+        self.dropped = 0
+        self.gaps = 0
+        self._gap = False  # A reading was dropped since the last one sent
+        self.errors = []
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._process = None
+        self._in_queue = None
+        self._out_queue = None
+
+    def start(self):
+        """Spawn the worker (call once from the ingesting process)"""
+        if self.active or not self.model_paths:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        self._in_queue = ctx.Queue(maxsize=self.queue_size)
+        self._out_queue = ctx.Queue()
+        self._process = ctx.Process(
+            target=_shadow_worker, args=(self.model_paths, self._in_queue, self._out_queue),
+            name="shadow-scorer", daemon=True,
+        )
+        self._process.start()
+        threading.Thread(target=self._collect, name="shadow-collector", daemon=True).start()
+        self.active = True
+        logger.info(f"👥 Shadow scoring started for {len(self.model_paths)} model(s)")
+
+    def submit(self, mq2, mq135, primary=None):
+        """Hot path: never blocks. One reading and the primary's class (None while it warms up)."""
+        if not self.active:
+            return
+        try:
+            self._in_queue.put_nowait((mq2, mq135, primary, self._gap))
+            self.submitted += 1
+            if self._gap:
+                self.gaps += 1
+                self._gap = False
+        except queue.Full:
+            self.dropped += 1
+            self._gap = True
+
+    def _collect(self):
+        while True:
+            kind, first, payload = self._out_queue.get()
+            if kind == "error":
+                self.errors.append(f"{first}: {payload}")
+                logger.warning(f"Shadow model not loaded: {first}: {payload}")
+            elif kind == "ready":
+                with self._lock:
+                    for path in first:
+                        self.stats[path] = ShadowStats(path)
+            elif kind == "result":
+                with self._lock:
+                    for path, prediction, latency_ms in payload:
+                        self.stats[path].record(first, prediction, latency_ms)
+
+    def stop(self):
+        if self.active:
+            self.active = False
+            self._in_queue.put(None)
+
+    def get_stats(self):
+        with self._lock:
+            models = [s.to_dict() for s in self.stats.values()]
+        return {
+            "active": self.active,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "gaps": self.gaps,  # Window restarts in the worker after dropped readings
+            "errors": self.errors,
+            "models": models,
+        }
+
+
+shadow_scorer = ShadowScorer(settings.SHADOW_MODELS, queue_size=settings.SHADOW_QUEUE_SIZE)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+from collections import deque, namedtuple
+
+from app import schemas
+from app.core.config import settings
+
+# Immutable, pre-serialized /api/sensor/current response (swapped atomically once per sample)
+CurrentSnapshot = namedtuple("CurrentSnapshot", ["seq", "etag", "body"])
+
+# Distinguishes sequence numbers across restarts so a stale client ETag never matches.
+# Snapshots carry the id of the process that produced them ("boot"), so API workers
+# mirroring an ingest process all issue the ingest process's ETags.
+BOOT_ID = format(time.time_ns(), "x")
+
+
+class SnapshotStream:
+    """
+    Shared, pre-encoded snapshot frames.
+    Each published snapshot is serialized exactly once; every SSE subscriber (and the
+    legacy /ws stream) writes the same bytes, so N read-only displays cost about one encode.
+    """
+    def __init__(self, replay_size=256, keepalive_s=15.0):
+        self.frames = deque(maxlen=replay_size)  # (event id, SSE frame bytes)
+        self.last_id = 0
+        self.latest_json = "{}"
+        self.keepalive_s = keepalive_s
+        self.subscribers = 0
+        self._waiters = []
+        self.current = None
+        self.listeners = []  # Called with each encoded payload (e.g. the ingest link)
+
+    def publish(self, data, payload=None):
+        """Encode a snapshot once (unless already encoded) and wake all subscribers"""
+        self.last_id += 1
+        if payload is None:
+            payload = json.dumps(data, separators=(",", ":"), default=str)
+        self.latest_json = payload
+        self.frames.append((self.last_id, f"id: {self.last_id}\nevent: sample\ndata: {payload}\n\n".encode("utf-8")))
+
+        seq = data.get("seq", 0)
+        etag = f'"{data.get("boot", BOOT_ID)}-{seq}"'
+        if self.current is None or self.current.etag != etag:
+            self.current = self._build_current(seq, etag, data)
+
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        for listener in self.listeners:
+            listener(payload)
+
+    @staticmethod
+    def _build_current(seq, etag, data):
+        body = json.dumps(schemas.SensorDataBase(**data).dict(), separators=(",", ":")).encode("utf-8")
+        return CurrentSnapshot(seq=seq, etag=etag, body=body)
+
+    def _frames_after(self, cursor):
+        """Frames with id > cursor; ids are contiguous so this is index arithmetic"""
+        if not self.frames:
+            return []
+        first_id = self.frames[0][0]
+        if cursor < first_id - 1:
+            # Fell out of the replay window: resume from the newest snapshot only
+            return [self.frames[-1]]
+        start = cursor - first_id + 1
+        return [self.frames[i] for i in range(start, len(self.frames))]
+
+    async def subscribe(self, last_event_id=None):
+        """Async generator of SSE bytes, resuming after `last_event_id` when it is still buffered"""
+        self.subscribers += 1
+        try:
+            yield b"retry: 2000\n\n"
+            if last_event_id is None or last_event_id > self.last_id:
+                cursor = self.last_id - 1  # Start with the current snapshot
+            else:
+                cursor = last_event_id
+
+            loop = asyncio.get_running_loop()
+            while True:
+                frames = self._frames_after(cursor)
+                if frames:
+                    cursor = frames[-1][0]
+                    yield b"".join(frame for _, frame in frames)
+                    continue
+
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, timeout=self.keepalive_s)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
+
+    def get_stats(self):
+        return {
+            "last_id": self.last_id,
+            "buffered": len(self.frames),
+            "subscribers": self.subscribers,
+        }
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+snapshot_stream = SnapshotStream(
+    replay_size=settings.SSE_REPLAY_BUFFER,
+    keepalive_s=settings.SSE_KEEPALIVE_S,
+)
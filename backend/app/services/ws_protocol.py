@@ -0,0 +1,167 @@
+"""
+Delta-encoded WebSocket push protocol (v2)
+
+Negotiated with query parameters on /ws (no `v` parameter = legacy full-JSON stream):
+    /ws?v=2&rate=10&enc=json&keyframe=5&raw=0
+        rate      max frames per second (1-50)
+        enc       "json" or "binary"
+        keyframe  seconds between full keyframes
+        raw       1 to include the raw_log string (json only)
+
+The server first sends a JSON hello describing the session (and the binary field layout),
+then frames carrying only the fields that changed since the previous frame.
+
+JSON frame:   {"v": 2, "f": <frame no>, "seq": <sample seq>, "k": 0|1, "d": {changed fields}}
+Binary frame: little-endian header <B version, B flags (bit0 = keyframe), H field mask,
+              I frame no, I sample seq> followed by the values of every field whose
+              bit is set in the mask, in BINARY_FIELDS order. NaN encodes "no value".
+"""
+import json
+import math
+import struct
+import time
+
+PROTOCOL_VERSION = 2
+
+HEADER = struct.Struct("<BBHII")
+
+# Enum fields are sent as their index in the list (255 = unknown)
+ENUMS = {
+    "status": ["Safe", "Warning", "Danger"],
+    "ai_command": ["AI_SAFE", "AI_WARN", "AI_CRITICAL"],
+    "ml_trend": ["stable", "increasing", "warning_active", "critical_active", "warning_stable", "critical_stable"],
+}
+
+# (name, struct format) - order defines mask bits and payload order
+BINARY_FIELDS = [
+    ("mq2_gas", "f"),
+    ("mq2_voltage", "f"),
+    ("mq135_air", "f"),
+    ("mq135_voltage", "f"),
+    ("risk_score", "f"),
+    ("ml_confidence", "f"),
+    ("time_to_warn", "f"),
+    ("time_to_crit", "f"),
+    ("ml_probs", "3f"),  # safe, warn, crit
+    ("status", "B"),
+    ("ai_command", "B"),
+    ("ml_trend", "B"),
+    ("sensor_connected", "B"),
+]
+_BINARY_STRUCTS = [(name, struct.Struct("<" + fmt)) for name, fmt in BINARY_FIELDS]
+
+# Never part of a delta unless explicitly requested
+HEAVY_FIELDS = ("raw_log",)
+
+_MISSING = object()
+
+
+def _binary_value(name, value):
+    """Flatten one latest_data field to the tuple packed on the wire"""
+    if name == "ml_probs":
+        probs = value or {}
+        return (probs.get("safe", math.nan), probs.get("warn", math.nan), probs.get("crit", math.nan))
+    if name in ENUMS:
+        try:
+            return (ENUMS[name].index(value),)
+        except ValueError:
+            return (255,)
+    if name == "sensor_connected":
+        return (1 if value else 0,)
+    return (math.nan if value is None else float(value),)
+
+
+def hello_message(session):
+    return {
+        "type": "hello",
+        "v": PROTOCOL_VERSION,
+        "enc": session.encoding,
+        "rate": session.rate,
+        "keyframe": session.keyframe_interval,
+        "fields": [{"name": name, "format": fmt} for name, fmt in BINARY_FIELDS] if session.encoding == "binary" else None,
+        "enums": ENUMS if session.encoding == "binary" else None,
+    }
+
+
+class DeltaSession:
+    """Per-connection encoder state: what the client already has"""
+    def __init__(self, encoding="json", rate=10.0, keyframe_interval=5.0, include_raw=False):
+        self.encoding = "binary" if encoding == "binary" else "json"
+        self.rate = min(max(float(rate), 1.0), 50.0)
+        self.keyframe_interval = max(float(keyframe_interval), 1.0)
+        self.include_raw = include_raw and self.encoding == "json"
+        self.frame_no = 0
+        self.last_sent = {}
+        self.last_keyframe_at = None
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate
+
+    def encode(self, data, now=None):
+        """
+        Encode the changes in `data` since the previous frame.
+        Returns str (json), bytes (binary) or None when nothing needs sending.
+        """
+        now = time.monotonic() if now is None else now
+        keyframe = self.last_keyframe_at is None or now - self.last_keyframe_at >= self.keyframe_interval
+        if self.encoding == "binary":
+            frame = self._encode_binary(data, keyframe)
+        else:
+            frame = self._encode_json(data, keyframe)
+        if frame is not None:
+            self.frame_no += 1
+            if keyframe:
+                self.last_keyframe_at = now
+        return frame
+
+    def _encode_json(self, data, keyframe):
+        last = self.last_sent
+        changed = {}
+        for key, value in data.items():
+            if key == "seq" or (key in HEAVY_FIELDS and not self.include_raw):
+                continue
+            if keyframe or last.get(key, _MISSING) != value:
+                changed[key] = value
+        if not changed and not keyframe:
+            return None
+        last.update(changed)
+        return json.dumps({
+            "v": PROTOCOL_VERSION,
+            "f": self.frame_no + 1,
+            "seq": data.get("seq", 0),
+            "k": 1 if keyframe else 0,
+            "d": changed,
+        }, separators=(",", ":"))
+
+    def _encode_binary(self, data, keyframe):
+        last = self.last_sent
+        mask = 0
+        parts = []
+        for bit, (name, packer) in enumerate(_BINARY_STRUCTS):
+            value = _binary_value(name, data.get(name))
+            # NaN != NaN, so compare the packed bytes instead of the floats
+            packed = packer.pack(*value)
+            if keyframe or last.get(name) != packed:
+                mask |= 1 << bit
+                parts.append(packed)
+                last[name] = packed
+        if not mask:
+            return None
+        header = HEADER.pack(PROTOCOL_VERSION, 1 if keyframe else 0, mask, self.frame_no + 1, data.get("seq", 0))
+        return header + b"".join(parts)
+
+
+def session_from_query(params):
+    """Build a DeltaSession from /ws query parameters, or None for the legacy stream"""
+    if params.get("v") != str(PROTOCOL_VERSION):
+        return None
+    try:
+        return DeltaSession(
+            encoding=params.get("enc", "json"),
+            rate=float(params.get("rate", 10)),
+            keyframe_interval=float(params.get("keyframe", 5)),
+            include_raw=params.get("raw") == "1",
+        )
+    except ValueError:
+        return DeltaSession()
@@ -0,0 +1,298 @@
+"""
+MICRO-BENCHMARKS: backend and ML hot paths
+==========================================
+Times the per-sample code paths with fixed inputs from datasets/ and writes the results
+to benchmarks/results/<timestamp>.json. With --baseline, every benchmark is compared
+against a previous results file and the run fails (exit code 1) if one got slower than
+its threshold allows, so regressions are caught before deploy.
+
+Usage (from the project root):
+    python benchmarks/run_benchmarks.py                               # run all, save results
+    python benchmarks/run_benchmarks.py --save-baseline               # also write benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.15
+    python benchmarks/run_benchmarks.py --only ml. --threshold crud.create_sensor_data=0.5
+
+Baselines are machine-specific: record one on the deploy machine (or CI runner) and
+compare runs from the same machine only.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, 'backend')
+ML_DIR = os.path.join(PROJECT_ROOT, 'ml')
+DATASETS_DIR = os.path.join(PROJECT_ROOT, 'datasets')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'benchmarks', 'baseline.json')
+
+# ==================== CONFIGURATION ====================
+DATASET = 'rapid_gas_20260129_225822.csv'  # Fixed input: ramps through all three classes
+REPEATS = 7            # Timing rounds per benchmark (median reported)
+MIN_ROUND_S = 0.2      # Each round runs the function enough times to last at least this long
+DEFAULT_THRESHOLD = 0.20  # Allowed slowdown vs baseline (0.20 = 20% slower)
+
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, ML_DIR)
+
+
+def load_samples():
+    import pandas as pd
+    df = pd.read_csv(os.path.join(DATASETS_DIR, DATASET))
+    return list(zip(df['mq2'].astype(float), df['mq135'].astype(float)))
+
+
+class Cycle:
+    """Endless iterator over the fixed samples so every call sees realistic, varying input"""
+    def __init__(self, items):
+        self.items = items
+        self.i = 0
+
+    def next(self):
+        item = self.items[self.i]
+        self.i = (self.i + 1) % len(self.items)
+        return item
+
+
+# ==================== BENCHMARKS ====================
+# Each factory returns a zero-argument callable; one call = one unit of work.
+
+def build_benchmarks(samples, db_url):
+    # The database must be redirected before app.core.database creates its engines
+    from app.core.config import settings
+    settings.SQLALCHEMY_DATABASE_URI = db_url
+
+    from app import models, schemas, crud
+    from app.core import database
+    from app.services.ml_service import MLService
+    from app.services.serial_reader import parse_line
+    from app.services.snapshot_stream import SnapshotStream
+    from app.services.ws_protocol import DeltaSession
+    import feature_engineering
+
+    database.ensure_schema(models.Base.metadata)
+    ml = MLService()
+    ml.pending_predictions.clear()
+    for mq2, mq135 in samples[:60]:
+        ml.predict_with_ml(mq2, mq135)  # Fill the window: steady-state inference
+
+    cycle = Cycle(samples)
+    lines = Cycle([f"MQ2: {mq2:.2f}V, MQ135: {mq135:.2f}V" for mq2, mq135 in samples])
+
+    def extract_features():
+        ml.extract_features(*cycle.next())
+
+    def predict_with_ml():
+        ml.predict_with_ml(*cycle.next())
+        ml.pending_predictions.clear()
+
+    def predict_future_trends():
+        ml.predict_future_trends()
+
+    def predict_risk():
+        ml.predict_risk(*cycle.next())
+        ml.pending_predictions.clear()
+
+    def parse():
+        parse_line(lines.next())
+
+    db = database.SessionLocal()
+
+    def create_sensor_data():
+        mq2, mq135 = cycle.next()
+        crud.create_sensor_data(db, schemas.SensorDataCreate(
+            mq2_gas=mq2 * 350, mq2_voltage=mq2, mq135_air=mq135 * 350, mq135_voltage=mq135,
+            risk_score=10.0, status="Safe",
+        ))
+
+    snapshot = {
+        "mq2_gas": 420.0, "mq2_voltage": 1.2, "mq135_air": 280.0, "mq135_voltage": 0.8,
+        "risk_score": 39, "status": "Safe", "sensor_connected": True, "ai_command": "AI_SAFE",
+        "ml_confidence": 0.91, "ml_trend": "stable", "time_to_warn": None, "time_to_crit": None,
+        "ml_probs": {"safe": 0.91, "warn": 0.06, "crit": 0.03}, "time_to_critical": "Stable",
+        "raw_log": "MQ2: 1.20V, MQ135: 0.80V", "seq": 0,
+    }
+    stream = SnapshotStream(replay_size=256, keepalive_s=15.0)
+    json_session = DeltaSession(encoding="json")
+    binary_session = DeltaSession(encoding="binary")
+
+    def next_snapshot():
+        mq2, mq135 = cycle.next()
+        snapshot["seq"] += 1
+        snapshot["mq2_voltage"], snapshot["mq135_voltage"] = mq2, mq135
+        snapshot["mq2_gas"], snapshot["mq135_air"] = mq2 * 350, mq135 * 350
+        return snapshot
+
+    def snapshot_publish():
+        stream.publish(next_snapshot())
+
+    def delta_json():
+        json_session.encode(next_snapshot())
+
+    def delta_binary():
+        binary_session.encode(next_snapshot())
+
+    csv_path = os.path.join(DATASETS_DIR, DATASET)
+
+    def process_csv_file():
+        with contextlib.redirect_stdout(io.StringIO()):
+            feature_engineering.process_csv_file(csv_path)
+
+    return {
+        'ml.extract_features': extract_features,
+        'ml.predict_with_ml': predict_with_ml,
+        'ml.predict_future_trends': predict_future_trends,
+        'ml.predict_risk': predict_risk,
+        'serial.parse_line': parse,
+        'crud.create_sensor_data': create_sensor_data,
+        'ws.snapshot_publish': snapshot_publish,
+        'ws.delta_json': delta_json,
+        'ws.delta_binary': delta_binary,
+        'features.process_csv_file': process_csv_file,
+    }
+
+
+# ==================== HARNESS ====================
+
+def time_benchmark(fn):
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    # autorange targets 0.2 s as well; scale up for very fast functions
+    if elapsed < MIN_ROUND_S:
+        number = max(1, int(number * MIN_ROUND_S / max(elapsed, 1e-9)))
+    rounds = [t / number for t in timer.repeat(repeat=REPEATS, number=number)]
+    return {
+        'median_us': round(statistics.median(rounds) * 1e6, 3),
+        'min_us': round(min(rounds) * 1e6, 3),
+        'stdev_us': round(statistics.stdev(rounds) * 1e6, 3),
+        'loops': number,
+        'repeats': REPEATS,
+    }
+
+
+def environment():
+    import numpy
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'numpy': numpy.__version__,
+        'sklearn': sklearn.__version__,
+        'commit': commit,
+    }
+
+
+def parse_thresholds(values):
+    """['0.15', 'ml.predict_with_ml=0.5'] -> (default, {name: threshold})"""
+    default = DEFAULT_THRESHOLD
+    per_benchmark = {}
+    for value in values or []:
+        if '=' in value:
+            name, limit = value.split('=', 1)
+            per_benchmark[name] = float(limit)
+        else:
+            default = float(value)
+    return default, per_benchmark
+
+
+def compare(results, baseline, default_threshold, per_benchmark):
+    """Print a comparison table; return the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':28s} {'baseline':>12s} {'current':>12s} {'change':>9s}  limit")
+    for name, current in results.items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if base is None:
+            print(f"{name:28s} {'-':>12s} {current['median_us']:>10.2f}us {'new':>9s}")
+            continue
+        change = current['median_us'] / base['median_us'] - 1
+        limit = per_benchmark.get(name, default_threshold)
+        flag = ''
+        if change > limit:
+            regressions.append(name)
+            flag = '  <-- REGRESSION'
+        print(f"{name:28s} {base['median_us']:>10.2f}us {current['median_us']:>10.2f}us "
+              f"{change:>+8.1%}  +{limit:.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the backend and ML hot paths')
+    parser.add_argument('--only', help='run benchmarks whose name starts with this prefix')
+    parser.add_argument('--baseline', help='results/baseline JSON to compare against')
+    parser.add_argument('--threshold', action='append',
+                        help=f'allowed slowdown, e.g. 0.15 or name=0.5 (repeatable, default {DEFAULT_THRESHOLD})')
+    parser.add_argument('--save-baseline', action='store_true', help=f'also write {DEFAULT_BASELINE}')
+    parser.add_argument('-o', '--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    # Logging would dominate the timings; warnings still show
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+
+    print("="*70)
+    print("MICRO-BENCHMARKS: backend and ML hot paths")
+    print("="*70)
+
+    samples = load_samples()
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmarks = build_benchmarks(samples, f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        if args.only:
+            benchmarks = {k: v for k, v in benchmarks.items() if k.startswith(args.only)}
+
+        results = {}
+        for name, fn in benchmarks.items():
+            results[name] = time_benchmark(fn)
+            r = results[name]
+            print(f"   {name:28s} {r['median_us']:>12.2f} us  (min {r['min_us']:.2f}, ±{r['stdev_us']:.2f}, {r['loops']} loops)")
+
+        # Release the temporary database before the directory is removed
+        from app.core import database
+        database.engine.dispose()
+        database.worker_engine.dispose()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset': DATASET,
+        'environment': environment(),
+        'benchmarks': results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Saved: {output}")
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f" Saved baseline: {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        default_threshold, per_benchmark = parse_thresholds(args.threshold)
+        regressions = compare(results, baseline, default_threshold, per_benchmark)
+        if regressions:
+            print(f"\n {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n No regressions")
+
+
+if __name__ == '__main__':
+    main()
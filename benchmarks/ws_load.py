@@ -0,0 +1,330 @@
+"""
+WEBSOCKET FAN-OUT LOAD TEST
+===========================
+Starts the backend with the replay sensor source (IOT_REPLAY_CSV) on a throwaway
+database, then opens an increasing number of local /ws clients and measures, per step:
+
+- frame inter-arrival jitter (stdev and p99 of the gap between frames, per client)
+- sample-to-client latency percentiles (receive time - the sample's "ts" field)
+- dropped samples (gaps in "seq" seen by a client) and failed connections
+- server CPU (% of one core) and RSS, total and per client (Linux /proc, or psutil)
+
+The report is written to benchmarks/results/ws_load_<timestamp>.json; pass --compare with
+an earlier report to print both side by side. Clients run in --procs worker processes so
+the load generator is not the bottleneck; keep an eye on the client CPU it prints.
+
+Usage (from the project root):
+    python benchmarks/ws_load.py                                   # 10,100,500,1000 clients
+    python benchmarks/ws_load.py --clients 50,200,1000,2000 --duration 20 --procs 4
+    python benchmarks/ws_load.py --query "v=2&rate=10"             # delta protocol instead of legacy /ws
+    python benchmarks/ws_load.py --csv synthetic:scenario=mixed,rate=50   # generated trace (ml/synthetic_traces.py)
+    python benchmarks/ws_load.py --url ws://127.0.0.1:8000/ws --server-pid 1234   # existing server
+    python benchmarks/ws_load.py --compare benchmarks/results/ws_load_20260201_120000.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, 'backend')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+# ==================== CONFIGURATION ====================
+DEFAULT_CSV = os.path.join(PROJECT_ROOT, 'datasets', 'rapid_gas_20260129_225822.csv')
+DEFAULT_PORT = 8765 + 100   # Away from the ingest link port
+CONNECT_TIMEOUT_S = 10.0
+LATENCY_SAMPLES_PER_CLIENT = 2000  # Cap so thousands of clients stay cheap to aggregate
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# ==================== SERVER SIDE ====================
+
+def start_server(port, csv_path, speed, db_path, log_file):
+    """Backend on the replay source; its stderr goes to log_file (a pipe nobody reads would fill and block it)"""
+    env = dict(os.environ)
+    env.update({
+        'IOT_REPLAY_CSV': csv_path,
+        'IOT_REPLAY_SPEED': str(speed),
+        'IOT_DATABASE_URL': f'sqlite:///{db_path}',
+        'IOT_ROLE': 'standalone',
+    })
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log_file,
+    )
+    return process
+
+
+def process_usage(pid):
+    """(cpu seconds, rss bytes) of a process, or (None, None) if it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu_s = (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+        return cpu_s, rss
+    except (OSError, ValueError, StopIteration):
+        pass
+    try:
+        import psutil
+        p = psutil.Process(pid)
+        times = p.cpu_times()
+        return times.user + times.system, p.memory_info().rss
+    except Exception:
+        return None, None
+
+
+# ==================== CLIENT SIDE ====================
+
+async def run_client(url, duration_s, stats):
+    import websockets
+
+    intervals, latencies = [], []
+    last_arrival = None
+    last_seq = None
+    frames = dropped = 0
+    try:
+        async with websockets.connect(url, open_timeout=CONNECT_TIMEOUT_S, max_queue=None) as ws:
+            stats['connected'] += 1
+            deadline = time.monotonic() + duration_s
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                now_mono, now_wall = time.monotonic(), time.time()
+                frames += 1
+                if last_arrival is not None:
+                    intervals.append(now_mono - last_arrival)
+                last_arrival = now_mono
+                if isinstance(message, bytes):
+                    continue  # Binary frames carry no timestamp
+                data = json.loads(message)
+                body = data.get('d', data)  # v2 delta frames nest the fields under "d"
+                seq = data.get('seq')
+                if seq is None or seq == last_seq:
+                    continue  # Legacy /ws resends the same snapshot until a new sample arrives
+                if last_seq is not None and seq > last_seq + 1:
+                    dropped += seq - last_seq - 1
+                last_seq = seq
+                if 'ts' in body and len(latencies) < LATENCY_SAMPLES_PER_CLIENT:
+                    latencies.append(now_wall - body['ts'])
+    except Exception:
+        stats['failed'] += 1
+        return
+
+    stats['frames'] += frames
+    stats['dropped'] += dropped
+    stats['latencies'].extend(latencies)
+    if len(intervals) > 1:
+        stats['jitter_stdev'].append(statistics.pstdev(intervals))
+        stats['intervals'].extend(intervals[:LATENCY_SAMPLES_PER_CLIENT])
+
+
+async def run_clients(url, count, duration_s, ramp_s):
+    stats = {'connected': 0, 'failed': 0, 'frames': 0, 'dropped': 0,
+             'latencies': [], 'intervals': [], 'jitter_stdev': []}
+    tasks = []
+    for i in range(count):
+        tasks.append(asyncio.create_task(run_client(url, duration_s, stats)))
+        if ramp_s:
+            await asyncio.sleep(ramp_s / count)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def client_worker(args):
+    url, count, duration_s, ramp_s = args
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # Thousands of sockets
+    except (ImportError, ValueError, OSError):
+        pass
+    cpu_before = time.process_time()
+    stats = asyncio.run(run_clients(url, count, duration_s, ramp_s))
+    stats['client_cpu_s'] = time.process_time() - cpu_before
+    return stats
+
+
+# ==================== STEPS & REPORT ====================
+
+def run_step(url, clients, duration_s, ramp_s, procs, server_pid):
+    procs = max(1, min(procs, clients))
+    shares = [clients // procs + (1 if i < clients % procs else 0) for i in range(procs)]
+    cpu0, rss0 = process_usage(server_pid) if server_pid else (None, None)
+    started = time.monotonic()
+    with multiprocessing.Pool(procs) as pool:
+        # Sample server RSS at the plateau (after ramp-up, before clients finish)
+        result = pool.map_async(client_worker, [(url, n, duration_s, ramp_s) for n in shares])
+        time.sleep(ramp_s + duration_s * 0.5)
+        _, rss_peak = process_usage(server_pid) if server_pid else (None, None)
+        parts = result.get()
+    wall = time.monotonic() - started
+    cpu1, _ = process_usage(server_pid) if server_pid else (None, None)
+
+    latencies = [x for p in parts for x in p['latencies']]
+    intervals = [x for p in parts for x in p['intervals']]
+    jitter = [x for p in parts for x in p['jitter_stdev']]
+    connected = sum(p['connected'] for p in parts)
+    frames = sum(p['frames'] for p in parts)
+    dropped = sum(p['dropped'] for p in parts)
+    delivered = len(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+
+    step = {
+        'clients': clients,
+        'connected': connected,
+        'failed': sum(p['failed'] for p in parts),
+        'frames': frames,
+        'frames_per_client_s': round(frames / max(connected, 1) / duration_s, 2),
+        'dropped_samples': dropped,
+        'drop_rate': round(dropped / (dropped + delivered), 4) if dropped + delivered else None,
+        'latency_ms': {q: ms(percentile(latencies, int(q[1:]))) for q in ('p50', 'p95', 'p99')},
+        'latency_ms_max': ms(max(latencies)) if latencies else None,
+        'interval_ms': {q: ms(percentile(intervals, int(q[1:]))) for q in ('p50', 'p99')},
+        'jitter_ms_mean_stdev': ms(statistics.mean(jitter)) if jitter else None,
+        'client_cpu_pct': round(100 * sum(p['client_cpu_s'] for p in parts) / wall, 1),
+    }
+    if cpu0 is not None and cpu1 is not None:
+        step['server_cpu_pct'] = round(100 * (cpu1 - cpu0) / wall, 1)
+        step['server_cpu_pct_per_client'] = round(step['server_cpu_pct'] / max(connected, 1), 4)
+    if rss0 is not None and rss_peak is not None:
+        step['server_rss_mb'] = round(rss_peak / 1e6, 1)
+        step['server_rss_kb_per_client'] = round((rss_peak - rss0) / 1e3 / max(connected, 1), 1)
+    return step
+
+
+def print_steps(steps, title):
+    print(f"\n {title}")
+    print(f"   {'clients':>7s} {'conn':>6s} {'fail':>5s} {'fps/cl':>7s} {'drop%':>6s} "
+          f"{'p50ms':>7s} {'p95ms':>7s} {'p99ms':>8s} {'jit ms':>7s} {'srvCPU%':>8s} {'KB/cl':>7s} {'cliCPU%':>8s}")
+    for s in steps:
+        lat = s['latency_ms']
+        drop = f"{100 * s['drop_rate']:.2f}" if s['drop_rate'] is not None else '-'
+        fmt = lambda v, w: f"{v:>{w}}" if v is not None else f"{'-':>{w}}"
+        print(f"   {s['clients']:>7d} {s['connected']:>6d} {s['failed']:>5d} {s['frames_per_client_s']:>7.2f} {drop:>6s} "
+              f"{fmt(lat['p50'], 7)} {fmt(lat['p95'], 7)} {fmt(lat['p99'], 8)} {fmt(s['jitter_ms_mean_stdev'], 7)} "
+              f"{fmt(s.get('server_cpu_pct'), 8)} {fmt(s.get('server_rss_kb_per_client'), 7)} {s['client_cpu_pct']:>8.1f}")
+
+
+def saturation_point(steps, max_drop_rate, max_p99_ms):
+    """First client count where frames get dropped or p99 latency exceeds the budget"""
+    for s in steps:
+        p99 = s['latency_ms']['p99']
+        if s['failed'] or (s['drop_rate'] or 0) > max_drop_rate or (p99 is not None and p99 > max_p99_ms):
+            return s['clients']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket fan-out load test with a replay sensor source')
+    parser.add_argument('--clients', default='10,100,500,1000', help='comma-separated client counts (one step each)')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds measured per step')
+    parser.add_argument('--ramp', type=float, default=2.0, help='seconds to open each step\'s connections')
+    parser.add_argument('--procs', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='client processes')
+    parser.add_argument('--query', default='', help='/ws query string, e.g. "v=2&rate=10" (default: legacy stream)')
+    parser.add_argument('--csv', default=DEFAULT_CSV,
+                        help='dataset replayed as the sensor, or a generated trace: synthetic:scenario=mixed,rate=50')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier')
+    parser.add_argument('--url', help='use an already running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='pid of that server (for CPU/memory)')
+    parser.add_argument('--max-drop-rate', type=float, default=0.001, help='saturation: dropped sample share')
+    parser.add_argument('--max-p99-ms', type=float, default=250.0, help='saturation: p99 latency budget')
+    parser.add_argument('--compare', help='earlier ws_load report to print next to this one')
+    parser.add_argument('-o', '--output', help='report file (default: benchmarks/results/ws_load_<timestamp>.json)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("WEBSOCKET FAN-OUT LOAD TEST")
+    print("="*70)
+
+    server = server_log = None
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        if args.url:
+            url, server_pid = args.url, args.server_pid
+        else:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            server_log = open(os.path.join(RESULTS_DIR, f"ws_load_server_{datetime.now():%Y%m%d_%H%M%S}.log"), 'wb')
+            server = start_server(DEFAULT_PORT, args.csv, args.speed, os.path.join(tmp.name, 'load.db'), server_log)
+            url, server_pid = f'ws://127.0.0.1:{DEFAULT_PORT}/ws', server.pid
+            time.sleep(4)  # Model load + first replayed samples
+            if server.poll() is not None:
+                server_log.close()
+                with open(server_log.name, errors='ignore') as f:
+                    print(f.read()[-4000:])
+                sys.exit(1)
+            print(f" Server log: {server_log.name}")
+        if args.query:
+            url = f"{url}?{args.query}"
+        print(f"\n Target: {url}  (replay: {os.path.basename(args.csv)} at {args.speed}x)")
+
+        steps = []
+        for clients in [int(c) for c in args.clients.split(',') if c.strip()]:
+            print(f"   ... {clients} clients", flush=True)
+            steps.append(run_step(url, clients, args.duration, args.ramp, args.procs, server_pid))
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if server_log is not None:
+            server_log.close()
+        tmp.cleanup()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'url': url,
+        'dataset': os.path.basename(args.csv),
+        'server_log': server_log.name if server_log is not None else None,
+        'duration_s': args.duration,
+        'procs': args.procs,
+        'cpu_count': os.cpu_count(),
+        'saturation_clients': saturation_point(steps, args.max_drop_rate, args.max_p99_ms),
+        'steps': steps,
+    }
+    print_steps(steps, 'This run')
+    print(f"\n Saturation (drop > {args.max_drop_rate:.1%} or p99 > {args.max_p99_ms:.0f} ms): "
+          f"{report['saturation_clients'] or 'not reached'}")
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print_steps(previous['steps'], f"Compared run ({previous['created_at']})")
+        print(f"   saturation: {previous.get('saturation_clients') or 'not reached'}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"ws_load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Saved: {output}")
+
+
+if __name__ == '__main__':
+    main()
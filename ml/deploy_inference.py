@@ -15,235 +15,185 @@ AI COMMAND PROTOCOL (Simple, STM32-Friendly):
 - AI_CRITICAL  → Immediate action, max alerting
 
 CRITICAL INVARIANT:
-Feature extraction must be BIT-IDENTICAL to training phase.
+Feature extraction must be BIT-IDENTICAL to training phase - it is: both use
+ml/inference_core.py (so does the backend).
+
+Usage (from the project root):
+    python ml/deploy_inference.py                      # live, SERIAL_PORT below
+    python ml/deploy_inference.py --port /dev/ttyUSB0
+    python ml/deploy_inference.py --csv datasets/rapid_gas_20260129_225822.csv
 """
 
-import serial
-import joblib
-import numpy as np
+import argparse
 import json
 import time
 from datetime import datetime
-from collections import deque
-
-print("="*70)
-print("REAL-TIME INFERENCE: Gas/Smoke Detection")
-print("="*70)
-
-# ========== LOAD TRAINED MODEL ==========
-print("\n📦 Loading frozen model...")
-try:
-    model = joblib.load('ml_models/gas_smoke_rf.pkl')
-    feature_names = joblib.load('ml_models/feature_names.pkl')
-    with open('ml_models/model_metadata.json', 'r') as f:
-        metadata = json.load(f)
-    
-    print(f"✅ Model loaded: {metadata['model_type']}")
-    print(f"✅ Classes: {metadata['classes']}")
-    print(f"✅ Features: {feature_names}")
-    print(f"✅ Training Accuracy: {metadata['training_accuracy']:.4f}")
-    print(f"✅ Test Accuracy: {metadata['test_accuracy']:.4f}")
-except Exception as e:
-    print(f" ERROR: {e}")
-    print(" Run: python ml/train_model.py")
-    exit(1)
+
+import serial
+
+from inference_core import (
+    InferenceCore, PredictionLog, WINDOW_SIZE, CONFIDENCE_THRESHOLD, WARN_CONFIRMATIONS,
+    csv_source, load_model, parse_reading, run,
+)
 
 # ========== CONFIGURATION ==========
 SERIAL_PORT = 'COM4'
 BAUD_RATE = 9600
+READ_TIMEOUT_S = 0.2     # Idle ticks at this rate keep the log flushing without data
+REFRESH_EVERY = 50       # Re-send the current command every N predictions
+INFERENCE_LOG = 'ml_logs/inference_log.csv'
+# Window size, confidence threshold and WARN confirmation come from inference_core.py
+# (the backend uses the same values)
 
-WINDOW_SIZE = 60        # Match training (60 samples = ~6.3s at 9.5 Hz)
-CONFIDENCE_THRESHOLD = 0.6  # Only act on confident predictions
-
-# Rolling buffers for windowing
-mq2_window = deque(maxlen=WINDOW_SIZE)
-mq135_window = deque(maxlen=WINDOW_SIZE)
 
-# Logging
-INFERENCE_LOG = 'ml_logs/inference_log.csv'
-import os
-os.makedirs('ml_logs', exist_ok=True)
-
-log_file = open(INFERENCE_LOG, 'w')
-log_file.write('timestamp,mq2,mq135,prediction,confidence_safe,confidence_warn,confidence_critical,ai_command\n')
-log_file.flush()
-
-# State tracking
-last_prediction = 'SAFE'
-consecutive_warns = 0
-CONFIRMATION_THRESHOLD = 2  # Confirm WARN with 2 consecutive predictions
-
-print(f"\n⚙️  Configuration:")
-print(f"   Window Size: {WINDOW_SIZE} samples (~6.3 sec)")
-print(f"   Confidence Threshold: {CONFIDENCE_THRESHOLD:.2f}")
-print(f"   Serial Port: {SERIAL_PORT} @ {BAUD_RATE} baud")
-print(f"   Log File: {INFERENCE_LOG}")
-
-# ========== FEATURE EXTRACTION (IDENTICAL TO TRAINING) ==========
-def extract_features(mq2_buffer, mq135_buffer):
-    """
-    Extract EXACT SAME features as training.
-    If this changes, model predictions are invalid.
+# ========== SOURCES & SINKS ==========
+class SerialLink:
     """
-    if len(mq2_buffer) < WINDOW_SIZE or len(mq135_buffer) < WINDOW_SIZE:
-        return None  # Not enough data yet
-    
-    mq2_arr = np.array(list(mq2_buffer))
-    mq135_arr = np.array(list(mq135_buffer))
-    
-    features = {
-        'mq2_now': float(mq2_arr[-1]),
-        'mq135_now': float(mq135_arr[-1]),
-        'mq2_delta': float(mq2_arr[-1] - mq2_arr[0]),
-        'mq135_delta': float(mq135_arr[-1] - mq135_arr[0]),
-        'mq2_mean_window': float(np.mean(mq2_arr)),
-        'mq135_mean_window': float(np.mean(mq135_arr)),
-        'mq2_max_window': float(np.max(mq2_arr)),
-        'mq135_max_window': float(np.max(mq135_arr))
-    }
-    
-    return features
-
-# ========== PREDICTION & COMMAND GENERATION ==========
-def predict_and_command(features):
+    Source and sink for the STM32 UART: yields parsed readings (None when idle, so
+    sinks can flush on time) and writes AI commands back. Reconnects on errors.
     """
-    Run model.predict() and convert to AI command.
-    
-    Returns: (prediction, confidence, ai_command)
-    """
-    # Ensure feature order matches training
-    feature_vector = np.array([[features[fname] for fname in feature_names]])
-    
-    # Get prediction and confidence
-    prediction = model.predict(feature_vector)[0]
-    confidences = model.predict_proba(feature_vector)[0]
-    class_idx = list(model.classes_).index(prediction)
-    confidence = confidences[class_idx]
-    
-    # Convert to AI commands
-    if confidence < CONFIDENCE_THRESHOLD:
-        ai_command = 'AI_SAFE'  # Low confidence = safe assumption
-    elif prediction == 'CRITICAL':
-        ai_command = 'AI_CRITICAL'
-    elif prediction == 'WARN':
-        ai_command = 'AI_WARN'
-    else:
-        ai_command = 'AI_SAFE'
-    
-    return prediction, confidence, ai_command
+    def __init__(self, port, baud, timeout=READ_TIMEOUT_S, refresh_every=REFRESH_EVERY):
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        self.refresh_every = refresh_every
+        self.ser = None
+        self.last_command = None
+        self.decisions = 0
+
+    def _connect(self):
+        while self.ser is None:
+            try:
+                self.ser = serial.Serial(self.port, self.baud, timeout=self.timeout)
+                time.sleep(2)  # Allow port to stabilize
+                self.ser.reset_input_buffer()
+                self.last_command = None  # Device state unknown after (re)connect
+                print(f"✅ Connected to {self.port}\n")
+            except serial.SerialException as e:
+                print(f" Cannot open {self.port}: {e} (retrying in 5s)")
+                time.sleep(5)
+
+    def __iter__(self):
+        while True:
+            self._connect()
+            try:
+                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+            except serial.SerialException as e:
+                print(f"   ⚠️  Serial read failed: {e} (reconnecting)")
+                self.close()
+                continue
+            yield parse_reading(line) if line else None
+
+    def handle(self, decision):
+        self.decisions += 1
+        if decision.ai_command == self.last_command and self.decisions % self.refresh_every:
+            return
+        try:
+            self.ser.write(f"{decision.ai_command}\n".encode())
+            self.last_command = decision.ai_command
+            print(f"   → STM32: {decision.ai_command}")
+        except (serial.SerialException, AttributeError) as e:
+            print(f"   ⚠️  Serial write failed: {e}")
+
+    def tick(self):
+        pass
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+
+
+class ConsoleSink:
+    """Prints predictions when they change (and every REFRESH_EVERY predictions)"""
+    def __init__(self, core):
+        self.core = core
+        self.count = 0
+        self.last_prediction = None
+        self.buffering_shown = 0
+
+    def handle(self, d):
+        self.count += 1
+        if d.prediction != self.last_prediction or self.count % REFRESH_EVERY == 0:
+            print(f"\n[{datetime.fromtimestamp(d.timestamp).isoformat()}]")
+            print(f"   MQ2: {d.mq2:.2f}V | MQ135: {d.mq135:.2f}V")
+            print(f"   Prediction: {d.prediction} ({d.confidence:.2%} confidence)")
+            print(f"   ➜ Command: {d.ai_command}")
+            self.last_prediction = d.prediction
+
+    def tick(self):
+        filled = len(self.core.features.buffer)
+        if not self.core.features.ready and filled != self.buffering_shown:
+            self.buffering_shown = filled
+            print(f"   Buffering: {filled}/{WINDOW_SIZE} samples...", end='\r')
+
+    def close(self):
+        pass
 
-# ========== SERIAL COMMUNICATION ==========
-def send_command_to_stm32(ser, command):
-    """Send AI command to STM32"""
-    try:
-        ser.write(f"{command}\n".encode())
-        print(f"   → STM32: {command}")
-    except Exception as e:
-        print(f"   ⚠️  Serial write failed: {e}")
 
 # ========== MAIN INFERENCE LOOP ==========
 def main():
     """Real-time inference loop"""
-    global consecutive_warns, last_prediction
-    
-    print("\n" + "="*70)
-    print("🔴 STARTING REAL-TIME INFERENCE...")
+    parser = argparse.ArgumentParser(description='Real-time inference against the STM32 (or a recorded dataset)')
+    parser.add_argument('--port', default=SERIAL_PORT)
+    parser.add_argument('--baud', type=int, default=BAUD_RATE)
+    parser.add_argument('--csv', help='run on a recorded dataset instead of the serial port (no commands sent)')
+    parser.add_argument('--log', default=INFERENCE_LOG)
+    args = parser.parse_args()
+
     print("="*70)
-    print("Connecting to STM32...\n")
-    
+    print("REAL-TIME INFERENCE: Gas/Smoke Detection")
+    print("="*70)
+
+    # ========== LOAD TRAINED MODEL ==========
+    print("\n📦 Loading frozen model...")
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-        time.sleep(2)  # Allow port to stabilize
-        print(f"✅ Connected to {SERIAL_PORT}\n")
+        model, feature_names, model_version = load_model('ml_models')
+        with open('ml_models/model_metadata.json', 'r') as f:
+            metadata = json.load(f)
         
+        print(f"✅ Model loaded: {metadata['model_type']} ({model_version})")
+        print(f"✅ Classes: {metadata['classes']}")
+        print(f"✅ Features: {feature_names}")
+        print(f"✅ Training Accuracy: {metadata['training_accuracy']:.4f}")
+        print(f"✅ Test Accuracy: {metadata['test_accuracy']:.4f}")
     except Exception as e:
-        print(f" ERROR: Cannot open {SERIAL_PORT}: {e}")
-        return
-    
-    sample_count = 0
-    
+        print(f" ERROR: {e}")
+        print(" Run: python ml/train_model.py")
+        exit(1)
+
+    core = InferenceCore(model, feature_names, model_version)
+    log = PredictionLog(args.log)
+
+    print(f"\n⚙️  Configuration:")
+    print(f"   Window Size: {WINDOW_SIZE} samples (~6.3 sec)")
+    print(f"   Confidence Threshold: {CONFIDENCE_THRESHOLD:.2f}")
+    print(f"   WARN Confirmation: {WARN_CONFIRMATIONS} consecutive predictions")
+    print(f"   Source: {args.csv or f'{args.port} @ {args.baud} baud'}")
+    print(f"   Log File: {args.log}")
+
+    print("\n" + "="*70)
+    print("🔴 STARTING REAL-TIME INFERENCE...")
+    print("="*70)
+
+    if args.csv:
+        source, sinks = csv_source(args.csv), [log, ConsoleSink(core)]
+    else:
+        print("Connecting to STM32...\n")
+        link = SerialLink(args.port, args.baud)
+        source, sinks = link, [log, ConsoleSink(core), link]
+
+    readings = 0
     try:
-        while True:
-            try:
-                # Read line from STM32
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                if not line or 'MQ2' not in line:
-                    continue
-                
-                # Parse "MQ2: 1.23, MQ135: 0.56"
-                try:
-                    parts = line.split(',')
-                    mq2_str = parts[0].split(':')[1].strip().replace('V', '')
-                    mq135_str = parts[1].split(':')[1].strip().replace('V', '')
-                    
-                    mq2_val = float(mq2_str)
-                    mq135_val = float(mq135_str)
-                except:
-                    continue
-                
-                # Add to rolling windows
-                mq2_window.append(mq2_val)
-                mq135_window.append(mq135_val)
-                sample_count += 1
-                
-                # Try to extract features
-                features = extract_features(mq2_window, mq135_window)
-                
-                if features is None:
-                    # Still collecting data
-                    if sample_count % 10 == 0:
-                        progress = len(mq2_window)
-                        print(f"   Buffering: {progress}/{WINDOW_SIZE} samples...", end='\r')
-                    continue
-                
-                # Clear progress line
-                print("                                      ", end='\r')
-                
-                # Run inference
-                prediction, confidence, ai_command = predict_and_command(features)
-                
-                # Multi-sample confirmation for WARN (reduce false positives)
-                if prediction == 'WARN':
-                    consecutive_warns += 1
-                    if consecutive_warns < CONFIRMATION_THRESHOLD:
-                        ai_command = 'AI_SAFE'  # Wait for confirmation
-                else:
-                    consecutive_warns = 0
-                
-                # Log prediction
-                timestamp = datetime.now().isoformat()
-                log_file.write(
-                    f"{timestamp},{mq2_val:.3f},{mq135_val:.3f},"
-                    f"{prediction},{confidences[0]:.4f},"
-                    f"{confidences[1]:.4f},{confidences[2]:.4f},"
-                    f"{ai_command}\n"
-                )
-                log_file.flush()
-                
-                # Display and send command
-                if prediction != last_prediction or sample_count % 50 == 0:
-                    print(f"\n[{timestamp}]")
-                    print(f"   MQ2: {mq2_val:.2f}V | MQ135: {mq135_val:.2f}V")
-                    print(f"   Prediction: {prediction} ({confidence:.2%} confidence)")
-                    print(f"   ➜ Command: {ai_command}")
-                    
-                    # Send to STM32
-                    send_command_to_stm32(ser, ai_command)
-                    last_prediction = prediction
-                
-            except KeyboardInterrupt:
-                raise
-            except Exception as e:
-                continue
-    
+        readings = run(core, source, sinks)
     except KeyboardInterrupt:
         print("\n\n🛑 Inference stopped by user")
     finally:
-        ser.close()
-        log_file.close()
-        print(f"\n✅ Logged to: {INFERENCE_LOG}")
-        print(f"   Total samples processed: {sample_count}")
+        print(f"\n✅ Logged to: {args.log} ({log.written} predictions)")
+        print(f"   Total predictions: {core.total_predictions}" + (f" from {readings} samples" if readings else ""))
 
 # ========== FAIL-SAFE & ARCHITECTURE NOTES ==========
 ARCHITECTURE_NOTES = """
@@ -11,16 +11,23 @@ STEP 5: Save engineered dataset (no data leakage between train/test)
 """
 
 import pandas as pd
-import numpy as np
+import argparse
 import os
 from datetime import datetime
 
+from inference_core import WINDOW_SIZE, FEATURE_WINDOWS, FeatureEngine, feature_names
+
 # ==================== CONFIGURATION ====================
-WINDOW_SIZE = 60  # 60 samples = ~6.3 seconds (at 9.5 Hz)
+# WINDOW_SIZE (60 samples = ~6.3 seconds at 9.5 Hz, also the label window) and
+# FEATURE_WINDOWS live in inference_core.py, shared with serving
 WINDOW_STRIDE = 30  # Non-overlapping: 30 samples forward
-DATASETS_DIR = 'datasets'
+WINDOWS = tuple(sorted(set(FEATURE_WINDOWS) | {WINDOW_SIZE}))
+TRAIN_FEATURES = feature_names(WINDOWS)
+DATASETS_DIR = 'datasets'      # Or --datasets DIR (e.g. ml/synthetic_traces.py output)
+CSV_CHUNK_ROWS = 100_000       # Long traces are read in chunks, never whole
 OUTPUT_DIR = 'ml_features'
 LABELS_FILE = f'{OUTPUT_DIR}/labeled_dataset.csv'
+META_COLUMNS = ['source', 'end_sample']  # Where each row came from (not features): recording + its last sample
 
 # Threshold values (must match STM32 fail-safe)
 MQ2_SAFE = 1.2
@@ -42,32 +49,30 @@ SCENARIO_LABELS = {
 
 # ==================== FEATURE EXTRACTION ====================
 
-def extract_features(window_mq2, window_mq135):
+def is_window_end(engine):
     """
-    Extract 8 features from a time window.
-    
-    These MUST be identical in training and deployment.
+    True when the sample just pushed ends a training window: the rows line up with the
+    original WINDOW_SIZE/WINDOW_STRIDE grid (longer windows may still be filling, see
+    inference_core.FeatureEngine)
+    """
+    return engine.ready and engine.samples >= WINDOW_SIZE and (engine.samples - WINDOW_SIZE) % WINDOW_STRIDE == 0
+
+def window_row(engine):
+    """
+    Feature row + label for the window ending at the newest sample.
+    Features come from the same engine the live stream uses, so they are
+    identical in training and deployment.
     """
-    features = {
-        'mq2_now': float(window_mq2[-1]),           # Current value
-        'mq135_now': float(window_mq135[-1]),       # Current value
-        'mq2_delta': float(window_mq2[-1] - window_mq2[0]),   # Trend
-        'mq135_delta': float(window_mq135[-1] - window_mq135[0]),
-        'mq2_mean_window': float(np.mean(window_mq2)),        # Average
-        'mq135_mean_window': float(np.mean(window_mq135)),
-        'mq2_max_window': float(np.max(window_mq2)),          # Peak
-        'mq135_max_window': float(np.max(window_mq135))
-    }
-    return features
-
-def label_based_on_max(window_mq2, window_mq135, scenario):
+    row = dict(zip(engine.names, engine.vector()))
+    row['label'] = label_from_max(engine.value('mq2', 'max', WINDOW_SIZE),
+                                  engine.value('mq135', 'max', WINDOW_SIZE))
+    return row
+
+def label_from_max(max_mq2, max_mq135):
     """
-    Label based on maximum value in window (future reference approach).
+    Label based on the maximum value in the last WINDOW_SIZE samples (future reference approach).
     This mimics early prediction before threshold crossing.
     """
-    max_mq2 = np.max(window_mq2)
-    max_mq135 = np.max(window_mq135)
-    
     # Safety: Use the most conservative label
     if max_mq2 >= MQ2_CRITICAL or max_mq135 >= MQ135_CRITICAL:
         return 'CRITICAL'
@@ -79,29 +84,21 @@ def label_based_on_max(window_mq2, window_mq135, scenario):
 def process_csv_file(filepath):
     """
     Process a single CSV file and extract windowed features.
-    Returns list of (features_dict, label) tuples.
+    Returns a list of feature dicts (with 'label' and META_COLUMNS), one per window.
     """
     print(f"  Loading {filepath}...")
-    df = pd.read_csv(filepath)
-    
-    mq2_values = df['mq2'].values
-    mq135_values = df['mq135'].values
-    
+    engine = FeatureEngine(TRAIN_FEATURES)
+    source = os.path.basename(filepath)
     windows = []
     
-    # Slide window across data
-    for i in range(0, len(mq2_values) - WINDOW_SIZE + 1, WINDOW_STRIDE):
-        window_mq2 = mq2_values[i:i+WINDOW_SIZE]
-        window_mq135 = mq135_values[i:i+WINDOW_SIZE]
-        
-        # Extract features
-        features = extract_features(window_mq2, window_mq135)
-        
-        # Label: extract scenario from filename
-        scenario = os.path.basename(filepath).split('_')[0]
-        label = label_based_on_max(window_mq2, window_mq135, scenario)
-        
-        windows.append({**features, 'label': label})
+    # One pass over the data; every window length is updated per sample
+    for chunk in pd.read_csv(filepath, usecols=['mq2', 'mq135'], chunksize=CSV_CHUNK_ROWS):
+        for mq2, mq135 in zip(chunk['mq2'].values, chunk['mq135'].values):
+            engine.push(mq2, mq135)
+            if is_window_end(engine):
+                row = window_row(engine)
+                row['source'], row['end_sample'] = source, engine.samples
+                windows.append(row)
     
     return windows
 
@@ -136,7 +133,11 @@ def create_train_test_split(all_windows):
 
 # ==================== MAIN EXECUTION ====================
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Windowed features + labels from raw sensor CSVs')
+    parser.add_argument('--datasets', default=DATASETS_DIR, help=f'directory of timestamp,mq2,mq135 CSVs (default: {DATASETS_DIR})')
+    datasets_dir = parser.parse_args(argv).datasets
+
     print("="*70)
     print("FEATURE ENGINEERING: Gas/Smoke Detection")
     print("="*70)
@@ -145,11 +146,11 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     # Scan for CSV files
-    csv_files = [f for f in os.listdir(DATASETS_DIR) if f.endswith('.csv')]
-    csv_files = sorted([f for f in csv_files if 'baseline' in f or 'gas' in f or 'smoke' in f])
+    csv_files = [f for f in os.listdir(datasets_dir) if f.endswith('.csv')]
+    csv_files = sorted([f for f in csv_files if 'baseline' in f or 'gas' in f or 'smoke' in f or 'synthetic' in f])
     
     if not csv_files:
-        print(" No CSV files found in datasets/")
+        print(f" No CSV files found in {datasets_dir}/")
         return
     
     print(f"\n Found {len(csv_files)} dataset(s):")
@@ -159,12 +160,12 @@ def main():
     # Process all files
     all_windows = []
     for csv_file in csv_files:
-        filepath = os.path.join(DATASETS_DIR, csv_file)
+        filepath = os.path.join(datasets_dir, csv_file)
         windows = process_csv_file(filepath)
         all_windows.extend(windows)
         print(f"     -> Extracted {len(windows)} windows")
     
-    print(f"\n Total windows extracted: {len(all_windows)}")
+    print(f"\n Total windows extracted: {len(all_windows)} ({len(TRAIN_FEATURES)} features, windows {WINDOWS})")
     
     # Label distribution
     label_counts = {}
@@ -207,7 +208,7 @@ def main():
     
     # Feature statistics
     print("\n Feature Statistics (Training Set):")
-    print(train_df.describe().round(3))
+    print(train_df.drop(columns=META_COLUMNS).describe().round(3))
     
     print("\n" + "="*70)
     print(" FEATURE ENGINEERING COMPLETE")
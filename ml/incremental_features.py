@@ -0,0 +1,265 @@
+"""
+INCREMENTAL TRAINING-SET BUILDER (production database -> feature store)
+=======================================================================
+Appends windows computed from the backend's `ml_predictions` rows to
+ml_features/train_features.csv, processing only rows newer than a stored watermark.
+
+ml_predictions holds one row per processed sample with the voltages fed to the model,
+i.e. the full-rate stream (~9.5 Hz, like the recorded datasets). sensor_data is NOT
+used: the archiver writes it every 10 s, so a 60-sample window there would span 10
+minutes instead of ~6 s and its features/labels would not match the training data.
+
+The watermark (ml_features/db_watermark.json) holds the last row id consumed plus the
+last samples (as many as the longest feature window), so windows spanning two runs come
+out exactly as if all rows had been processed in one pass. Rows use the same feature
+engine, window grid (is_window_end) and labels (window_row) as feature_engineering.py,
+with the feature columns already in train_features.csv; a gap longer than MAX_GAP_S
+(device unplugged, server down, samples shed under overload) starts a fresh window
+instead of bridging it, so every window is a contiguous full-rate stretch.
+
+Usage (from the project root, after `python ml/feature_engineering.py` has run once):
+    python ml/incremental_features.py
+    python ml/incremental_features.py --db backend/iot_v2.db
+
+The watermark also records the size and sha256 of train_features.csv after each append.
+If the file has the recorded prefix plus more bytes, a previous run appended windows but
+died before saving its watermark; that tail is cut off and recomputed. Any other
+difference means feature_engineering.py rewrote the file, and the production windows are
+rebuilt from the first row.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from inference_core import FeatureEngine
+from feature_engineering import (
+    OUTPUT_DIR, META_COLUMNS, is_window_end, window_row
+)
+
+# ==================== CONFIGURATION ====================
+DB_PATH = 'backend/iot_v2.db'
+TRAIN_FILE = f'{OUTPUT_DIR}/train_features.csv'
+WATERMARK_FILE = f'{OUTPUT_DIR}/db_watermark.json'
+FETCH_ROWS = 10000   # Rows read from the database per batch
+SOURCE_TABLE = 'ml_predictions'  # One row per processed sample (full rate)
+MAX_GAP_S = 0.5      # Larger gaps between samples break the window (~5 missing samples at 9.5 Hz)
+SOURCE = 'predictions'  # META_COLUMNS 'source' of these rows ('end_sample' = last ml_predictions id)
+
+EMPTY_STATE = {
+    'table': SOURCE_TABLE,  # Table last_id refers to
+    'last_id': 0,
+    'carry': {'ts': [], 'mq2': [], 'mq135': [], 'n': 0},  # Last samples (longest window) + samples since reset
+    'windows_appended': 0,
+    'train_rows': None,  # Row count of TRAIN_FILE after our last append
+    'train_bytes': None,  # ... its size and sha256 (detects regeneration and interrupted appends)
+    'train_sha256': None,
+    'updated_at': None,
+}
+
+
+def load_watermark():
+    if not os.path.exists(WATERMARK_FILE):
+        return json.loads(json.dumps(EMPTY_STATE))
+    with open(WATERMARK_FILE) as f:
+        return json.load(f)
+
+
+def save_watermark(state):
+    # Write-then-rename so an interrupted run never leaves a half-written watermark
+    state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    tmp = WATERMARK_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, WATERMARK_FILE)
+
+
+def count_rows(path):
+    with open(path) as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def hash_prefix(path, size):
+    """sha256 over the first `size` bytes of path (the object can be fed further appends)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while size > 0:
+            chunk = f.read(min(size, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            size -= len(chunk)
+    return digest
+
+
+def check_store(state):
+    """
+    Compare TRAIN_FILE with what the watermark recorded after the last append.
+    Returns the state to continue from (EMPTY_STATE if the file was regenerated).
+    """
+    size = os.path.getsize(TRAIN_FILE)
+    if state.get('train_sha256') is None:
+        # Watermarks from before the hash was stored only know the row count
+        if state['train_rows'] is not None and count_rows(TRAIN_FILE) < state['train_rows']:
+            print(" train_features.csv was regenerated - rebuilding from the first row")
+            return json.loads(json.dumps(EMPTY_STATE))
+        return state
+    recorded = state['train_bytes']
+    if size < recorded or hash_prefix(TRAIN_FILE, recorded).hexdigest() != state['train_sha256']:
+        # feature_engineering.py rewrote the file, dropping what we appended before
+        print(" train_features.csv was regenerated - rebuilding from the first row")
+        return json.loads(json.dumps(EMPTY_STATE))
+    if size > recorded:
+        # Appended by a run that stopped before saving its watermark; recomputed below
+        print(f" Removing {size - recorded} bytes left by an interrupted run")
+        os.truncate(TRAIN_FILE, recorded)
+    return state
+
+
+class WindowBuilder:
+    """Sliding windows over a sample stream that arrives in pieces"""
+    def __init__(self, carry, names):
+        self.engine = FeatureEngine(names)
+        self.tail = deque(maxlen=self.engine.max_window)  # (ts, mq2, mq135): enough to rebuild the engine
+        # Samples since the last reset (older watermarks only stored the unfinished window)
+        samples = carry.get('n', len(carry['ts']))
+        for row in zip(carry['ts'], carry['mq2'], carry['mq135']):
+            self._push(*row)
+        self.engine.samples = samples
+
+    def _push(self, ts, mq2, mq135):
+        self.tail.append((ts, mq2, mq135))
+        self.engine.push(mq2, mq135)
+
+    def feed(self, rows):
+        """rows: (id, unix_ts, mq2_voltage, mq135_voltage). Returns the completed feature rows."""
+        windows = []
+        for row_id, ts, mq2, mq135 in rows:
+            if self.tail and ts - self.tail[-1][0] > MAX_GAP_S:
+                self._reset()
+            self._push(ts, mq2, mq135)
+            if is_window_end(self.engine):
+                row = window_row(self.engine)
+                row['source'], row['end_sample'] = SOURCE, row_id
+                windows.append(row)
+        return windows
+
+    def _reset(self):
+        self.engine = FeatureEngine(self.engine.names)
+        self.tail.clear()
+
+    def carry(self):
+        ts, mq2, mq135 = (list(col) for col in zip(*self.tail)) if self.tail else ([], [], [])
+        return {'ts': ts, 'mq2': mq2, 'mq135': mq135, 'n': self.engine.samples}
+
+
+def fetch_new_rows(db_path, last_id):
+    """Yield batches of (id, unix_ts, mq2_voltage, mq135_voltage) with id > last_id"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(
+            f"SELECT id, timestamp, mq2_value, mq135_value FROM {SOURCE_TABLE} "
+            "WHERE id > ? AND timestamp IS NOT NULL AND mq2_value IS NOT NULL AND mq135_value IS NOT NULL "
+            "ORDER BY id", (last_id,)
+        )
+        while True:
+            batch = cursor.fetchmany(FETCH_ROWS)
+            if not batch:
+                break
+            yield [(row_id, datetime.fromisoformat(ts).timestamp(), mq2, mq135)
+                   for row_id, ts, mq2, mq135 in batch]
+    finally:
+        conn.close()
+
+
+def append_windows(windows, header, digest):
+    """Append to TRAIN_FILE and fold the written bytes into `digest`"""
+    buffer = io.StringIO()
+    # extrasaction: stores written before META_COLUMNS existed have no column for them
+    csv.DictWriter(buffer, fieldnames=header, extrasaction='ignore').writerows(windows)
+    data = buffer.getvalue().encode('utf-8')
+    with open(TRAIN_FILE, 'ab') as f:
+        f.write(data)
+    digest.update(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append windows from logged full-rate samples (ml_predictions) to the feature store")
+    parser.add_argument('--db', default=DB_PATH, help=f'backend database (default: {DB_PATH})')
+    args = parser.parse_args(argv)
+
+    print("="*70)
+    print("INCREMENTAL FEATURES: production database -> feature store")
+    print("="*70)
+
+    if not os.path.exists(TRAIN_FILE):
+        print(" ERROR: Run feature_engineering.py first!")
+        print(" Command: python ml/feature_engineering.py")
+        exit(1)
+    if not os.path.exists(args.db):
+        print(f" ERROR: Database not found: {args.db}")
+        exit(1)
+
+    with open(TRAIN_FILE) as f:
+        header = next(csv.reader(f))
+
+    state = check_store(load_watermark())
+    if state.get('table', 'sensor_data') != SOURCE_TABLE:
+        # Older runs windowed the 10 s sensor_data archive
+        if state['windows_appended']:
+            print(" ERROR: train_features.csv holds windows built from the 10 s sensor_data archive")
+            print(" Regenerate it first: python ml/feature_engineering.py")
+            exit(1)
+        state = json.loads(json.dumps(EMPTY_STATE))
+    train_rows = count_rows(TRAIN_FILE)
+    digest = hash_prefix(TRAIN_FILE, os.path.getsize(TRAIN_FILE))
+
+    print(f"\n Watermark: row id {state['last_id']} ({len(state['carry']['ts'])} carried samples)")
+    started = time.time()
+    builder = WindowBuilder(state['carry'], [name for name in header if name != 'label' and name not in META_COLUMNS])
+    rows_read = 0
+    new_windows = 0
+    label_counts = {}
+    intervals = []
+
+    for batch in fetch_new_rows(args.db, state['last_id']):
+        windows = builder.feed(batch)
+        if windows:
+            append_windows(windows, header, digest)
+        for w in windows:
+            label_counts[w['label']] = label_counts.get(w['label'], 0) + 1
+        rows_read += len(batch)
+        new_windows += len(windows)
+        intervals.extend(np.diff([row[1] for row in batch]).tolist()[:1000])
+
+        # Advance the watermark after every batch so an interrupted run resumes cleanly
+        # (a crash before this line leaves bytes past train_bytes, removed by check_store)
+        state['last_id'] = batch[-1][0]
+        state['carry'] = builder.carry()
+        state['windows_appended'] += len(windows)
+        state['train_rows'] = train_rows + new_windows
+        state['train_bytes'] = os.path.getsize(TRAIN_FILE)
+        state['train_sha256'] = digest.hexdigest()
+        save_watermark(state)
+
+    print(f"\n Read {rows_read} new rows, appended {new_windows} windows in {time.time() - started:.2f}s")
+    for label, count in sorted(label_counts.items()):
+        print(f"   {label:10s}: {count:5d}")
+    if intervals:
+        interval = float(np.median(intervals))
+        print(f"\n Median sample interval: {interval:.3f}s (manual datasets: ~0.105s)")
+    print(f" Watermark now at row id {state['last_id']} ({state['windows_appended']} windows appended in total)")
+    print(f"\nNext step: python ml/train_model.py")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,498 @@
+"""
+STREAMING INFERENCE CORE
+========================
+The one implementation of window features, prediction and AI command logic, used by
+training (feature_engineering.py, incremental_features.py), the standalone script
+(deploy_inference.py) and the backend (backend/app/services/ml_service.py).
+
+Features are computed over several window lengths at once (FEATURE_WINDOWS): mean, max,
+delta, slope and std per sensor and window, updated incrementally per sample. A model
+only pays for the windows its feature_names use - the original 8-feature model needs
+the 60-sample window alone.
+
+Rows are available after WINDOW_SIZE samples (~6.3 s), whatever the longest window:
+until a longer window has filled, its stats cover every sample seen so far. Training
+rows at the start of each recording are built the same way, so a restarted backend
+predicts after the same short warm-up, with long-window features that match training.
+
+    core = InferenceCore(*load_model('ml_models'))
+    decision = core.step(mq2_voltage, mq135_voltage)   # None while the window fills
+
+Standalone runs plug a source (iterable of (mq2, mq135) readings, None = idle tick)
+into sinks (objects with handle(decision), tick() and close()) via run().
+
+Parity check (the rows feature_engineering.py trains on vs the features served for the
+same recording, plus brute-force numpy, at every training row position):
+    python ml/inference_core.py --parity
+    python ml/inference_core.py --parity datasets/rapid_gas_20260129_225822.csv
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# ==================== CONFIGURATION ====================
+WINDOW_SIZE = 60             # 60 samples = ~6.3 seconds (at 9.5 Hz); the legacy window, also used for labels
+FEATURE_WINDOWS = (10, 60, 600)  # ~1 s (fast leaks), ~6 s, ~63 s (slow drift)
+SENSORS = ('mq2', 'mq135')
+STATS = ('delta', 'mean', 'max', 'slope', 'std')
+CONFIDENCE_THRESHOLD = 0.45  # Below this the command falls back to AI_SAFE
+WARN_CONFIRMATIONS = 2       # Consecutive WARN predictions before AI_WARN is sent
+
+# The 8 features of the original model (WINDOW_SIZE; delta/mean/max keep their old names)
+FEATURE_NAMES = [
+    'mq2_now', 'mq135_now',
+    'mq2_delta', 'mq135_delta',
+    'mq2_mean_window', 'mq135_mean_window',
+    'mq2_max_window', 'mq135_max_window',
+]
+LEGACY_NAMES = {'delta': '{}_delta', 'mean': '{}_mean_window', 'max': '{}_max_window'}
+
+
+# ==================== FEATURES ====================
+
+def feature_name(sensor, stat, window):
+    if window == WINDOW_SIZE and stat in LEGACY_NAMES:
+        return LEGACY_NAMES[stat].format(sensor)
+    return f'{sensor}_{stat}_{window}'
+
+
+def feature_names(windows=FEATURE_WINDOWS, stats=STATS):
+    """Column order: *_now, then per window, per stat, per sensor (windows=(60,) with
+    delta/mean/max gives exactly FEATURE_NAMES)"""
+    names = [f'{sensor}_now' for sensor in SENSORS]
+    for window in windows:
+        for stat in stats:
+            names.extend(feature_name(sensor, stat, window) for sensor in SENSORS)
+    return names
+
+
+def parse_feature_name(name):
+    """'mq2_slope_600' -> ('mq2', 'slope', 600); 'mq2_mean_window' -> ('mq2', 'mean', 60); 'mq2_now' -> ('mq2', 'now', None)"""
+    sensor, rest = name.split('_', 1)
+    if rest == 'now':
+        return sensor, 'now', None
+    for stat, pattern in LEGACY_NAMES.items():
+        if name == pattern.format(sensor):
+            return sensor, stat, WINDOW_SIZE
+    stat, window = rest.rsplit('_', 1)
+    return sensor, stat, int(window)
+
+
+class RollingStats:
+    """
+    delta, mean, max, slope and std of the last `size` values (fewer while filling), O(1) amortized per push:
+    running sums (sum, sum of squares, sum of index*value) for mean/std/slope and a
+    monotonic queue for the max. Sums are kept relative to a shift (the window mean at the
+    last recompute) and recomputed exactly once per `size` pushes, so flat signals keep
+    an accurate std and rounding error cannot build up over long streams.
+    """
+    __slots__ = ('size', 'values', 'maxq', 'count', 'base', 'shift', 's', 'q', 't')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.maxq = deque()  # (index, value), values decreasing
+        self.count = 0       # Values pushed so far (index of the next one)
+        self.base = 0        # Index origin for the index*value sum
+        self.shift = None    # Subtracted from every value in the sums
+        self.s = self.q = self.t = 0.0
+
+    @property
+    def ready(self):
+        return len(self.values) == self.size
+
+    def push(self, y):
+        if self.shift is None:
+            self.shift = y
+        i = self.count
+        self.count += 1
+        self.values.append(y)
+        d = y - self.shift
+        self.s += d
+        self.q += d * d
+        self.t += (i - self.base) * d
+        while self.maxq and self.maxq[-1][1] <= y:
+            self.maxq.pop()
+        self.maxq.append((i, y))
+        if len(self.values) > self.size:
+            d = self.values.popleft() - self.shift
+            self.s -= d
+            self.q -= d * d
+            self.t -= (i - self.size - self.base) * d
+        if self.maxq[0][0] <= i - self.size:
+            self.maxq.popleft()
+        if self.count % self.size == 0:
+            self._resum()
+
+    def _resum(self):
+        self.base = self.count - len(self.values)
+        self.shift = math.fsum(self.values) / len(self.values)
+        d = [v - self.shift for v in self.values]
+        self.s = math.fsum(d)
+        self.q = math.fsum(x * x for x in d)
+        self.t = math.fsum(k * x for k, x in enumerate(d))
+
+    def stat(self, name):
+        n = len(self.values)
+        if name == 'delta':
+            return self.values[-1] - self.values[0]
+        if name == 'max':
+            return self.maxq[0][1]
+        mean = self.s / n  # Relative to the shift
+        if name == 'mean':
+            return self.shift + mean
+        if name == 'std':
+            return math.sqrt(max(self.q / n - mean * mean, 0.0))  # Population std, like np.std
+        if name == 'slope':
+            # Least squares over x = 0..n-1 (volts per sample); the shift cancels out
+            if n < 2:
+                return 0.0
+            sxy = self.t - (self.count - n - self.base) * self.s
+            sx = n * (n - 1) / 2
+            sxx = (n - 1) * n * (2 * n - 1) / 6
+            return (n * sxy - sx * self.s) / (n * sxx - sx * sx)
+        raise ValueError(f"Unknown stat '{name}'")
+
+
+class FeatureEngine:
+    """
+    Computes the named features over every window they use in one pass per sample
+    (cost grows with the number of windows, not their length). Training and serving
+    both build their rows with this.
+    """
+    def __init__(self, names=None):
+        self.names = list(names or FEATURE_NAMES)
+        self.specs = [parse_feature_name(name) for name in self.names]
+        windows = sorted({w for _, stat, w in self.specs if w is not None})
+        self.stats = {(sensor, w): RollingStats(w) for sensor in SENSORS for w in windows}
+        self.windows = windows
+        self.max_window = windows[-1] if windows else 1
+        # Rows start once the WINDOW_SIZE window is full; longer windows are partial until then
+        self.warmup = min(self.max_window, WINDOW_SIZE)
+        self.samples = 0
+        self.now = {}
+
+    @property
+    def ready(self):
+        return self.samples >= self.warmup
+
+    def push(self, mq2, mq135):
+        self.samples += 1
+        for sensor, value in (('mq2', float(mq2)), ('mq135', float(mq135))):
+            self.now[sensor] = value
+            for w in self.windows:
+                self.stats[(sensor, w)].push(value)
+
+    def value(self, sensor, stat, window=None):
+        if stat == 'now':
+            return self.now[sensor]
+        return self.stats[(sensor, window)].stat(stat)
+
+    def vector(self):
+        return np.array([self.value(*spec) for spec in self.specs])
+
+
+class StreamingFeatures:
+    """Feature rows over the live stream; push() returns a vector once the engine's warm-up is done"""
+    def __init__(self, window_size=None, feature_names=None):
+        self.engine = FeatureEngine(feature_names)
+        # Recent readings for warm-up progress and the backend's trend forecast
+        self.window_size = window_size or self.engine.max_window
+        self.buffer = deque(maxlen=self.window_size)  # (mq2, mq135) tuples, oldest first
+
+    @property
+    def feature_names(self):
+        return self.engine.names
+
+    @property
+    def ready(self):
+        return self.engine.ready
+
+    def push(self, mq2, mq135):
+        """Add one reading. Returns a 1-D float array in feature_names order, or None while warming up."""
+        self.buffer.append((float(mq2), float(mq135)))
+        self.engine.push(mq2, mq135)
+        if not self.engine.ready:
+            return None
+        return self.engine.vector()
+
+
+def reference_features(mq2_values, mq135_values, names):
+    """
+    Brute-force numpy version of FeatureEngine for the newest sample of the given
+    history (oldest first); used by the parity check.
+    """
+    history = {'mq2': np.asarray(mq2_values, dtype=float), 'mq135': np.asarray(mq135_values, dtype=float)}
+    row = []
+    for sensor, stat, window in map(parse_feature_name, names):
+        if stat == 'now':
+            row.append(history[sensor][-1])
+            continue
+        y = history[sensor][-window:]
+        if stat == 'delta':
+            row.append(y[-1] - y[0])
+        elif stat == 'mean':
+            row.append(np.mean(y))
+        elif stat == 'max':
+            row.append(np.max(y))
+        elif stat == 'std':
+            row.append(np.std(y))
+        else:
+            row.append(np.polyfit(np.arange(len(y)), y, 1)[0])
+    return np.array(row)
+
+
+# ==================== MODEL ====================
+
+def load_model(model_dir='ml_models'):
+    """Returns (model, feature_names, model_version) from a model directory"""
+    import joblib
+    model_path = os.path.join(model_dir, 'gas_smoke_rf.pkl')
+    model = joblib.load(model_path)
+    feature_names = joblib.load(os.path.join(model_dir, 'feature_names.pkl'))
+    # One row per call: a thread pool per prediction costs more than the trees
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=1)
+    with open(model_path, 'rb') as f:
+        version = 'gas_smoke_rf@' + hashlib.sha256(f.read()).hexdigest()[:12]
+    return model, feature_names, version
+
+
+class Decision:
+    """One prediction and the command it maps to"""
+    __slots__ = ('mq2', 'mq135', 'prediction', 'confidence', 'probs', 'ai_command', 'features', 'timestamp')
+
+    def __init__(self, mq2, mq135, prediction, confidence, probs, ai_command, features):
+        self.mq2 = mq2
+        self.mq135 = mq135
+        self.prediction = prediction
+        self.confidence = confidence
+        self.probs = probs          # {'safe': p, 'warn': p, 'crit': p}
+        self.ai_command = ai_command
+        self.features = features    # 1-D array in feature_names order
+        self.timestamp = time.time()
+
+
+class InferenceCore:
+    def __init__(self, model, feature_names, model_version=None,
+                 confidence_threshold=CONFIDENCE_THRESHOLD, warn_confirmations=WARN_CONFIRMATIONS,
+                 features=None):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self.model_version = model_version
+        # Pass `features` to keep the window across a model reload
+        self.features = features if features is not None else StreamingFeatures(feature_names=self.feature_names)
+        self.confidence_threshold = confidence_threshold
+        self.warn_confirmations = warn_confirmations
+        self.consecutive_warns = 0
+        self.total_predictions = 0
+        self._classes = [str(c) for c in model.classes_]
+
+    def predict(self, features):
+        """features: 1-D vector -> (prediction, confidence, probs)"""
+        import pandas as pd
+        # Named columns: the model was fitted on a DataFrame
+        X = pd.DataFrame([features], columns=self.feature_names)
+        probabilities = self.model.predict_proba(X)[0]
+        best = int(np.argmax(probabilities))  # Same as model.predict(), without a second pass over the trees
+        by_class = dict(zip(self._classes, probabilities))
+        probs = {
+            'safe': float(by_class.get('SAFE', 0.0)),
+            'warn': float(by_class.get('WARN', 0.0)),
+            'crit': float(by_class.get('CRITICAL', 0.0)),
+        }
+        return self._classes[best], float(probabilities[best]), probs
+
+    def command_for(self, prediction, confidence):
+        """Map a prediction to AI_*; WARN needs warn_confirmations in a row (fewer false alarms)"""
+        if prediction == 'WARN':
+            self.consecutive_warns += 1
+        else:
+            self.consecutive_warns = 0
+        if confidence < self.confidence_threshold:
+            return 'AI_SAFE'  # Low confidence = safe assumption
+        if prediction == 'WARN' and self.consecutive_warns < self.warn_confirmations:
+            return 'AI_SAFE'  # Wait for confirmation
+        return f'AI_{prediction}'
+
+    def step(self, mq2, mq135):
+        """Feed one reading. Returns a Decision, or None while the window is filling."""
+        features = self.features.push(mq2, mq135)
+        if features is None:
+            return None
+        prediction, confidence, probs = self.predict(features)
+        ai_command = self.command_for(prediction, confidence)
+        self.total_predictions += 1
+        return Decision(mq2, mq135, prediction, confidence, probs, ai_command, features)
+
+
+# ==================== SOURCES & SINKS ====================
+
+def parse_reading(line):
+    """'MQ2: 1.23V, MQ135: 0.56V' -> (1.23, 0.56), or None"""
+    if 'MQ2' not in line or 'MQ135' not in line:
+        return None
+    try:
+        parts = line.split(',')
+        mq2 = float(parts[0].split(':')[1].strip().replace('V', ''))
+        mq135 = float(parts[1].split(':')[1].strip().replace('V', ''))
+        return mq2, mq135
+    except (IndexError, ValueError):
+        return None
+
+
+def csv_source(path):
+    """Readings from a recorded dataset (timestamp,mq2,mq135), as fast as they are consumed"""
+    import csv
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield float(row['mq2']), float(row['mq135'])
+
+
+class PredictionLog:
+    """CSV prediction log written in batches (every flush_rows rows or flush_interval_s)"""
+    HEADER = 'timestamp,mq2,mq135,prediction,confidence_safe,confidence_warn,confidence_critical,ai_command\n'
+
+    def __init__(self, path, flush_rows=200, flush_interval_s=5.0):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.rows = []
+        self.written = 0
+        self._last_flush = time.monotonic()
+        self._file = open(path, 'w')
+        self._file.write(self.HEADER)
+
+    def handle(self, d):
+        self.rows.append(
+            f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(d.timestamp))},{d.mq2:.3f},{d.mq135:.3f},"
+            f"{d.prediction},{d.probs['safe']:.4f},{d.probs['warn']:.4f},{d.probs['crit']:.4f},{d.ai_command}\n"
+        )
+        if len(self.rows) >= self.flush_rows:
+            self.flush()
+
+    def tick(self):
+        if self.rows and time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def flush(self):
+        self._file.writelines(self.rows)
+        self._file.flush()
+        self.written += len(self.rows)
+        self.rows = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def run(core, source, sinks):
+    """Drive the core from a source into sinks until the source ends (or Ctrl+C). Returns readings seen."""
+    readings = 0
+    try:
+        for item in source:
+            if item is not None:
+                readings += 1
+                decision = core.step(*item)
+                if decision is not None:
+                    for sink in sinks:
+                        sink.handle(decision)
+            for sink in sinks:
+                sink.tick()
+    finally:
+        for sink in sinks:
+            sink.close()
+    return readings
+
+
+# ==================== PARITY CHECK ====================
+
+def deployed_feature_names(model_dir='ml_models'):
+    """Feature names of the deployed model (what serving computes), None if there is none"""
+    path = os.path.join(model_dir, 'feature_names.pkl')
+    if not os.path.exists(path):
+        return None
+    import joblib
+    return list(joblib.load(path))
+
+
+def check_parity(csv_files, names=None, rtol=1e-7, atol=1e-9):
+    """
+    Training vs serving, per dataset:
+    - training: the rows feature_engineering.py writes (process_csv_file)
+    - serving: the recording streamed through StreamingFeatures (what ml_service and
+      deploy_inference feed each reading to), read at each training row's end_sample
+    Every `names` feature must be in the training rows and match; serving must have a
+    vector at every training row. Both are also checked against a brute-force numpy
+    computation over the raw history (reference_features). Returns the number of
+    mismatching rows.
+    """
+    import feature_engineering
+
+    names = list(names or deployed_feature_names() or feature_engineering.TRAIN_FEATURES)
+    mismatches = 0
+    for path in csv_files:
+        samples = np.array(list(csv_source(path)))
+        training = feature_engineering.process_csv_file(path)
+        missing = [name for name in names if training and name not in training[0]]
+        if missing:
+            print(f"   {os.path.basename(path):40s} training rows lack {missing}  MISMATCH")
+            mismatches += len(training)
+            continue
+        by_end = {row['end_sample']: row for row in training}
+
+        serving = StreamingFeatures(feature_names=names)
+        compared = file_mismatches = 0
+        worst = 0.0
+        for i, (mq2, mq135) in enumerate(samples, start=1):
+            vector = serving.push(mq2, mq135)
+            row = by_end.pop(i, None)
+            if row is None:
+                continue
+            compared += 1
+            if vector is None:
+                file_mismatches += 1  # Training has a row where serving is still warming up
+                continue
+            trained = np.array([row[name] for name in names], dtype=float)
+            reference = reference_features(samples[:i, 0], samples[:i, 1], names)
+            worst = max(worst, float(np.max(np.abs(vector - trained))), float(np.max(np.abs(vector - reference))))
+            if not (np.allclose(vector, trained, rtol=rtol, atol=atol) and np.allclose(vector, reference, rtol=rtol, atol=atol)):
+                file_mismatches += 1
+        file_mismatches += len(by_end)  # Training rows past the end of the stream
+        status = 'OK' if file_mismatches == 0 else 'MISMATCH'
+        print(f"   {os.path.basename(path):40s} {compared:5d} rows  max |diff| {worst:.2e}  {status}")
+        mismatches += file_mismatches
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Streaming inference core self-checks')
+    parser.add_argument('--parity', nargs='*', metavar='CSV',
+                        help='check served features against the training rows (default: all datasets/)')
+    args = parser.parse_args(argv)
+    if args.parity is None:
+        parser.print_help()
+        return 0
+
+    print("="*70)
+    print("PARITY: training rows vs served features (and brute-force windows)")
+    print("="*70)
+    csv_files = args.parity or sorted(
+        os.path.join('datasets', f) for f in os.listdir('datasets') if f.endswith('.csv')
+    )
+    mismatches = check_parity(csv_files)
+    print(f"\n {'PASS' if mismatches == 0 else f'FAIL: {mismatches} window(s) differ'}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+SYNTHETIC SENSOR TRACES FOR SCALE TESTING
+=========================================
+Generates realistic MQ2/MQ135 voltage streams, lazily, for as many devices and as long
+as needed (nothing is held in memory beyond each device's current state):
+
+- per-device baselines with slow drift (mean-reverting random walk)
+- sensor noise (Gaussian, rounded to 0.01V like the firmware prints), rare glitch spikes
+- events: gradual / rapid gas leaks, gradual / critical smoke, shaped as rise - hold -
+  fall, seen through the sensors' response lag (fast heat-up, slow recovery)
+- irregular sample spacing around the configured rate (the real logger runs ~9.5 Hz)
+
+Scenarios mirror the recorded datasets (safe_baseline, gradual_gas, rapid_gas,
+gradual_smoke, critical_smoke: repeated events of that kind) plus 'mixed' (any kind).
+
+Used by:
+- the replay sensor source: IOT_REPLAY_CSV=synthetic:scenario=mixed,rate=50,seed=1
+  (also benchmarks/ws_load.py --csv synthetic:...), streamed, never loaded
+- CSV output (timestamp,mq2,mq135; one file per device) for feature_engineering.py:
+
+Usage (from the project root):
+    python ml/synthetic_traces.py --devices 20 --hours 6 --out-dir datasets/synthetic
+    python ml/feature_engineering.py --datasets datasets/synthetic
+    python ml/synthetic_traces.py --devices 1000 --rate 10 --seconds 60 --stdout | head
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+import time
+
+# ==================== CONFIGURATION ====================
+RATE_HZ = 9.5             # Samples per second per device (the recorded datasets)
+RATE_JITTER = 0.15        # Sample spacing varies +-15% around 1/rate
+SPEC_PREFIX = 'synthetic:'
+
+BASELINE_MQ2 = (0.85, 1.00)    # Clean-air voltage range, drawn per device
+BASELINE_MQ135 = (0.40, 0.78)
+DRIFT_SIGMA_V = 0.03           # Long-run spread of the baseline drift
+DRIFT_TAU_S = 1800.0           # Drift correlation time
+NOISE_V = 0.006                # Per-sample Gaussian noise
+GLITCH_PROB = 0.0005           # Single-sample spikes (loose wire, EMI)
+RESPONSE_RISE_S = 2.0          # Sensor lag while the gas level rises
+RESPONSE_FALL_S = 25.0         # ... and while it clears
+V_MAX = 3.3                    # ADC reference
+
+QUIET_MEAN_S = 240.0           # Mean clean-air gap between events
+
+# Event shapes: rise/hold/fall seconds and peak (added volts) ranges per sensor
+EVENTS = {
+    'gradual_gas':    {'rise': (120, 300), 'hold': (30, 120), 'fall': (60, 180), 'mq2': (0.4, 1.4), 'mq135': (0.1, 0.6)},
+    'rapid_gas':      {'rise': (4, 20),    'hold': (20, 90),  'fall': (30, 90),  'mq2': (1.1, 2.0), 'mq135': (0.3, 1.0)},
+    'gradual_smoke':  {'rise': (120, 300), 'hold': (30, 120), 'fall': (60, 180), 'mq2': (0.1, 0.4), 'mq135': (0.4, 1.4)},
+    'critical_smoke': {'rise': (5, 30),    'hold': (20, 90),  'fall': (40, 120), 'mq2': (0.3, 0.6), 'mq135': (1.3, 2.3)},
+}
+SCENARIOS = ('safe_baseline', *EVENTS, 'mixed')
+
+
+# ==================== ONE DEVICE ====================
+def device_stream(scenario='mixed', rate=RATE_HZ, seed=0, duration=None, start=0.0):
+    """
+    Endless (or `duration` seconds) generator of (t, mq2, mq135) for one device.
+    Same scenario/rate/seed -> same trace.
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario '{scenario}' (expected one of {', '.join(SCENARIOS)})")
+    rng = random.Random(f'{scenario}:{seed}')
+    period = 1.0 / rate
+    kinds = list(EVENTS) if scenario == 'mixed' else [scenario] if scenario in EVENTS else []
+
+    base_mq2, base_mq135 = rng.uniform(*BASELINE_MQ2), rng.uniform(*BASELINE_MQ135)
+    drift_mq2 = drift_mq135 = 0.0
+    level_mq2 = level_mq135 = 0.0   # What the sensors currently "see" (after the response lag)
+    event = None                    # (start, rise, hold, fall, peak_mq2, peak_mq135)
+    next_event = start + (rng.expovariate(1 / QUIET_MEAN_S) if kinds else math.inf)
+
+    t = start + rng.uniform(0, period)  # Devices do not sample in lockstep
+    end = start + duration if duration is not None else math.inf
+    while t < end:
+        dt = period * (1 + rng.uniform(-RATE_JITTER, RATE_JITTER))
+
+        # Baseline drift: Ornstein-Uhlenbeck step (mean 0, stationary spread DRIFT_SIGMA_V)
+        decay = math.exp(-dt / DRIFT_TAU_S)
+        spread = DRIFT_SIGMA_V * math.sqrt(1 - decay * decay)
+        drift_mq2 = drift_mq2 * decay + rng.gauss(0, spread)
+        drift_mq135 = drift_mq135 * decay + rng.gauss(0, spread)
+
+        # Event schedule
+        if event is None and t >= next_event:
+            shape = EVENTS[rng.choice(kinds)]
+            event = (t, rng.uniform(*shape['rise']), rng.uniform(*shape['hold']), rng.uniform(*shape['fall']),
+                     rng.uniform(*shape['mq2']), rng.uniform(*shape['mq135']))
+        target = 0.0
+        if event is not None:
+            e_start, rise, hold, fall, _, _ = event
+            age = t - e_start
+            if age < rise:
+                x = age / rise
+                target = x * x * (3 - 2 * x)  # smoothstep
+            elif age < rise + hold:
+                target = 1.0
+            elif age < rise + hold + fall:
+                target = 1 - (age - rise - hold) / fall
+            else:
+                event = None
+                next_event = t + rng.expovariate(1 / QUIET_MEAN_S)
+        peak_mq2, peak_mq135 = (event[4], event[5]) if event is not None else (0.0, 0.0)
+
+        # First-order sensor response, faster heating up than clearing
+        for_mq2, for_mq135 = target * peak_mq2, target * peak_mq135
+        level_mq2 += (for_mq2 - level_mq2) * (1 - math.exp(-dt / (RESPONSE_RISE_S if for_mq2 > level_mq2 else RESPONSE_FALL_S)))
+        level_mq135 += (for_mq135 - level_mq135) * (1 - math.exp(-dt / (RESPONSE_RISE_S if for_mq135 > level_mq135 else RESPONSE_FALL_S)))
+
+        mq2 = base_mq2 + drift_mq2 + level_mq2 + rng.gauss(0, NOISE_V)
+        mq135 = base_mq135 + drift_mq135 + level_mq135 + rng.gauss(0, NOISE_V)
+        if rng.random() < GLITCH_PROB:
+            mq2 += rng.uniform(0.05, 0.2)
+        yield (round(t, 3), round(min(max(mq2, 0.0), V_MAX), 2), round(min(max(mq135, 0.0), V_MAX), 2))
+        t += dt
+
+
+# ==================== MANY DEVICES ====================
+def scenario_for(device, scenario):
+    """'cycle' spreads devices over every scenario; anything else is used for all devices"""
+    return SCENARIOS[device % len(SCENARIOS)] if scenario == 'cycle' else scenario
+
+def traces(devices=1, scenario='mixed', rate=RATE_HZ, seed=0, duration=None):
+    """Merged generator of (t, device, mq2, mq135) across `devices` devices, in time order"""
+    def tagged(device):
+        for t, mq2, mq135 in device_stream(scenario_for(device, scenario), rate, seed * 100003 + device, duration):
+            yield t, device, mq2, mq135
+    return heapq.merge(*(tagged(device) for device in range(devices)))
+
+def parse_spec(spec):
+    """'synthetic:scenario=rapid_gas,rate=20,seed=3,duration=3600' -> device_stream kwargs"""
+    kwargs = {}
+    body = spec[len(SPEC_PREFIX):] if spec.startswith(SPEC_PREFIX) else spec
+    for item in filter(None, body.split(',')):
+        key, value = item.split('=', 1)
+        if key == 'scenario':
+            kwargs[key] = value
+        elif key in ('rate', 'duration'):
+            kwargs[key] = float(value)
+        elif key == 'seed':
+            kwargs[key] = int(value)
+        else:
+            raise ValueError(f"Unknown synthetic trace option '{key}' (scenario, rate, seed, duration)")
+    return kwargs
+
+
+# ==================== CSV OUTPUT ====================
+def write_csvs(out_dir, devices, scenario, rate, seed, duration):
+    """One timestamp,mq2,mq135 CSV per device, written as generated. Returns (files, rows)."""
+    os.makedirs(out_dir, exist_ok=True)
+    files, rows = [], 0
+    for device in range(devices):
+        name = scenario_for(device, scenario)
+        # Named like the recorded datasets so feature_engineering picks them up
+        path = os.path.join(out_dir, f'{name}_synthetic_dev{device:03d}_s{seed}.csv')
+        with open(path, 'w', newline='') as f:
+            f.write('timestamp,mq2,mq135\n')
+            for t, mq2, mq135 in device_stream(name, rate, seed * 100003 + device, duration):
+                f.write(f'{t:.3f},{mq2:.2f},{mq135:.2f}\n')
+                rows += 1
+        files.append(path)
+    return files, rows
+
+
+# ==================== MAIN EXECUTION ====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic MQ2/MQ135 traces for load tests and training data')
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--scenario', default='mixed', choices=SCENARIOS + ('cycle',),
+                        help="event kind per device ('cycle' = devices take turns over all scenarios)")
+    parser.add_argument('--rate', type=float, default=RATE_HZ, help='samples per second per device')
+    parser.add_argument('--seed', type=int, default=0)
+    length = parser.add_mutually_exclusive_group()
+    length.add_argument('--seconds', type=float)
+    length.add_argument('--hours', type=float)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--out-dir', help='write one CSV per device here')
+    output.add_argument('--stdout', action='store_true', help='stream t,device,mq2,mq135 lines (endless without a length)')
+    args = parser.parse_args(argv)
+    duration = args.seconds if args.seconds is not None else args.hours * 3600 if args.hours is not None else None
+
+    if args.stdout:
+        out = sys.stdout
+        try:
+            for t, device, mq2, mq135 in traces(args.devices, args.scenario, args.rate, args.seed, duration):
+                out.write(f'{t:.3f},{device},{mq2:.2f},{mq135:.2f}\n')
+        except BrokenPipeError:
+            sys.stderr.close()  # e.g. piped into head
+        return
+
+    if duration is None:
+        parser.error('--out-dir needs --seconds or --hours')
+    print("="*70)
+    print("SYNTHETIC SENSOR TRACES")
+    print("="*70)
+    print(f"\n {args.devices} device(s), scenario '{args.scenario}', {args.rate} Hz, {duration:.0f}s each, seed {args.seed}")
+    started = time.perf_counter()
+    files, rows = write_csvs(args.out_dir, args.devices, args.scenario, args.rate, args.seed, duration)
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Wrote {rows:,} rows to {len(files)} file(s) in {args.out_dir} ({elapsed:.1f}s, {rows / elapsed:,.0f} rows/s)")
+    print(f"\nNext step: python ml/feature_engineering.py --datasets {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,166 +16,334 @@ WHY RANDOM FOREST?
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import cross_val_score, StratifiedKFold
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score, recall_score
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
+import sklearn
 import joblib
 import os
+import shutil
+import tempfile
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
-print("="*70)
-print("ML MODEL TRAINING: Random Forest Classifier")
-print("="*70)
-
-# ========== LOAD FEATURE-ENGINEERED DATA ==========
-print("\n📂 Loading feature-engineered datasets...")
-ml_dir = 'ml_features'
-
-if not os.path.exists(f'{ml_dir}/train_features.csv'):
-    print(" ERROR: Run feature_engineering.py first!")
-    print(" Command: python ml/feature_engineering.py")
-    exit(1)
-
-train_df = pd.read_csv(f'{ml_dir}/train_features.csv')
-test_df = pd.read_csv(f'{ml_dir}/test_features.csv')
-
-X_train = train_df.drop(columns=['label'])
-y_train = train_df['label']
-X_test = test_df.drop(columns=['label'])
-y_test = test_df['label']
-
-print(f"✅ Training samples: {len(X_train)}")
-print(f"✅ Testing samples:  {len(X_test)}")
-print(f"✅ Features: {list(X_train.columns)}\n")
-
-# ========== LABEL DISTRIBUTION ==========
-print("Label Distribution (Train):")
-for label in sorted(y_train.unique()):
-    count = sum(y_train == label)
-    pct = 100 * count / len(y_train)
-    print(f"   {label:10s}: {count:4d} ({pct:5.1f}%)")
-
-print("\nLabel Distribution (Test):")
-for label in sorted(y_test.unique()):
-    count = sum(y_test == label)
-    pct = 100 * count / len(y_test)
-    print(f"   {label:10s}: {count:4d} ({pct:5.1f}%)")
-
-# ========== MODEL TRAINING ==========
-print("\n" + "="*70)
-print("🌲 TRAINING Random Forest Classifier...")
-print("="*70)
-
-rf_model = RandomForestClassifier(
-    n_estimators=150,          # 150 trees for robustness
-    max_depth=12,              # Depth limited to prevent overfitting
-    min_samples_split=15,      # At least 15 samples to split
-    min_samples_leaf=5,        # At least 5 samples in leaf
-    random_state=42,
-    n_jobs=-1,                 # Use all CPU cores
-    class_weight='balanced',   # Handle class imbalance
-    oob_score=True             # Out-of-bag validation
-)
-
-print("Training model...")
-rf_model.fit(X_train, y_train)
-print("✅ Model trained successfully!\n")
-
-# ========== TRAINING ACCURACY ==========
-train_score = rf_model.score(X_train, y_train)
-train_pred = rf_model.predict(X_train)
-test_score = rf_model.score(X_test, y_test)
-test_pred = rf_model.predict(X_test)
-print(f"📊 Training Accuracy:  {train_score:.4f} ({int(train_score*len(X_train))}/{len(X_train)} correct)")
-print(f"📊 Test Accuracy:     {test_score:.4f} ({int(test_score*len(X_test))}/{len(X_test)} correct)")
-print(f"📊 OOB Score:         {rf_model.oob_score_:.4f}")
-
-# ========== CROSS-VALIDATION ==========
-print("\n🔄 Cross-Validation (5-fold Stratified):")
-cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-cv_scores = cross_val_score(rf_model, X_train, y_train, cv=cv, scoring='accuracy')
-print(f"   Scores: {[f'{s:.4f}' for s in cv_scores]}")
-print(f"   Mean:   {cv_scores.mean():.4f} ± {cv_scores.std():.4f}")
-
-# ========== DETAILED EVALUATION ==========
-print("\n" + "="*70)
-print("📋 DETAILED CLASSIFICATION REPORT (Test Set)")
-print("="*70)
-print(classification_report(y_test, test_pred, digits=4))
-
-print("\nConfusion Matrix (Test Set):")
-cm = confusion_matrix(y_test, test_pred, labels=['SAFE', 'WARN', 'CRITICAL'])
-print(f"        Predicted")
-print(f"        SAFE  WARN  CRIT")
-labels = ['SAFE', 'WARN', 'CRIT']
-for i, label in enumerate(labels):
-    print(f"Actual {label}: {cm[i]}")
-
-# Per-class recall (important for safety)
-print("\nPer-Class Recall (True Positive Rate):")
-for i, label in enumerate(['SAFE', 'WARN', 'CRITICAL']):
-    if cm[i].sum() > 0:
-        recall = cm[i, i] / cm[i].sum()
-        print(f"   {label:10s}: {recall:.4f} (detected {cm[i,i]} out of {cm[i].sum()})")
-
-# ========== FEATURE IMPORTANCE ==========
-print("\n" + "="*70)
-print("🎯 FEATURE IMPORTANCE (What drives predictions?)")
-print("="*70)
-feature_importance = pd.DataFrame({
-    'feature': X_train.columns,
-    'importance': rf_model.feature_importances_
-}).sort_values('importance', ascending=False)
-
-total_importance = feature_importance['importance'].sum()
-feature_importance['percentage'] = 100 * feature_importance['importance'] / total_importance
-
-print("\nTop Features:")
-for idx, row in feature_importance.iterrows():
-    bar_width = int(row['percentage'] / 2)
-    bar = '█' * bar_width
-    print(f"   {row['feature']:20s}: {row['percentage']:5.1f}% {bar}")
-
-# ========== MODEL FREEZING & DEPLOYMENT ==========
-print("\n" + "="*70)
-print("💾 STEP 2: FREEZING MODEL (Deployment Ready)")
-print("="*70)
-
-model_path = 'ml_models/gas_smoke_rf.pkl'
-os.makedirs('ml_models', exist_ok=True)
-
-joblib.dump(rf_model, model_path)
-print(f"\n✅ Model saved: {model_path}")
-print(f"   Size: {os.path.getsize(model_path) / 1024:.1f} KB")
-
-# Save feature names for deployment (CRITICAL)
-feature_names = X_train.columns.tolist()
-joblib.dump(feature_names, 'ml_models/feature_names.pkl')
-print(f"✅ Feature names saved: ml_models/feature_names.pkl")
-
-# Create metadata file
-metadata = {
-    'model_type': 'RandomForestClassifier',
-    'n_estimators': rf_model.n_estimators,
-    'classes': sorted(y_train.unique()),
-    'features': feature_names,
-    'training_accuracy': float(train_score),
-    'test_accuracy': float(test_score),
-    'num_training_samples': len(X_train),
-    'num_test_samples': len(X_test),
-    'timestamp': pd.Timestamp.now().isoformat()
-}
-
-import json
-with open('ml_models/model_metadata.json', 'w') as f:
-    json.dump(metadata, f, indent=2)
-print(f"✅ Metadata saved: ml_models/model_metadata.json")
-
-# ========== DEPLOYMENT EXPLANATION ==========
-print("\n" + "="*70)
-print("🚀 DEPLOYMENT ARCHITECTURE")
-print("="*70)
-print("""
+from inference_core import parse_feature_name
+from feature_engineering import META_COLUMNS, WINDOW_SIZE, WINDOW_STRIDE
+
+# ========== CONFIGURATION ==========
+CV_FOLDS = 5
+CV_CACHE_DIR = 'ml_models/cv_cache'   # One JSON per (fold data, hyperparameters) hash
+CLASSES = ['SAFE', 'WARN', 'CRITICAL']
+
+# ========== MODEL DEFINITION ==========
+def build_model(n_jobs=-1, **overrides):
+    """Random Forest with the production hyperparameters (also used by the backend retrainer)"""
+    params = dict(
+        n_estimators=150,          # 150 trees for robustness
+        max_depth=12,              # Depth limited to prevent overfitting
+        min_samples_split=15,      # At least 15 samples to split
+        min_samples_leaf=5,        # At least 5 samples in leaf
+        random_state=42,
+        n_jobs=n_jobs,             # -1 = use all CPU cores
+        class_weight='balanced',   # Handle class imbalance
+        oob_score=True             # Out-of-bag validation
+    )
+    params.update(overrides)
+    return RandomForestClassifier(**params)
+
+
+# ========== TIME-BLOCKED CROSS-VALIDATION ==========
+def purge_span(feature_names):
+    """Samples a row's windows reach back: the longest feature window (or the label window)"""
+    windows = [w for _, _, w in map(parse_feature_name, feature_names) if w]
+    return max(windows + [WINDOW_SIZE])
+
+def blocked_folds(groups, positions, n_splits=CV_FOLDS, span=WINDOW_SIZE):
+    """
+    (train_idx, test_idx) per fold. groups = the recording each row comes from,
+    positions = the sample its window ends at. Fold k tests the k-th contiguous block
+    of every recording - never shuffled. Training drops every row of the same recording,
+    whatever its label, whose samples (the `span` samples up to its position) overlap
+    the samples of the test block.
+    """
+    groups, positions = np.asarray(groups), np.asarray(positions)
+    folds = [([], []) for _ in range(n_splits)]
+    for group in sorted(np.unique(groups)):
+        idx = np.flatnonzero(groups == group)
+        idx = idx[np.argsort(positions[idx], kind='stable')]
+        pos = positions[idx]
+        for k, block in enumerate(np.array_split(np.arange(len(idx)), n_splits)):
+            if len(block) == 0:
+                # Fewer rows than folds: nothing of this recording is tested here
+                folds[k][0].append(idx)
+                continue
+            first, last = pos[block[0]], pos[block[-1]]
+            keep = (pos <= first - span) | (pos >= last + span)
+            folds[k][0].append(idx[keep])
+            folds[k][1].append(idx[block])
+    return [(np.sort(np.concatenate(train)), np.sort(np.concatenate(test))) for train, test in folds]
+
+def cv_groups(train_df):
+    """(groups, positions) for blocked_folds, from the META_COLUMNS feature_engineering.py writes"""
+    if set(META_COLUMNS) <= set(train_df.columns):
+        return train_df['source'].astype(str).values, train_df['end_sample'].values
+    # Older feature stores: only each label's rows are known to be in order
+    print("   ⚠️  No source/end_sample columns - folds per label; re-run feature_engineering.py")
+    return train_df['label'].values, train_df.groupby('label').cumcount().values * WINDOW_STRIDE
+
+def fold_key(X, y, train_idx, test_idx, params):
+    """Hash of exactly what a fold sees: its rows, labels and the hyperparameters"""
+    h = hashlib.sha256()
+    for idx in (train_idx, test_idx):
+        h.update(np.ascontiguousarray(X[idx]).tobytes())
+        h.update('\x00'.join(y[idx]).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(sklearn.__version__.encode())
+    return h.hexdigest()[:24]
+
+def _fit_fold(x_path, y_path, train_idx, test_idx, params):
+    """Process-pool worker: fit one fold on the memory-mapped arrays"""
+    X = joblib.load(x_path, mmap_mode='r')
+    y = joblib.load(y_path, mmap_mode='r')
+    start = time.perf_counter()
+    model = RandomForestClassifier(**params).fit(X[train_idx], y[train_idx])
+    pred = model.predict(X[test_idx])
+    recalls = recall_score(y[test_idx], pred, labels=CLASSES, average=None, zero_division=0)
+    return {
+        'accuracy': float(accuracy_score(y[test_idx], pred)),
+        'recall': {label: float(r) for label, r in zip(CLASSES, recalls)},
+        'train_rows': len(train_idx),
+        'test_rows': len(test_idx),
+        'fit_s': round(time.perf_counter() - start, 2),
+    }
+
+def time_blocked_cv(X, y, groups, positions, params, n_splits=CV_FOLDS, span=WINDOW_SIZE, workers=None, cache_dir=CV_CACHE_DIR):
+    """
+    Run the folds in parallel (one single-threaded forest per process, arrays shared
+    through joblib memmaps) and reuse cached fold results. Returns (results, cached count).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.asarray(y).astype(str)
+    params = {k: v for k, v in params.items() if k not in ('n_jobs', 'verbose', 'oob_score')}
+    params['n_jobs'] = 1
+    folds = blocked_folds(groups, positions, n_splits, span)
+    keys = [fold_key(X, y, train, test, params) for train, test in folds]
+
+    results = [None] * len(folds)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        for i, key in enumerate(keys):
+            path = os.path.join(cache_dir, f'{key}.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[i] = json.load(f)
+    todo = [i for i, r in enumerate(results) if r is None]
+    cached = len(folds) - len(todo)
+
+    if todo:
+        tmp = tempfile.mkdtemp(prefix='cv_')
+        try:
+            x_path, y_path = os.path.join(tmp, 'X.mmap'), os.path.join(tmp, 'y.mmap')
+            joblib.dump(X, x_path)
+            joblib.dump(y, y_path)
+            workers = workers or min(len(todo), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {i: pool.submit(_fit_fold, x_path, y_path, folds[i][0], folds[i][1], params) for i in todo}
+                for i, future in futures.items():
+                    results[i] = future.result()
+                    if cache_dir:
+                        with open(os.path.join(cache_dir, f'{keys[i]}.json'), 'w') as f:
+                            json.dump(results[i], f)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results, cached
+
+def parse_overrides(values):
+    """['n_estimators=200', 'max_depth=None'] -> {'n_estimators': 200, 'max_depth': None}"""
+    overrides = {}
+    for value in values or []:
+        key, raw = value.split('=', 1)
+        try:
+            overrides[key] = json.loads(raw.replace('None', 'null'))
+        except json.JSONDecodeError:
+            overrides[key] = raw  # e.g. max_features=sqrt
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the Random Forest (and cross-validate it)')
+    parser.add_argument('--set', action='append', metavar='PARAM=VALUE',
+                        help='override a hyperparameter, e.g. --set n_estimators=200 (repeatable)')
+    parser.add_argument('--cv-only', action='store_true', help='only run cross-validation (tuning); nothing is saved')
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--workers', type=int, help='CV processes (default: one per fold, up to the CPU count)')
+    parser.add_argument('--no-cache', action='store_true', help=f'ignore {CV_CACHE_DIR}')
+    args = parser.parse_args(argv)
+    overrides = parse_overrides(args.set)
+
+    print("="*70)
+    print("ML MODEL TRAINING: Random Forest Classifier")
+    print("="*70)
+
+    # ========== LOAD FEATURE-ENGINEERED DATA ==========
+    print("\n📂 Loading feature-engineered datasets...")
+    ml_dir = 'ml_features'
+
+    if not os.path.exists(f'{ml_dir}/train_features.csv'):
+        print(" ERROR: Run feature_engineering.py first!")
+        print(" Command: python ml/feature_engineering.py")
+        exit(1)
+
+    train_df = pd.read_csv(f'{ml_dir}/train_features.csv')
+    test_df = pd.read_csv(f'{ml_dir}/test_features.csv')
+    with open(f'{ml_dir}/train_features.csv', 'rb') as f:
+        train_bytes = f.read()
+
+    X_train = train_df.drop(columns=['label', *META_COLUMNS], errors='ignore')
+    y_train = train_df['label']
+    X_test = test_df.drop(columns=['label', *META_COLUMNS], errors='ignore')
+    y_test = test_df['label']
+
+    print(f"✅ Training samples: {len(X_train)}")
+    print(f"✅ Testing samples:  {len(X_test)}")
+    print(f"✅ Features: {list(X_train.columns)}\n")
+
+    # ========== LABEL DISTRIBUTION ==========
+    print("Label Distribution (Train):")
+    for label in sorted(y_train.unique()):
+        count = sum(y_train == label)
+        pct = 100 * count / len(y_train)
+        print(f"   {label:10s}: {count:4d} ({pct:5.1f}%)")
+
+    print("\nLabel Distribution (Test):")
+    for label in sorted(y_test.unique()):
+        count = sum(y_test == label)
+        pct = 100 * count / len(y_test)
+        print(f"   {label:10s}: {count:4d} ({pct:5.1f}%)")
+
+    # ========== MODEL TRAINING ==========
+    print("\n" + "="*70)
+    print("🌲 TRAINING Random Forest Classifier...")
+    print("="*70)
+
+    rf_model = build_model(**overrides)
+    if overrides:
+        print(f"Hyperparameter overrides: {overrides}")
+
+    # ========== CROSS-VALIDATION ==========
+    span = purge_span(X_train.columns)
+    print(f"\n🔄 Cross-Validation ({args.folds}-fold time-blocked per recording, purge {span} samples):")
+    groups, positions = cv_groups(train_df)
+    started = time.perf_counter()
+    folds, cached = time_blocked_cv(X_train.values, y_train.values, groups, positions, rf_model.get_params(),
+                                    n_splits=args.folds, span=span, workers=args.workers, cache_dir=None if args.no_cache else CV_CACHE_DIR)
+    cv_scores = np.array([f['accuracy'] for f in folds])
+    print(f"   Scores: {[f'{s:.4f}' for s in cv_scores]}")
+    print(f"   Mean:   {cv_scores.mean():.4f} ± {cv_scores.std():.4f}")
+    for label in CLASSES:
+        print(f"   Recall {label:8s}: {np.mean([f['recall'][label] for f in folds]):.4f}")
+    print(f"   {len(folds) - cached} fold(s) fitted, {cached} from cache ({time.perf_counter() - started:.1f}s)")
+    if args.cv_only:
+        return
+
+    print("\nTraining model...")
+    rf_model.fit(X_train, y_train)
+    print("✅ Model trained successfully!\n")
+
+    # ========== TRAINING ACCURACY ==========
+    train_score = rf_model.score(X_train, y_train)
+    train_pred = rf_model.predict(X_train)
+    test_score = rf_model.score(X_test, y_test)
+    test_pred = rf_model.predict(X_test)
+    print(f"📊 Training Accuracy:  {train_score:.4f} ({int(train_score*len(X_train))}/{len(X_train)} correct)")
+    print(f"📊 Test Accuracy:     {test_score:.4f} ({int(test_score*len(X_test))}/{len(X_test)} correct)")
+    print(f"📊 OOB Score:         {rf_model.oob_score_:.4f}")
+
+    # ========== DETAILED EVALUATION ==========
+    print("\n" + "="*70)
+    print("📋 DETAILED CLASSIFICATION REPORT (Test Set)")
+    print("="*70)
+    print(classification_report(y_test, test_pred, digits=4))
+
+    print("\nConfusion Matrix (Test Set):")
+    cm = confusion_matrix(y_test, test_pred, labels=['SAFE', 'WARN', 'CRITICAL'])
+    print(f"        Predicted")
+    print(f"        SAFE  WARN  CRIT")
+    labels = ['SAFE', 'WARN', 'CRIT']
+    for i, label in enumerate(labels):
+        print(f"Actual {label}: {cm[i]}")
+
+    # Per-class recall (important for safety)
+    print("\nPer-Class Recall (True Positive Rate):")
+    for i, label in enumerate(['SAFE', 'WARN', 'CRITICAL']):
+        if cm[i].sum() > 0:
+            recall = cm[i, i] / cm[i].sum()
+            print(f"   {label:10s}: {recall:.4f} (detected {cm[i,i]} out of {cm[i].sum()})")
+
+    # ========== FEATURE IMPORTANCE ==========
+    print("\n" + "="*70)
+    print("🎯 FEATURE IMPORTANCE (What drives predictions?)")
+    print("="*70)
+    feature_importance = pd.DataFrame({
+        'feature': X_train.columns,
+        'importance': rf_model.feature_importances_
+    }).sort_values('importance', ascending=False)
+
+    total_importance = feature_importance['importance'].sum()
+    feature_importance['percentage'] = 100 * feature_importance['importance'] / total_importance
+
+    print("\nTop Features:")
+    for idx, row in feature_importance.iterrows():
+        bar_width = int(row['percentage'] / 2)
+        bar = '█' * bar_width
+        print(f"   {row['feature']:20s}: {row['percentage']:5.1f}% {bar}")
+
+    # ========== MODEL FREEZING & DEPLOYMENT ==========
+    print("\n" + "="*70)
+    print("💾 STEP 2: FREEZING MODEL (Deployment Ready)")
+    print("="*70)
+
+    model_path = 'ml_models/gas_smoke_rf.pkl'
+    os.makedirs('ml_models', exist_ok=True)
+
+    joblib.dump(rf_model, model_path)
+    print(f"\n✅ Model saved: {model_path}")
+    print(f"   Size: {os.path.getsize(model_path) / 1024:.1f} KB")
+
+    # Save feature names for deployment (CRITICAL)
+    feature_names = X_train.columns.tolist()
+    joblib.dump(feature_names, 'ml_models/feature_names.pkl')
+    print(f"✅ Feature names saved: ml_models/feature_names.pkl")
+
+    # Create metadata file
+    metadata = {
+        'model_type': 'RandomForestClassifier',
+        'n_estimators': rf_model.n_estimators,
+        'classes': sorted(y_train.unique()),
+        'features': feature_names,
+        'training_accuracy': float(train_score),
+        'test_accuracy': float(test_score),
+        'num_training_samples': len(X_train),
+        'num_test_samples': len(X_test),
+        'cv_accuracy': float(cv_scores.mean()),
+        # What this model saw, so the retrainer only evaluates it on newer rows
+        'train_features': {'rows': len(train_df), 'bytes': len(train_bytes),
+                           'sha256': hashlib.sha256(train_bytes).hexdigest()},
+        'timestamp': pd.Timestamp.now().isoformat()
+    }
+
+    with open('ml_models/model_metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"✅ Metadata saved: ml_models/model_metadata.json")
+
+    # ========== DEPLOYMENT EXPLANATION ==========
+    print("\n" + "="*70)
+    print("🚀 DEPLOYMENT ARCHITECTURE")
+    print("="*70)
+    print("""
 Model Location: gas_smoke_rf.pkl (deployed on PC, NOT on STM32)
 ├─ Weights are FROZEN (no retraining in production)
 ├─ Loads feature_names.pkl to ensure feature consistency
@@ -195,10 +363,14 @@ Why Random Forest?
 ✓ Handles non-linear patterns
 ✓ No GPU required (runs on PC CPU)
 ✓ Proven in IoT systems
-""")
+    """)
+
+    print("\n" + "="*70)
+    print("✅ TRAINING COMPLETE")
+    print("="*70)
+    print(f"\nNext step: python ml/deploy_inference.py")
+    print("This will start the real-time inference loop")
+
 
-print("\n" + "="*70)
-print("✅ TRAINING COMPLETE")
-print("="*70)
-print(f"\nNext step: python ml/deploy_inference.py")
-print("This will start the real-time inference loop")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Shared test setup: the backend (`app` package) and the ml/ scripts are importable, and
+the backend points at a throwaway SQLite file instead of backend/iot_v2.db.
+
+Run from the project root: python -m pytest -q
+"""
+import glob
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("IOT_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='iot_tests_'), 'test.db')}")
+for path in (os.path.join(ROOT, "backend"), os.path.join(ROOT, "ml")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def datasets():
+    """The recorded datasets (timestamp,mq2,mq135 CSVs)"""
+    return sorted(glob.glob(os.path.join(ROOT, "datasets", "*.csv")))
+
+
+@pytest.fixture
+def db():
+    """Session on the throwaway database, schema created; the rows tests write are wiped afterwards"""
+    from app import models
+    from app.core import database
+
+    database.ensure_schema(models.Base.metadata)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.query(models.Alert).delete()
+        session.query(models.SensorData).delete()
+        session.query(models.MLPrediction).delete()
+        session.commit()
+        session.close()
@@ -0,0 +1,115 @@
+"""AlertEngine: debounce, hysteresis, and flush() reconciling with alerts resolved/deleted through the API"""
+from app import crud, models
+from app.services.alert_engine import AlertEngine
+
+
+def sample(status, volts):
+    return {
+        "status": status,
+        "mq2_voltage": volts,
+        "mq135_voltage": 0.5,
+        "mq2_gas": 100.0,
+        "mq135_air": 50.0,
+        "risk_score": 80,
+        "ai_command": "AI_WARN",
+    }
+
+
+def feed(engine, status, volts, count):
+    for _ in range(count):
+        engine.evaluate(sample(status, volts))
+
+
+def make_engine():
+    return AlertEngine(debounce_samples=3, clear_samples=5, hysteresis_v=0.1)
+
+
+def alerts(db):
+    db.expire_all()
+    return db.query(models.Alert).order_by(models.Alert.id).all()
+
+
+def test_raise_is_debounced():
+    engine = make_engine()
+    feed(engine, "Warning", 1.6, 2)
+    assert engine.level == 0
+
+    engine.evaluate(sample("Safe", 1.0))  # Interrupted: the count starts over
+    feed(engine, "Warning", 1.6, 2)
+    assert engine.level == 0
+
+    engine.evaluate(sample("Warning", 1.6))
+    assert engine.level == 1
+    assert engine.get_state()["pending_writes"] == 1
+
+
+def test_clear_needs_hysteresis_margin_and_clear_samples():
+    engine = make_engine()
+    feed(engine, "Warning", 1.6, 3)
+
+    # Reported Safe but still within 0.1 V of the Warning threshold: stays Warning
+    feed(engine, "Safe", 1.45, 20)
+    assert engine.level == 1
+
+    feed(engine, "Safe", 1.0, 4)
+    assert engine.level == 1
+    engine.evaluate(sample("Safe", 1.0))
+    assert engine.level == 0
+    assert engine.incident is None
+
+
+def test_flush_writes_one_row_per_incident(db):
+    engine = make_engine()
+    assert engine.flush(db) == 0
+
+    feed(engine, "Warning", 1.6, 3)
+    feed(engine, "Danger", 2.2, 3)
+    assert engine.flush(db) == 1  # Open + escalate queued together: one insert
+
+    rows = alerts(db)
+    assert len(rows) == 1
+    assert rows[0].severity == "high"
+    assert not rows[0].is_resolved
+    assert "Danger Detected!" in rows[0].message
+
+    feed(engine, "Safe", 1.0, 5)
+    assert engine.flush(db) == 1
+
+    rows = alerts(db)
+    assert len(rows) == 1
+    assert rows[0].is_resolved
+    assert engine.get_state()["pending_writes"] == 0
+
+
+def test_api_resolve_is_not_reopened(db):
+    engine = make_engine()
+    feed(engine, "Warning", 1.6, 3)
+    engine.flush(db)
+    alert_id = engine.incident.alert_id
+
+    assert crud.resolve_alerts(db, ids=[alert_id]) == 1
+
+    # No transition in between: the open incident is re-checked on flush and forgotten
+    engine.flush(db)
+    assert engine.incident is None
+
+    # An escalation afterwards opens a new incident; the resolved row stays resolved
+    feed(engine, "Danger", 2.2, 3)
+    engine.flush(db)
+    rows = alerts(db)
+    assert [row.is_resolved for row in rows] == [True, False]
+    assert engine.incident.alert_id == rows[1].id
+
+
+def test_api_delete_during_pending_update(db):
+    engine = make_engine()
+    feed(engine, "Warning", 1.6, 3)
+    engine.flush(db)
+
+    feed(engine, "Danger", 2.2, 3)  # Queued update to a row that is about to disappear
+    crud.delete_alerts(db)
+    assert engine.flush(db) == 0
+
+    assert alerts(db) == []
+    assert engine.incident is None
+    assert engine.get_state()["pending_writes"] == 0
@@ -0,0 +1,83 @@
+"""train_model.blocked_folds: contiguous test blocks per recording, training purged around each block"""
+import numpy as np
+
+from feature_engineering import WINDOW_SIZE, WINDOW_STRIDE
+from train_model import blocked_folds, purge_span
+
+
+def recordings(*lengths):
+    """groups/positions for recordings of `lengths` rows, one row every WINDOW_STRIDE samples"""
+    groups, positions = [], []
+    for n, length in enumerate(lengths):
+        groups += [f"rec{n}.csv"] * length
+        positions += [WINDOW_SIZE + i * WINDOW_STRIDE for i in range(length)]
+    return np.array(groups), np.array(positions)
+
+
+def test_test_blocks_partition_every_recording():
+    groups, positions = recordings(40, 23)
+    folds = blocked_folds(groups, positions, n_splits=5, span=WINDOW_SIZE)
+    assert len(folds) == 5
+
+    tested = np.concatenate([test for _, test in folds])
+    assert sorted(tested.tolist()) == list(range(len(groups)))
+
+    for _, test in folds:
+        for group in np.unique(groups):
+            pos = np.sort(positions[test][groups[test] == group])
+            # One contiguous block per recording
+            assert np.all(np.diff(pos) == WINDOW_STRIDE)
+
+
+def test_training_never_overlaps_the_test_block():
+    groups, positions = recordings(40, 23)
+    span = 90
+    for train, test in blocked_folds(groups, positions, n_splits=5, span=span):
+        assert not set(train) & set(test)
+        for group in np.unique(groups):
+            test_pos = positions[test][groups[test] == group]
+            train_pos = positions[train][groups[train] == group]
+            first, last = test_pos.min(), test_pos.max()
+            # A training row covers samples (pos - span, pos]: none may reach into [first - span, last]
+            assert np.all((train_pos <= first - span) | (train_pos >= last + span))
+
+
+def test_purge_boundaries_are_exact():
+    # Positions every 10 samples; the test block of fold 1 is rows 10..19 (positions 100..190)
+    groups = np.array(["a"] * 40)
+    positions = np.arange(40) * 10
+    train, test = blocked_folds(groups, positions, n_splits=4, span=30)[1]
+    assert positions[test].tolist() == list(range(100, 200, 10))
+
+    train_pos = set(positions[train].tolist())
+    assert 70 in train_pos      # first - span: its window ends before the block's first window starts
+    assert 80 not in train_pos
+    assert 210 not in train_pos
+    assert 220 in train_pos     # last + span: its window starts after the block's last sample
+    assert len(train) == 40 - 10 - 2 - 2
+
+
+def test_other_recordings_stay_in_training():
+    # rec1 has only 2 rows, so folds 2 and 3 test rec0 alone
+    groups, positions = recordings(20, 2)
+    folds = blocked_folds(groups, positions, n_splits=4, span=10**9)
+    for train, test in folds[2:]:
+        assert set(groups[test]) == {"rec0.csv"}
+        # An enormous span purges the whole recording under test, never the other one
+        assert sorted(train.tolist()) == np.flatnonzero(groups == "rec1.csv").tolist()
+
+
+def test_rows_out_of_order_are_sorted_per_recording():
+    groups, positions = recordings(30)
+    order = np.random.default_rng(0).permutation(len(groups))
+    shuffled = blocked_folds(groups[order], positions[order], n_splits=3)
+    expected = blocked_folds(groups, positions, n_splits=3)
+    for (train_s, test_s), (train_e, test_e) in zip(shuffled, expected):
+        assert sorted(positions[order][test_s].tolist()) == positions[test_e].tolist()
+        assert sorted(positions[order][train_s].tolist()) == positions[train_e].tolist()
+
+
+def test_purge_span_is_the_longest_window():
+    assert purge_span(["mq2_now", "mq2_mean_window"]) == WINDOW_SIZE
+    assert purge_span(["mq2_now", "mq2_slope_600", "mq135_std_10"]) == 600
+    assert purge_span(["mq2_now"]) == WINDOW_SIZE
@@ -0,0 +1,29 @@
+"""Served features must match the rows feature_engineering.py trains on (inference_core.check_parity)"""
+import feature_engineering
+import inference_core
+
+
+def test_deployed_model_features_match_training(datasets):
+    assert datasets
+    assert inference_core.check_parity(datasets) == 0
+
+
+def test_every_training_feature_matches(datasets):
+    assert inference_core.check_parity(datasets[:2], feature_engineering.TRAIN_FEATURES) == 0
+
+
+def test_drift_in_training_rows_is_detected(datasets, monkeypatch):
+    window_row = feature_engineering.window_row
+
+    def drifted(engine):
+        row = window_row(engine)
+        row["mq2_mean_window"] += 1e-3
+        return row
+
+    monkeypatch.setattr(feature_engineering, "window_row", drifted)
+    assert inference_core.check_parity(datasets[:1], ["mq2_now", "mq2_mean_window"]) > 0
+
+
+def test_feature_missing_from_training_is_detected(datasets):
+    names = feature_engineering.TRAIN_FEATURES + ["mq2_std_30"]  # No 30-sample window in training
+    assert inference_core.check_parity(datasets[:1], names) > 0
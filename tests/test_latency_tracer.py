@@ -0,0 +1,44 @@
+"""Latency tracing: every line of a drain keeps its own read time, and "parsed" is when that sample was parsed"""
+import time
+
+from app.services.latency_tracer import LatencyTracer
+from app.services.serial_reader import SensorManager
+
+
+class SlowSerial:
+    """Fake serial port delivering `lines`, `delay_s` apart"""
+    def __init__(self, lines, delay_s):
+        self.lines = [line.encode() + b"\n" for line in lines]
+        self.delay_s = delay_s
+
+    @property
+    def in_waiting(self):
+        return sum(map(len, self.lines))
+
+    def readline(self):
+        time.sleep(self.delay_s)
+        return self.lines.pop(0)
+
+
+def test_drain_keeps_per_line_read_times():
+    manager = SensorManager()
+    manager.serial_conn = SlowSerial(["MQ2:1.10V", "MQ2:1.20V", "MQ2:1.30V"], delay_s=0.02)
+
+    start = time.monotonic()
+    lines = manager._read_lines_blocking()
+
+    assert [line for line, _ in lines] == ["MQ2:1.10V", "MQ2:1.20V", "MQ2:1.30V"]
+    times = [t for _, t in lines]
+    assert start < times[0] < times[1] < times[2]
+    assert times[1] - times[0] >= 0.015
+    assert manager.last_read_at == times[-1]
+
+
+def test_mark_at_explicit_time():
+    tracer = LatencyTracer()
+    trace = tracer.begin(1, t_read=100.0)
+    tracer.mark(trace, "parsed", at=100.004)
+    tracer.mark(trace, "parsed", at=100.5)  # Already marked: ignored
+
+    assert trace.offsets_ms() == {"read": 0.0, "parsed": 4.0}
+    assert tracer.get_stats()["stages"]["parsed"]["count"] == 1
@@ -0,0 +1,81 @@
+"""
+Loop-blocking detector: with commits made artificially slow (a slow fsync), the background
+DB writes must not stall the event loop. LoopMonitor is the same detector /api/debug/loop reports.
+"""
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import crud, models
+from app.core import database
+from app.core.loop_monitor import LoopMonitor
+from app.services.ingestion import archive_snapshot
+
+SLOW_COMMIT_S = 0.25
+
+SAMPLE = {"mq2_gas": 120.0, "mq2_voltage": 1.6, "mq135_air": 80.0, "mq135_voltage": 1.1,
+          "risk_score": 60.0, "status": "Warning"}
+PREDICTIONS = [{"timestamp": datetime.now(), "mq2_value": 1.6, "mq135_value": 1.1, "prediction": "WARN",
+                "confidence": 0.8, "ai_command": "AI_WARN"}] * 50
+
+
+@pytest.fixture
+def slow_commits():
+    def slow(conn):
+        time.sleep(SLOW_COMMIT_S)
+
+    engines = (database.engine, database.worker_engine)
+    for engine in engines:
+        event.listen(engine, "commit", slow)
+    yield
+    for engine in engines:
+        event.remove(engine, "commit", slow)
+
+
+def watch(work):
+    """Run coroutine function `work` next to a LoopMonitor; returns the monitor"""
+    monitor = LoopMonitor(interval_s=0.01, threshold_ms=100.0)
+
+    async def main():
+        heartbeat = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+        try:
+            await work()
+            await asyncio.sleep(0.05)  # Let the heartbeat see the loop again
+        finally:
+            monitor.stop()
+            await heartbeat
+
+    asyncio.run(main())
+    return monitor
+
+
+def test_detector_catches_a_blocking_write(db, slow_commits):
+    async def on_the_loop():
+        archive_snapshot(db, SAMPLE)
+
+    monitor = watch(on_the_loop)
+    assert monitor.total_stalls >= 1
+    stack = "\n".join(monitor.stalls[0]["stack"])
+    assert "slow" in stack or "commit" in stack
+
+
+def test_archiving_does_not_block_the_loop(db, slow_commits):
+    async def archive():
+        for _ in range(3):
+            await database.run_db(archive_snapshot, SAMPLE)
+
+    monitor = watch(archive)
+    assert monitor.total_stalls == 0, monitor.get_stats()["recent_stalls"]
+    assert db.query(models.SensorData).count() == 3
+
+
+def test_prediction_writes_do_not_block_the_loop(db, slow_commits):
+    async def write():
+        await database.run_db(crud.create_ml_predictions, PREDICTIONS)
+
+    monitor = watch(write)
+    assert monitor.total_stalls == 0, monitor.get_stats()["recent_stalls"]
@@ -0,0 +1,113 @@
+"""SampleRing: readers running while the single writer wraps around never see torn or stale records"""
+import threading
+
+import numpy as np
+
+from app.services.sample_ring import SampleRing
+
+CAPACITY = 64
+
+
+def write(ring, seq, t_wall=None):
+    # Every field derives from seq, so a half-written or overwritten slot is detectable
+    ring.append({"seq": seq, "mq2_voltage": seq % 1000 / 100.0, "mq2_gas": float(seq), "status": "Safe"},
+                t_wall=float(seq) if t_wall is None else t_wall, t_mono=float(seq))
+
+
+def check(records):
+    seq = records["seq"].astype(np.int64)
+    assert np.all(np.diff(seq) == 1), "records must be consecutive, oldest first"
+    assert np.array_equal(records["mq2_ppm"], seq.astype(np.float32))
+    assert np.array_equal(records["t_wall"], seq.astype(np.float64))
+
+
+def test_read_last_before_and_after_wraparound():
+    ring = SampleRing.local(CAPACITY)
+    assert len(ring.read_last()) == 0
+
+    for seq in range(10):
+        write(ring, seq)
+    assert ring.read_last()["seq"].tolist() == list(range(10))
+    assert ring.read_last(3)["seq"].tolist() == [7, 8, 9]
+
+    for seq in range(10, 200):
+        write(ring, seq)
+    records = ring.read_last()
+    # The oldest slot is the one the writer fills next, so readers never return it
+    assert len(records) == CAPACITY - 1
+    assert records["seq"][-1] == 199
+    check(records)
+
+
+def test_read_window_by_wall_clock():
+    ring = SampleRing.local(CAPACITY)
+    for seq in range(150):  # Wraps: the window straddles the end of the record array
+        write(ring, seq)
+
+    window = ring.read_window(10, now=149.0)
+    assert window["seq"].tolist() == list(range(139, 150))
+    assert len(ring.read_window(1000, now=149.0)) == CAPACITY - 1
+    assert len(ring.read_window(5, now=1000.0)) == 0
+
+
+def test_read_window_matches_a_full_scan():
+    # Every fill level and wrap position, every cutoff: the binary search agrees with masking everything
+    for written in (0, 1, 10, CAPACITY - 1, CAPACITY, CAPACITY + 1, 100, 3 * CAPACITY - 5):
+        ring = SampleRing.local(CAPACITY)
+        for seq in range(written):
+            write(ring, seq, t_wall=seq * 0.5)
+        everything = ring.read_last()
+        now = written * 0.5
+        for seconds in np.arange(-1.0, written * 0.5 + 2, 0.25):
+            window = ring.read_window(seconds, now=now)
+            expected = everything[everything["t_wall"] >= now - seconds]
+            assert window["seq"].tolist() == expected["seq"].tolist(), (written, seconds)
+
+
+def test_concurrent_readers_see_consistent_records():
+    ring = SampleRing.local(CAPACITY)
+    total = 50_000
+    done = threading.Event()
+    errors = []
+    reads = [0]
+
+    def writer():
+        for seq in range(total):
+            write(ring, seq)
+        done.set()
+
+    def reader(read):
+        try:
+            while not done.is_set():
+                records = read()
+                if len(records):
+                    check(records)
+                    reads[0] += 1
+        except AssertionError as e:
+            errors.append(e)
+
+    readers = [
+        threading.Thread(target=reader, args=(ring.read_last,)),
+        threading.Thread(target=reader, args=(lambda: ring.read_last(16),)),
+        threading.Thread(target=reader, args=(lambda: ring.read_window(30, now=float(ring.head)),)),
+    ]
+    for thread in readers:
+        thread.start()
+    writer()
+    for thread in readers:
+        thread.join()
+
+    assert not errors, errors[0]
+    assert reads[0] > 0
+    check(ring.read_last())
+
+
+def test_attach_shares_records():
+    view = bytearray(SampleRing.nbytes(CAPACITY))
+    ring = SampleRing(view, capacity=CAPACITY, initialize=True)
+    write(ring, 1)
+    write(ring, 2)
+
+    reader = SampleRing(view)  # Same buffer, as a reader process maps it
+    assert reader.capacity == CAPACITY
+    assert reader.read_last()["seq"].tolist() == [1, 2]
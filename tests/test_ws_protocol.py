@@ -0,0 +1,131 @@
+"""DeltaSession: a client applying the frames (json or binary) always ends up with the sent sample"""
+import json
+import math
+
+from app.services import ws_protocol
+from app.services.ws_protocol import DeltaSession
+
+
+def snapshot(seq, mq2=0.8, status="Safe", probs=None):
+    return {
+        "seq": seq,
+        "mq2_gas": mq2 * 100,
+        "mq2_voltage": mq2,
+        "mq135_air": 40.0,
+        "mq135_voltage": 0.4,
+        "risk_score": 10.0,
+        "ml_confidence": None,
+        "time_to_warn": None,
+        "time_to_crit": None,
+        "ml_probs": probs,
+        "status": status,
+        "ai_command": "AI_SAFE",
+        "ml_trend": "stable",
+        "sensor_connected": True,
+        "raw_log": "MQ2:0.80V ...",
+    }
+
+
+def decode_binary(frame):
+    """Client side of the binary encoding: (header fields, {name: values})"""
+    version, flags, mask, frame_no, seq = ws_protocol.HEADER.unpack_from(frame)
+    offset = ws_protocol.HEADER.size
+    fields = {}
+    for bit, (name, packer) in enumerate(ws_protocol._BINARY_STRUCTS):
+        if mask & (1 << bit):
+            fields[name] = packer.unpack_from(frame, offset)
+            offset += packer.size
+    assert offset == len(frame)
+    return {"v": version, "k": flags & 1, "f": frame_no, "seq": seq}, fields
+
+
+def expected_binary(data):
+    return {name: ws_protocol._binary_value(name, data.get(name)) for name, _ in ws_protocol.BINARY_FIELDS}
+
+
+def same(a, b):
+    """Tuples equal, treating NaN == NaN and comparing at float32 precision"""
+    return all(
+        (math.isnan(x) and math.isnan(y)) if isinstance(x, float) and math.isnan(x) else abs(x - y) <= 1e-5 * max(1.0, abs(x))
+        for x, y in zip(a, b)
+    )
+
+
+def test_json_frames_rebuild_the_sample():
+    session = DeltaSession(encoding="json", keyframe_interval=5)
+    client = {}
+    samples = [snapshot(1), snapshot(2), snapshot(3, mq2=1.7, status="Warning"), snapshot(4, mq2=1.7, status="Warning")]
+
+    frames = [session.encode(data, now=i * 0.1) for i, data in enumerate(samples)]
+    assert frames[1] is None  # Nothing changed
+    assert frames[3] is None
+
+    first = json.loads(frames[0])
+    assert first["k"] == 1 and first["f"] == 1 and first["seq"] == 1
+    assert "raw_log" not in first["d"]
+
+    delta = json.loads(frames[2])
+    assert delta["k"] == 0 and delta["f"] == 2 and delta["seq"] == 3
+    assert set(delta["d"]) == {"mq2_gas", "mq2_voltage", "status"}
+
+    for frame in frames:
+        if frame is not None:
+            client.update(json.loads(frame)["d"])
+    expected = {k: v for k, v in samples[-1].items() if k not in ("seq", "raw_log")}
+    assert client == expected
+
+
+def test_json_keyframe_interval_resends_everything():
+    session = DeltaSession(encoding="json", keyframe_interval=2, include_raw=True)
+    session.encode(snapshot(1), now=0.0)
+    assert session.encode(snapshot(2), now=1.0) is None
+    keyframe = json.loads(session.encode(snapshot(3), now=2.0))
+    assert keyframe["k"] == 1
+    assert keyframe["d"]["raw_log"] == "MQ2:0.80V ..."
+    assert len(keyframe["d"]) == len(snapshot(3)) - 1  # Everything but seq
+
+
+def test_binary_frames_rebuild_the_sample():
+    session = DeltaSession(encoding="binary", keyframe_interval=5)
+    samples = [
+        snapshot(1),
+        snapshot(2),  # Unchanged, NaNs included
+        snapshot(3, probs={"safe": 0.2, "warn": 0.7, "crit": 0.1}),
+        snapshot(4, mq2=2.3, status="Danger", probs={"safe": 0.0, "warn": 0.1, "crit": 0.9}),
+    ]
+    client = {}
+    for i, data in enumerate(samples):
+        frame = session.encode(data, now=i * 0.1)
+        if i == 1:
+            assert frame is None
+            continue
+        header, fields = decode_binary(frame)
+        assert header["v"] == ws_protocol.PROTOCOL_VERSION
+        assert header["seq"] == data["seq"]
+        assert header["k"] == (1 if i == 0 else 0)
+        if i == 0:
+            assert set(fields) == {name for name, _ in ws_protocol.BINARY_FIELDS}
+        if i == 2:
+            assert set(fields) == {"ml_probs"}
+        client.update(fields)
+        expected = expected_binary(data)
+        assert client.keys() == expected.keys()
+        for name in expected:
+            assert same(client[name], expected[name]), name
+
+
+def test_binary_enums_and_unknown_values():
+    session = DeltaSession(encoding="binary")
+    _, fields = decode_binary(session.encode(dict(snapshot(1), status="Bogus", ml_trend="increasing"), now=0.0))
+    assert fields["status"] == (255,)
+    assert fields["ml_trend"] == (ws_protocol.ENUMS["ml_trend"].index("increasing"),)
+    assert fields["sensor_connected"] == (1,)
+
+
+def test_session_from_query():
+    assert ws_protocol.session_from_query({}) is None
+    session = ws_protocol.session_from_query({"v": "2", "enc": "binary", "rate": "500", "raw": "1"})
+    assert session.encoding == "binary"
+    assert session.rate == 50.0
+    assert not session.include_raw  # raw_log is json only
+    assert ws_protocol.session_from_query({"v": "2", "rate": "fast"}).encoding == "json"